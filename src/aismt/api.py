@@ -4,6 +4,10 @@ import logging
 
 import coloredlogs
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from utils.complete import acreate_stream, metrics
+from utils.llm_scheduler import Priority, llm_priority
 
 app = FastAPI()
 
@@ -22,3 +26,28 @@ def startup_event() -> None:
 def read_root() -> str:
     """Read root."""
     return "Hello world"
+
+
+@app.get("/complete/stream")
+def complete_stream(
+    prompt: str, model: str = "3i", max_tokens: int = 250
+) -> StreamingResponse:
+    """Stream a completion to the client as it is generated."""
+
+    async def chunks():
+        # A client is reading along, so the call goes ahead of bulk work
+        with llm_priority(Priority.INTERACTIVE):
+            async for chunk in acreate_stream(
+                prompt=prompt, model=model, max_tokens=max_tokens
+            ):
+                yield chunk
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics() -> PlainTextResponse:
+    """Expose LLM call metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
@@ -3,7 +3,7 @@ import inspect
 import sys
 from typing import NamedTuple
 
-from utils.complete import create
+from utils.complete import create, dump_metrics_at_exit
 
 """
 Feature: Interactive CLI Robot
@@ -19,6 +19,9 @@ import typer
 
 app = typer.Typer()
 
+# Write a JSON summary of LLM usage when the CLI exits
+dump_metrics_at_exit()
+
 
 @app.command()
 def test() -> None:
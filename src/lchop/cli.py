@@ -22,6 +22,24 @@ def validate(workflow):
     print("Executing validate with options:", workflow)
 
 
+@cli.command()
+@option("--workflow", required=True, help="Workflow file")
+@option(
+    "--dry-run",
+    "--estimate",
+    "dry_run",
+    is_flag=True,
+    help="Estimate requests, tokens, cost and time without calling the API; only side-effect-free tasks run",
+)
+def run(workflow, dry_run):
+    """Run a workflow file"""
+    import anyio
+
+    from lchop.context.work_context import load_workflow
+
+    anyio.run(load_workflow, workflow, None, dry_run)
+
+
 @cli.command()
 @option("--agent", default="None", help="Agent name")
 @option("--task", default="None", help="Task name")
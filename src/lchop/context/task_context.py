@@ -2,10 +2,19 @@ from loguru import logger
 from munch import Munch
 
 
-def register_task(func):
-    TaskContext.tasks[func.__name__] = func
-    # logger.info(f"Task {func.__name__} registered.")
-    return func  # return the function so it can still be used normally
+def register_task(func=None, *, side_effect_free=False):
+    """
+    Register a workflow task. Mark it ``side_effect_free`` if it only calls the
+    LLM and returns results, so a dry run may execute it.
+    """
+
+    def register(func):
+        func.side_effect_free = side_effect_free
+        TaskContext.tasks[func.__name__] = func
+        # logger.info(f"Task {func.__name__} registered.")
+        return func  # return the function so it can still be used normally
+
+    return register if func is None else register(func)
 
 
 class TaskContext:
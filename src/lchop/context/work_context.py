@@ -7,6 +7,9 @@ from lchop.context.browser_context import BrowserContext
 from lchop.context.state_context import StateContext
 from lchop.context.task_context import TaskContext
 from lchop.context.template_context import TemplateContext
+from utils.complete import caller_scope
+from utils.estimate_tools import estimating
+from utils.llm_scheduler import Priority, llm_priority
 
 
 class WorkContext:
@@ -66,12 +69,14 @@ async def inject_tasks(workflow_config, work_ctx):
             raise Exception(f"Failed to load or inject new workflow. Aborting.") from e
 
 
-async def exe_task(task_config, work_ctx):
-    func_name = None
+def task_func_name(task_config):
     if hasattr(task_config, "func"):
-        func_name = task_config.func
-    else:
-        func_name = task_config.name
+        return task_config.func
+    return task_config.name
+
+
+async def exe_task(task_config, work_ctx):
+    func_name = task_func_name(task_config)
     func_desc = task_config.get("description", "No Description")
 
     logger.info(f"Executing {func_name}: {func_desc}")
@@ -83,7 +88,8 @@ async def exe_task(task_config, work_ctx):
     kwargs.work_ctx = work_ctx
     kwargs.update(work_ctx.__dict__)
     kwargs.update(global_kwargs)
-    result = await implementation(**kwargs)
+    with caller_scope(f"task:{func_name}"):
+        result = await implementation(**kwargs)
 
     logger.info(f"Task {func_name} completed with result: {result}")
 
@@ -99,7 +105,9 @@ async def exe_workflow(workflow_config, work_ctx):
     await inject_tasks(workflow_config, work_ctx)
 
     for task_config in workflow_config.tasks:
-        task_result = await exe_task(task_config, work_ctx)
+        # Workflows run in the background, behind interactive LLM calls
+        with llm_priority(Priority.BULK):
+            task_result = await exe_task(task_config, work_ctx)
 
         if not task_result["success"]:
             logger.error(
@@ -112,19 +120,52 @@ async def exe_workflow(workflow_config, work_ctx):
     return True
 
 
-async def load_workflow(filepath=None, yaml_string=None):
+async def estimate_workflow(workflow_config, work_ctx):
+    """
+    Run the workflow's ``side_effect_free`` tasks with every LLM call answered by
+    the estimator instead of the API, then print and return the requests, tokens,
+    cost and time per task. Any other task could write files or reach outside
+    services, so it is skipped and listed in the report.
+    """
+    with estimating() as report:
+        try:
+            await inject_tasks(workflow_config, work_ctx)
+
+            for task_config in workflow_config.tasks:
+                func_name = task_func_name(task_config)
+                implementation = work_ctx.task_ctx.tasks.get(func_name)
+                if not getattr(implementation, "side_effect_free", False):
+                    logger.info(f"Dry run skipped {func_name}: not marked side_effect_free.")
+                    report.skipped.append(func_name)
+                    continue
+
+                with llm_priority(Priority.BULK):
+                    task_result = await exe_task(task_config, work_ctx)
+                if not task_result["success"]:
+                    report.errors.append(f"Task {func_name} failed.")
+                    break
+        except Exception as e:
+            logger.warning(f"Dry run stopped early: {e}")
+            report.errors.append(f"{type(e).__name__}: {e}")
+
+    print(report.render())
+    return report
+
+
+async def load_workflow(filepath=None, yaml_string=None, dry_run=False):
     work_ctx = WorkContext()
+    run = estimate_workflow if dry_run else exe_workflow
     if not filepath and not yaml_string:
         raise ValueError("Either filepath or yaml_string must be specified.")
     if yaml_string:
         workflow_config = Munch.fromDict(yaml.safe_load(yaml_string))
         work_ctx.global_kwargs.update(workflow_config.get("global_kwargs", {}))
-        return await exe_workflow(workflow_config, work_ctx)
+        return await run(workflow_config, work_ctx)
     with open(filepath, "r") as stream:
         try:
             workflow_config = Munch.fromDict(yaml.safe_load(stream))
             work_ctx.global_kwargs.update(workflow_config.get("global_kwargs", {}))
-            return await exe_workflow(workflow_config, work_ctx)
+            return await run(workflow_config, work_ctx)
         except yaml.YAMLError as e:
             logger.error(f"Error loading YAML file: {e}")
 
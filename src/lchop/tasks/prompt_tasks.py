@@ -11,7 +11,7 @@ class NewTypedPrompt(TypedPrompt):
     source = "Hello, {{ message }}"
 
 
-@register_task
+@register_task(side_effect_free=True)
 async def type_prompt(work_ctx, message="Hello, World!", **kwargs):
     temp = NewTypedPrompt(message=message)
     return {"success": True, "results": f"Successfully templated: {temp()}"}
@@ -7,8 +7,9 @@ from pathlib import Path
 
 from typer import Context
 
-from utils.complete import create
+from utils.complete import create, dump_metrics_at_exit
 from utils.date_tools import next_friday
+from utils.llm_scheduler import Priority, llm_priority
 from shipit.shipit_project_config import (
     ShipitProjectConfig,
 )  # Adjust the import path as necessary
@@ -18,6 +19,9 @@ from sqlmodel import SQLModel
 
 app = typer.Typer()
 
+# Write a JSON summary of LLM usage when the CLI exits
+dump_metrics_at_exit()
+
 
 def load_subcommands():
     script_dir = Path(__file__).parent
@@ -40,6 +44,10 @@ os.environ["TOKENIZERS_PARALLELISM"] = "(true | false)"
 def main(ctx: Context):
     from shipit.data import engine, get_session
 
+    # Someone is waiting on these commands, so their calls go ahead of bulk work.
+    # The priority is scoped to the command and reset when its context closes.
+    ctx.with_resource(llm_priority(Priority.INTERACTIVE))
+
     config_file = Path().cwd() / "shipit_project.yaml"
     SQLModel.metadata.create_all(engine)
     ctx.obj = {
@@ -3,7 +3,7 @@ import asyncio
 import typer
 
 from shipit.models import OptionConfig
-from utils.complete import acreate
+from utils.complete import acreate_stream
 from utils.output_tools import handle_output
 
 app = typer.Typer()
@@ -64,14 +64,9 @@ async def _wave_command(config: OptionConfig, **kwargs):
     if config.verbose:
         typer.echo(f"Running wave command... {config}")
 
-    response = await acreate(prompt=config.prompt, max_tokens=config.max_tokens)
+    stream = acreate_stream(prompt=config.prompt, max_tokens=config.max_tokens)
 
-    if config.verbose:
-        typer.echo(f"Response: {response}")
-
-    config.response = response
-
-    await handle_output(config)
+    await handle_output(config, stream=stream)
 
     if config.verbose:
         typer.echo(f"wave command finished.")
@@ -3,7 +3,7 @@ import asyncio
 import typer
 
 from shipit.models import OptionConfig
-from utils.complete import acreate
+from utils.complete import acreate_stream
 from utils.output_tools import handle_output
 
 app = typer.Typer()
@@ -64,14 +64,9 @@ async def _hello_world_command(config: OptionConfig, **kwargs):
     if config.verbose:
         typer.echo(f"Running hello_world command... {config}")
 
-    response = await acreate(prompt=config.prompt, max_tokens=config.max_tokens)
+    stream = acreate_stream(prompt=config.prompt, max_tokens=config.max_tokens)
 
-    if config.verbose:
-        typer.echo(f"Response: {response}")
-
-    config.response = response
-
-    await handle_output(config)
+    await handle_output(config, stream=stream)
 
     if config.verbose:
         typer.echo(f"hello_world command finished.")
@@ -133,14 +128,9 @@ async def _test_123_command(config: OptionConfig, **kwargs):
     if config.verbose:
         typer.echo(f"Running test_123 command... {config}")
 
-    response = await acreate(prompt=config.prompt, max_tokens=config.max_tokens)
-
-    if config.verbose:
-        typer.echo(f"Response: {response}")
-
-    config.response = response
+    stream = acreate_stream(prompt=config.prompt, max_tokens=config.max_tokens)
 
-    await handle_output(config)
+    await handle_output(config, stream=stream)
 
     if config.verbose:
         typer.echo(f"test_123 command finished.")
@@ -70,14 +70,9 @@ async def _{{ cmd_name }}_command(config: OptionConfig, **kwargs):
     if config.verbose:
         typer.echo(f"Running {{ cmd_name }} command... {config}")
 
-    response = await acreate(prompt=config.prompt, max_tokens=config.max_tokens)
+    stream = acreate_stream(prompt=config.prompt, max_tokens=config.max_tokens)
 
-    if config.verbose:
-        typer.echo(f"Response: {response}")
-
-    config.response = response
-
-    await handle_output(config)
+    await handle_output(config, stream=stream)
 
     if config.verbose:
         typer.echo(f"{{ cmd_name }} command finished.")
@@ -92,7 +87,7 @@ class CommandModuleTemplate(TypedTemplate):
 import typer
 
 from shipit.models import OptionConfig
-from utils.complete import acreate
+from utils.complete import acreate_stream
 from utils.output_tools import handle_output
 
 app = typer.Typer()
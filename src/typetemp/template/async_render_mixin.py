@@ -7,7 +7,7 @@ import anyio
 from typetemp.environment.typed_environment import async_environment
 from typetemp.environment.typed_native_environment import async_native_environment
 from typetemp.template.render_funcs import arender_str
-from utils.complete import acreate
+from utils.complete import acreate, acreate_stream
 
 
 class AsyncRenderMixin:
@@ -15,9 +15,10 @@ class AsyncRenderMixin:
     An async mixin class that encapsulates the render and _render_vars functionality.
     """
 
-    async def _render(self, use_native=False, **kwargs) -> Any:
+    async def _render(self, use_native=False, stream=False, **kwargs) -> Any:
         """
-        Render the template.
+        Render the template. With ``stream`` the LLM output is written to ``to`` as
+        it arrives instead of after the completion finishes.
         """
         self._env = async_native_environment if use_native else async_environment
 
@@ -30,6 +31,10 @@ class AsyncRenderMixin:
 
         self.output = await template.render_async(**render_dict)
 
+        if stream and self.config:
+            await self._llm_stream()
+            return self.output
+
         await self._llm_call()
 
         if self.to == "stdout":
@@ -75,3 +80,32 @@ class AsyncRenderMixin:
         """
         if self.config:
             self.output = await acreate(prompt=self.output, config=self.config)
+
+    async def _llm_stream(self):
+        """
+        Stream the LLM rendering of the template to stdout or the ``to`` file.
+        """
+        chunks = []
+        sink = None
+
+        if self.to and self.to != "stdout":
+            rendered_to = os.path.abspath(self.to)
+            os.makedirs(os.path.dirname(rendered_to), exist_ok=True)
+            sink = await aiofiles.open(rendered_to, "w")
+
+        try:
+            async for chunk in acreate_stream(prompt=self.output, config=self.config):
+                chunks.append(chunk)
+                if sink:
+                    await sink.write(chunk)
+                    await sink.flush()
+                elif self.to == "stdout":
+                    print(chunk, end="", flush=True)
+        finally:
+            if sink:
+                await sink.close()
+
+        if self.to == "stdout":
+            print()
+
+        self.output = "".join(chunks).strip()
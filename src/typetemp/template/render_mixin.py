@@ -1,5 +1,5 @@
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 from ..environment.typed_environment import environment
 from ..environment.typed_native_environment import native_environment
@@ -17,28 +17,41 @@ class RenderMixin:
         Render the template. Excludes instance variables that
         are not callable (i.e., methods) and don't start with "__".
         """
+        self.output, render_dict = self._render_source(use_native, **kwargs)
+        self._write_output(render_dict, use_native)
+        return self.output
+
+    def _render_source(self, use_native=False, **kwargs) -> Tuple[str, Dict[str, Any]]:
+        """
+        Render the template without writing it to ``to``. Returns the text and the
+        variables it was rendered with.
+        """
         env = native_environment if use_native else environment
         template = env.from_string(self.source)
 
         render_dict = {**self._render_vars(), **kwargs}
 
-        self.output = template.render(**render_dict)
+        return template.render(**render_dict), render_dict
 
+    def _rendered_to(self, render_dict: Dict[str, Any], use_native=False) -> str:
+        """
+        Render the "to" property into a file path and create its directory.
+        """
+        env = native_environment if use_native else environment
+        rendered_to = os.path.abspath(env.from_string(self.to).render(**render_dict))
+
+        # Create the directory if it doesn't exist
+        os.makedirs(os.path.dirname(rendered_to), exist_ok=True)
+        return rendered_to
+
+    def _write_output(self, render_dict: Dict[str, Any], use_native=False) -> None:
         # Render the "to" property if it's defined
         if self.to == "stdout":
             print(self.output)
         elif self.to:
-            to_template = env.from_string(self.to)
-            rendered_to = os.path.join(to_template.render(**render_dict))
-
-            # Create the directory if it doesn't exist
-            os.makedirs(os.path.dirname(rendered_to), exist_ok=True)
-
-            with open(rendered_to, "w") as file:
+            with open(self._rendered_to(render_dict, use_native), "w") as file:
                 file.write(self.output)
 
-        return self.output
-
     def _render_vars(self) -> Dict[str, Any]:
         """
         Get the instance variables (not including methods or dunder methods).
@@ -19,10 +19,10 @@ class SmartTemplate(AsyncRenderMixin):
         self.__dict__.update(kwargs)
         self.config = LLMConfig() if "config" not in kwargs else kwargs["config"]
 
-    async def render(self, use_native=False, **kwargs) -> str:
+    async def render(self, use_native=False, stream=False, **kwargs) -> str:
         # Use NativeEnvironment when use_native is True, else use default Environment
         self.source = dedent(self.source)
-        await self._render(use_native=use_native, **kwargs)
+        await self._render(use_native=use_native, stream=stream, **kwargs)
 
         return self.output
 
@@ -1,6 +1,6 @@
-from typing import Union
+from typing import Iterable, Union
 
-from utils.complete import chat, create
+from utils.complete import chat, create, create_stream
 from typetemp.template.render_mixin import RenderMixin
 
 
@@ -26,23 +26,56 @@ class TypedPrompt(RenderMixin):
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
 
-    def __call__(self, use_native=False, **kwargs) -> Union[str, dict]:
+    def __call__(self, use_native=False, stream=False, **kwargs) -> Union[str, dict]:
         """
         This method is invoked when the class instance is called. It performs the following:
-        1. Calls the _render() method from the mixin class TypedTemplate to generate a rendered prompt.
+        1. Calls the _render_source() method from the mixin class RenderMixin to generate a rendered prompt.
         2. Passes the rendered prompt to the Chat instance for user interaction.
         3. Saves and optionally prints the output from the Chat instance.
 
+        The completion is written to ``to`` (a file or stdout); with ``stream`` it is
+        written chunk by chunk as it arrives.
+
         **kwargs: Keyword arguments for replacing variables in the template.
         """
-        # Render the prompt using _render() from TypedTemplate
-        rendered_prompt = self._render(use_native, **kwargs)
+        # Render the prompt without writing it; ``to`` receives the completion
+        rendered_prompt, render_dict = self._render_source(use_native, **kwargs)
+
+        if stream:
+            chunks = create_stream(prompt=rendered_prompt, model=self.model)
+            self.output = self._write_stream(chunks, render_dict, use_native)
+            return self.output
 
         # Pass the rendered prompt to the Chat instance for OpenAI interaction
         self.output = create(prompt=rendered_prompt, model=self.model)
+        self._write_output(render_dict, use_native)
 
         return self.output
 
+    def _write_stream(self, chunks: Iterable[str], render_dict: dict, use_native=False) -> str:
+        parts = []
+        sink = None
+
+        if self.to and self.to != "stdout":
+            sink = open(self._rendered_to(render_dict, use_native), "w")
+
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                if sink:
+                    sink.write(chunk)
+                    sink.flush()
+                elif self.to == "stdout":
+                    print(chunk, end="", flush=True)
+        finally:
+            if sink:
+                sink.close()
+
+        if self.to == "stdout":
+            print()
+
+        return "".join(parts).strip()
+
 
 if __name__ == "__main__":
     # Instantiate TypedPrompt class
@@ -3,15 +3,14 @@ from typing import List, Callable, Any
 
 from utils.complete import acreate
 from utils.create_prompts import create_kwargs
+from utils.schema_tools import prompt_schema
 
 
 async def choose_function(user_input: str, function_list: list):
     prompts = []
     for function in function_list:
-        source = inspect.getsource(function)
-        docstring = function.__doc__ if function.__doc__ else "No docstring provided."
         prompts.append(
-            f"Function: {function.__name__}\nDocstring: {docstring.strip()}\nSource:\n{source}"
+            f"Function: {function.__name__}\n{prompt_schema(function).render()}"
         )
 
     combined_prompt = (
@@ -40,7 +39,7 @@ async def select_and_execute_function(
         if param.default is param.empty
     ]
 
-    source = inspect.getsource(selected_function)
+    source = prompt_schema(selected_function).render()
 
     prompt_for_kwargs = f"""You are a Function Execution Assistant.
     Here are your instructions:
@@ -72,7 +71,7 @@ async def select_and_execute_function(
 
 
 async def execute_function(user_input: str, function: Callable):
-    source = inspect.getsource(function)
+    source = prompt_schema(function).render()
 
     prompt_for_kwargs = f"The user has input {user_input}.\n\nCreate the kwargs dictionary for the function based on the user input\n\nFunction:\n{source}"
 
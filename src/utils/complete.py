@@ -1,12 +1,61 @@
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from time import sleep
+
 import openai
-from openai import AsyncOpenAI
+from loguru import logger
 
-from .models import get_model
+from .llm_scheduler import scheduler
+from .models import get_model, request_cost, router
+from .providers import CHAT, COMPLETIONS, Provider, get_provider
+from .rate_limiter import (
+    DEFAULT_COMPLETION_ESTIMATE,
+    count_prompt_tokens,
+    estimate_request_tokens,
+    rate_limiter,
+)
+from .token_tools import count_tokens, fit_messages
 
 from dataclasses import dataclass, field
-from typing import Any, List, Optional
-
-client = AsyncOpenAI()
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "aismt", "llm_cache.sqlite"
+)
+DEFAULT_CACHE_MAX_ENTRIES = 10_000
+# Prompts packed into one completions request by acreate_many
+DEFAULT_BATCH_SIZE = 20
+# Times acreate_many re-sends prompts whose choice is missing from a reply
+PACKED_RESENDS = 1
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.05
+# Latency samples a model needs before its requests are hedged
+HEDGE_MIN_SAMPLES = 20
+DEFAULT_METRICS_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "aismt", "llm_metrics.json"
+)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
 
 
 @dataclass
@@ -28,41 +77,578 @@ class LLMConfig:
                 raise ValueError(f"Invalid config key: {key}")
 
 
-def create(config: LLMConfig = None, **kwargs):
-    if config:
-        config.update(**kwargs)
-        prompt = config.prompt
-        model = config.model
-        temperature = config.temperature
-        max_tokens = config.max_tokens
-        top_p = config.top_p
-        frequency_penalty = config.frequency_penalty
-        presence_penalty = config.presence_penalty
-        stop = config.stop
+class ResponseCache:
+    """
+    Content-addressed SQLite store for LLM responses.
+
+    Requests are keyed by a SHA-256 of their parameters (resolved model, prompt or
+    messages, temperature, max_tokens, stop, functions, ...). Entries older than
+    ``ttl`` seconds are treated as misses, and once the store holds more than
+    ``max_entries`` rows the least recently used ones are evicted. By default only
+    deterministic (temperature 0) requests are cached.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: Optional[float] = None,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        deterministic_only: bool = True,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.deterministic_only = deterministic_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(**request) -> str:
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature) -> bool:
+        return not self.deterministic_only or not temperature
+
+    def get(self, key: str) -> Any:
+        """
+        Return the cached value for ``key`` or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            # Evict everything past the newest ``max_entries`` accesses (LRU)
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+        }
+
+
+# Opt-in: the cache stays off until enable_cache() is called or AISMT_LLM_CACHE is set
+response_cache: Optional[ResponseCache] = None
+
+
+def enable_cache(path: str = DEFAULT_CACHE_PATH, **kwargs) -> ResponseCache:
+    global response_cache
+    response_cache = ResponseCache(path=path, **kwargs)
+    return response_cache
+
+
+def disable_cache() -> None:
+    global response_cache
+    response_cache = None
+
+
+if os.getenv("AISMT_LLM_CACHE"):
+    enable_cache(os.getenv("AISMT_LLM_CACHE"))
+
+
+def _cache_key(request: dict) -> Optional[str]:
+    """
+    Return the cache key for ``request`` or None when the cache does not apply.
+    """
+    if response_cache is None or not response_cache.cacheable(
+        request.get("temperature")
+    ):
+        return None
+    if get_provider().simulated:
+        return None
+    return ResponseCache.make_key(**request)
+
+
+def _cache_get(key: Optional[str], bypass_cache: bool = False) -> Any:
+    if key is None or bypass_cache:
+        return None
+    return response_cache.get(key)
+
+
+def _cache_set(key: Optional[str], value: Any) -> None:
+    if key is not None and response_cache is not None:
+        response_cache.set(key, value)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests. The first caller for a key starts the
+    request; callers arriving while it is in flight await the same result instead
+    of sending their own. The request is cancelled only once every waiter is gone.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, list] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Optional[str], func: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        if key is None:
+            return await func()
+
+        entry = self._in_flight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(func())
+            entry = self._in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "api_calls_saved": self.shared,
+            "in_flight": len(self._in_flight),
+        }
+
+
+single_flight = SingleFlight()
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics: labelled counters and histograms that render in
+    the Prometheus text format or as a JSON-friendly snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+    def counter(self, name: str, help: str) -> None:
+        self._help[name] = help
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self._help[name] = help
+        self._buckets[name] = tuple(buckets)
+        self._histograms.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms[name]
+            # Per-bucket counts, then sum and count
+            entry = series.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def total(self, name: str, **labels) -> float:
+        """
+        Sum of a counter over every series matching ``labels``.
+        """
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value
+                for key, value in self._counters[name].items()
+                if wanted <= set(key)
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            for series in (*self._counters.values(), *self._histograms.values()):
+                series.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "buckets": dict(zip(self._buckets[name], entry[:-2])),
+                        "sum": entry[-2],
+                        "count": entry[-1],
+                    }
+                    for key, entry in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    @staticmethod
+    def _labels(pairs) -> str:
+        if not pairs:
+            return ""
+        escaped = (
+            (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in pairs
+        )
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{self._labels(key)} {value}")
+
+            for name, series in self._histograms.items():
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, entry in series.items():
+                    for bound, count in zip(self._buckets[name], entry[:-2]):
+                        labels = self._labels(key + (("le", bound),))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    labels = self._labels(key + (("le", "+Inf"),))
+                    lines.append(f"{name}_bucket{labels} {entry[-1]}")
+                    lines.append(f"{name}_sum{self._labels(key)} {entry[-2]}")
+                    lines.append(f"{name}_count{self._labels(key)} {entry[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.counter("llm_requests_total", "LLM API requests by outcome.")
+metrics.histogram("llm_request_duration_seconds", "LLM API request latency.")
+metrics.counter("llm_tokens_total", "Prompt and completion tokens used.")
+metrics.counter("llm_cost_usd_total", "Estimated spend in USD.")
+metrics.counter("llm_retries_total", "Requests retried after an error.")
+metrics.counter("llm_hedges_total", "Backup requests sent for slow requests.")
+
+_caller: ContextVar[Optional[str]] = ContextVar("llm_caller", default=None)
+
+# Modules skipped when looking for the code that made a request: the LLM
+# plumbing, the prompt helpers built on it and the decorators wrapping them
+_INTERNAL_MODULES = (
+    "utils.complete",
+    "utils.providers",
+    "utils.estimate_tools",
+    "utils.prompt_tools",
+    "utils.create_prompts",
+    "utils.create_primatives",
+    "utils.compress_tools",
+    "utils.journal_tools",
+    "utils.executor_tools",
+    "icontract",
+    "asyncio",
+    "contextlib",
+    "functools",
+)
+
+
+@contextmanager
+def caller_scope(name: str):
+    """
+    Attribute LLM requests made inside the block to ``name`` in the metrics.
+    """
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def current_caller() -> str:
+    """
+    The caller label for a request: the innermost ``caller_scope`` or else the
+    module of the nearest frame outside this package's LLM plumbing.
+    """
+    name = _caller.get()
+    if name:
+        return name
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_INTERNAL_MODULES):
+            return module
+        frame = frame.f_back
+    return "unknown"
+
+
+def with_caller(func):
+    """
+    Pin the caller label when ``func`` is called, so requests from the tasks it
+    fans out to are attributed to its caller rather than to the helper.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _caller.get():
+            return await func(*args, **kwargs)
+        with caller_scope(current_caller()):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def _track(provider: Provider, model: str):
+    # Simulated traffic must not skew routing or latency-based hedging
+    return nullcontext() if provider.simulated else router.track(model)
+
+
+def _observe(
+    provider: Provider,
+    endpoint: str,
+    model: str,
+    caller: str,
+    started: float,
+    usage: dict = None,
+    error: BaseException = None,
+) -> None:
+    labels = {
+        "model": model,
+        "caller": caller,
+        "simulated": "true" if provider.simulated else "false",
+    }
+    if error is None:
+        status = "ok"
+    elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+        # A consumer that stops reading early or a cancelled task is not a failure
+        status = "cancelled"
     else:
-        prompt = kwargs.get("prompt", "")
-        model = kwargs.get("model", "3i")
-        temperature = kwargs.get("temperature", 0)
-        max_tokens = kwargs.get("max_tokens", 250)
-        top_p = kwargs.get("top_p", 1)
-        frequency_penalty = kwargs.get("frequency_penalty", 0)
-        presence_penalty = kwargs.get("presence_penalty", 0)
-        stop = kwargs.get("stop", None)
+        status = type(error).__name__
+    metrics.inc("llm_requests_total", endpoint=endpoint, status=status, **labels)
+    metrics.observe("llm_request_duration_seconds", time.monotonic() - started, **labels)
+
+    if usage:
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+        metrics.inc("llm_tokens_total", prompt, kind="prompt", **labels)
+        metrics.inc("llm_tokens_total", completion, kind="completion", **labels)
+        metrics.inc("llm_cost_usd_total", request_cost(model, prompt, completion), **labels)
 
-    response = openai.completions.create(
-        model=get_model(model),
-        prompt=prompt,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
-        stop=stop,
-    )
-    return response.choices[0].text.strip()
 
+def metrics_summary() -> dict:
+    """
+    Metrics plus cache, coalescing, hedging and router statistics as one dict.
+    """
+    return {
+        **metrics.snapshot(),
+        "cache": response_cache.stats() if response_cache is not None else None,
+        "single_flight": single_flight.stats(),
+        "hedging": hedging.stats(),
+        "scheduler": scheduler.stats(),
+        "router": router.stats(),
+    }
+
+
+def dump_metrics(path: str = None) -> Optional[str]:
+    """
+    Write ``metrics_summary()`` as JSON to ``path`` (default: AISMT_METRICS_FILE or
+    DEFAULT_METRICS_PATH). Nothing is written if no request was made.
+    """
+    if not metrics.total("llm_requests_total"):
+        return None
 
-async def acreate(*, config: LLMConfig = None, **kwargs):
+    path = path or os.getenv("AISMT_METRICS_FILE") or DEFAULT_METRICS_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(metrics_summary(), f, indent=2, default=str)
+    return path
+
+
+_dump_registered = False
+
+
+def dump_metrics_at_exit() -> None:
+    """
+    Register ``dump_metrics`` to run when the interpreter exits. Used by the CLIs.
+    """
+    global _dump_registered
+    if not _dump_registered:
+        atexit.register(dump_metrics)
+        _dump_registered = True
+
+
+class HedgePolicy:
+    """
+    Hedged requests against tail latency. When a request has been outstanding for
+    longer than the ``quantile`` of its model's recent latencies, a duplicate is
+    sent to another healthy model from the same pool; the first successful reply
+    wins and the other request is cancelled. At most ``budget`` of all requests
+    seen by the policy are duplicated.
+    """
+
+    def __init__(
+        self,
+        quantile: float = DEFAULT_HEDGE_QUANTILE,
+        budget: float = DEFAULT_HEDGE_BUDGET,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        enabled: bool = False,
+    ):
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.enabled = enabled
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self, model: str) -> Optional[float]:
+        return router.latency_quantile(model, self.quantile, self.min_samples)
+
+    def _spend(self) -> bool:
+        if self.hedges + 1 > self.budget * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+    async def run(
+        self,
+        model: str,
+        send: Callable[[str], Awaitable[Any]],
+        hedge: Optional[bool] = None,
+    ) -> Any:
+        """
+        Await ``send(model)``, hedging it with ``send(alternate)`` when it is slow.
+        """
+        if not (self.enabled if hedge is None else hedge):
+            return await send(model)
+
+        self.requests += 1
+        delay = self.delay(model)
+        if delay is None:
+            return await send(model)
+
+        primary = asyncio.ensure_future(send(model))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        backup_model = router.alternate(model)
+        if backup_model is None or not self._spend():
+            return await primary
+
+        logger.debug(f"Hedging {model} request on {backup_model} after {delay:.2f}s")
+        metrics.inc("llm_hedges_total", model=model, caller=current_caller())
+        backup = asyncio.ensure_future(send(backup_model))
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+# Opt-in: hedging stays off unless enabled here, by AISMT_LLM_HEDGE or per call
+hedging = HedgePolicy(enabled=bool(os.getenv("AISMT_LLM_HEDGE")))
+
+
+def _flight_key(request: dict, dedupe: bool) -> Optional[str]:
+    """
+    Key under which ``request`` is coalesced, or None if it must run on its own.
+    Sampling requests (non-zero temperature) are never coalesced.
+    """
+    if not dedupe or request.get("temperature"):
+        return None
+    return ResponseCache.make_key(**request)
+
+
+def _completion_params(config: Optional[LLMConfig], kwargs: dict) -> dict:
     if config:
         config.update(**kwargs)
         prompt = config.prompt
@@ -83,30 +669,322 @@ async def acreate(*, config: LLMConfig = None, **kwargs):
         presence_penalty = kwargs.get("presence_penalty", 0)
         stop = kwargs.get("stop", None)
 
-    model = get_model(model)
+    return {
+        "model": get_model(model),
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "top_p": top_p,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "stop": stop,
+    }
+
+
+def _request(endpoint: str, params: dict) -> dict:
+    """
+    Send one request to the active provider through the shared rate limiter and
+    the model router. Returns the response as an OpenAI-shaped dict.
+    """
+    provider = get_provider()
+    model = params["model"]
+    caller = current_caller()
+    if provider.rate_limited:
+        rate_limiter.acquire_sync(model, estimate_request_tokens(params))
+
+    started = time.monotonic()
+    try:
+        with _track(provider, model):
+            payload, headers = provider.complete(endpoint, params)
+    except BaseException as oops:
+        _observe(provider, endpoint, model, caller, started, error=oops)
+        if isinstance(oops, openai.RateLimitError):
+            rate_limiter.on_rate_limited(model)
+        raise
+
+    _observe(provider, endpoint, model, caller, started, payload.get("usage"))
+    rate_limiter.update_from_headers(model, headers)
+    return payload
+
+
+async def _arequest(endpoint: str, params: dict) -> dict:
+    """
+    Async ``_request``. Waits for a slot from the process-wide ``scheduler`` first,
+    so higher-priority calls reach the rate limiter ahead of bulk work.
+    """
+    provider = get_provider()
+    model = params["model"]
+    caller = current_caller()
+
+    async with scheduler.slot(caller=caller):
+        if provider.rate_limited:
+            await rate_limiter.acquire(model, estimate_request_tokens(params))
+
+        started = time.monotonic()
+        try:
+            with _track(provider, model):
+                payload, headers = await provider.acomplete(endpoint, params)
+        except BaseException as oops:
+            _observe(provider, endpoint, model, caller, started, error=oops)
+            if isinstance(oops, openai.RateLimitError):
+                rate_limiter.on_rate_limited(model)
+            raise
+
+    _observe(provider, endpoint, model, caller, started, payload.get("usage"))
+    rate_limiter.update_from_headers(model, headers)
+    return payload
+
+
+def _stream_usage(params: dict, parts: List[str]) -> dict:
+    # Streamed responses carry no usage block, so count the tokens locally
+    prompt = count_prompt_tokens(params)
+    completion = count_tokens("".join(parts), params["model"])
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+
+def _stream(endpoint: str, params: dict) -> Iterator[dict]:
+    """
+    Open a streaming request on the active provider and yield its chunk dicts.
+    """
+    provider = get_provider()
+    model = params["model"]
+    caller = current_caller()
+    if provider.rate_limited:
+        rate_limiter.acquire_sync(model, estimate_request_tokens(params))
+
+    def on_headers(headers):
+        rate_limiter.update_from_headers(model, headers)
+
+    parts = []
+    started = time.monotonic()
+    try:
+        with _track(provider, model):
+            for chunk in provider.stream(endpoint, params, on_headers):
+                parts.append(_chunk_text(chunk))
+                yield chunk
+    except BaseException as oops:
+        usage = _stream_usage(params, parts)
+        _observe(provider, endpoint, model, caller, started, usage, oops)
+        if isinstance(oops, openai.RateLimitError):
+            rate_limiter.on_rate_limited(model)
+        raise
+
+    usage = _stream_usage(params, parts)
+    _observe(provider, endpoint, model, caller, started, usage)
+
+
+async def _astream(endpoint: str, params: dict) -> AsyncIterator[dict]:
+    provider = get_provider()
+    model = params["model"]
+    caller = current_caller()
+
+    def on_headers(headers):
+        rate_limiter.update_from_headers(model, headers)
+
+    async with scheduler.slot(caller=caller):
+        if provider.rate_limited:
+            await rate_limiter.acquire(model, estimate_request_tokens(params))
+
+        parts = []
+        started = time.monotonic()
+        try:
+            with _track(provider, model):
+                async for chunk in provider.astream(endpoint, params, on_headers):
+                    parts.append(_chunk_text(chunk))
+                    yield chunk
+        except BaseException as oops:
+            usage = _stream_usage(params, parts)
+            _observe(provider, endpoint, model, caller, started, usage, oops)
+            if isinstance(oops, openai.RateLimitError):
+                rate_limiter.on_rate_limited(model)
+            raise
 
-    response = await client.completions.create(
-        model=model,
-        prompt=prompt,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
-        stop=stop,
+    usage = _stream_usage(params, parts)
+    _observe(provider, endpoint, model, caller, started, usage)
+
+
+def _chunk_text(chunk: dict) -> str:
+    choice = chunk["choices"][0] if chunk.get("choices") else {}
+    if "delta" in choice:
+        return (choice["delta"] or {}).get("content") or ""
+    return choice.get("text") or ""
+
+
+def create(config: LLMConfig = None, bypass_cache: bool = False, **kwargs):
+    """
+    Synchronous completion. When the response cache is enabled, identical requests
+    are served from it; ``bypass_cache`` skips the lookup and refreshes the entry.
+    """
+    params = _completion_params(config, kwargs)
+
+    key = _cache_key(params)
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        return cached
+
+    response = _request(COMPLETIONS, params)
+    result = response["choices"][0]["text"].strip()
+
+    _cache_set(key, result)
+    return result
+
+
+@with_caller
+async def acreate(
+    *,
+    config: LLMConfig = None,
+    bypass_cache: bool = False,
+    dedupe: bool = True,
+    hedge: Optional[bool] = None,
+    **kwargs,
+):
+    """
+    Async completion. Concurrent identical temperature-0 calls share one request;
+    pass ``dedupe=False`` to always send an independent request. ``hedge``
+    overrides whether slow requests are hedged (see ``HedgePolicy``).
+    """
+    params = _completion_params(config, kwargs)
+
+    key = _cache_key(params)
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        return cached
+
+    async def send_to(model: str):
+        response = await _arequest(COMPLETIONS, {**params, "model": model})
+        return response["choices"][0]["text"].strip()
+
+    async def send():
+        return await hedging.run(params["model"], send_to, hedge)
+
+    result = await single_flight.do(_flight_key(params, dedupe), send)
+
+    _cache_set(key, result)
+    return result
+
+
+@with_caller
+async def acreate_many(
+    prompts: Sequence[str],
+    *,
+    config: LLMConfig = None,
+    models: Sequence[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    bypass_cache: bool = False,
+    **kwargs,
+) -> List[str]:
+    """
+    Complete many prompts that share a model and parameters, packing up to
+    ``batch_size`` of them into each completions request and mapping the choices
+    back by index. Results are returned in prompt order. When ``models`` is given
+    each request is routed to a model from that pool. Prompts whose choice is
+    missing from a reply are sent again, and ValueError is raised if they still
+    go unanswered.
+    """
+    prompts = list(prompts)
+    results: List[Optional[str]] = [None] * len(prompts)
+    base = _completion_params(config, {**kwargs, "prompt": ""})
+
+    # Identical deterministic prompts are only sent once
+    slots: Dict[Any, List[int]] = {}
+    for index, prompt in enumerate(prompts):
+        slot = index if base["temperature"] else prompt
+        slots.setdefault(slot, []).append(index)
+    groups = list(slots.values())
+
+    async def send(batch: List[List[int]]):
+        model = router.pick(models) if models else base["model"]
+        params = {**base, "model": model}
+
+        misses = []
+        for indices in batch:
+            key = _cache_key({**params, "prompt": prompts[indices[0]]})
+            cached = _cache_get(key, bypass_cache)
+            if cached is None:
+                misses.append((indices, key))
+            else:
+                for index in indices:
+                    results[index] = cached
+        if not misses:
+            return
+
+        # A reply can leave out choices; those prompts are sent again on their own
+        for attempt in range(1 + PACKED_RESENDS):
+            packed = [prompts[indices[0]] for indices, _ in misses]
+            response = await _arequest(COMPLETIONS, {**params, "prompt": packed})
+            answered = set()
+            for choice in response["choices"]:
+                if not 0 <= choice.get("index", -1) < len(misses):
+                    continue
+                indices, key = misses[choice["index"]]
+                text = choice["text"].strip()
+                _cache_set(key, text)
+                for index in indices:
+                    results[index] = text
+                answered.add(choice["index"])
+
+            misses = [miss for position, miss in enumerate(misses) if position not in answered]
+            if not misses:
+                return
+
+        raise ValueError(
+            f"No completion returned for {len(misses)} packed prompt(s) after "
+            f"{1 + PACKED_RESENDS} attempts"
+        )
+
+    await asyncio.gather(
+        *(
+            send(groups[start : start + batch_size])
+            for start in range(0, len(groups), batch_size)
+        )
     )
+    return results
+
+
+def create_stream(config: LLMConfig = None, bypass_cache: bool = False, **kwargs):
+    """
+    Streaming variant of ``create`` that yields text deltas as they arrive. A cache
+    hit is yielded as a single chunk; a fully consumed stream is cached like
+    ``create`` would cache it.
+    """
+    params = _completion_params(config, kwargs)
 
-    return response.choices[0].text.strip()
+    key = _cache_key(params)
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        yield cached
+        return
 
+    parts = []
+    for chunk in _stream(COMPLETIONS, params):
+        text = _chunk_text(chunk)
+        if text:
+            parts.append(text)
+            yield text
 
-import asyncio
-import json
-import os
-from dataclasses import dataclass
-from time import sleep
-from typing import Union
+    _cache_set(key, "".join(parts).strip())
+
+
+async def acreate_stream(
+    *, config: LLMConfig = None, bypass_cache: bool = False, **kwargs
+) -> AsyncIterator[str]:
+    params = _completion_params(config, kwargs)
+
+    key = _cache_key(params)
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for chunk in _astream(COMPLETIONS, params):
+        text = _chunk_text(chunk)
+        if text:
+            parts.append(text)
+            yield text
+
+    _cache_set(key, "".join(parts).strip())
 
-from loguru import logger
 
 # from fgn.completion.prompt_schemas import *
 # from fgn.utils.llama_llm import LocalLlamaClient
@@ -131,6 +1009,8 @@ def chat(
     raw_msg=False,
     write_path=None,
     mode="a+",
+    bypass_cache=False,
+    max_tokens=None,
 ) -> Union[str, dict]:
     """
     Customized completion function that interacts with the OpenAI API, capable of handling prompts, system messages,
@@ -148,6 +1028,9 @@ def chat(
         raw_msg (bool, optional): Whether to include raw message in the response.
         write_path (str, optional): Directory or file path to write the response.
         mode (str, optional): File opening mode if writing response to file.
+        bypass_cache (bool, optional): Skip the response cache lookup and refresh the entry.
+        max_tokens (int, optional): Maximum tokens in the reply. The conversation is trimmed
+            locally before sending so that it fits the context window with this much room left.
     """
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -157,28 +1040,23 @@ def chat(
 
     model = get_model(model)
 
+    messages = _fit_messages(messages, model, funcs, max_tokens)
+
+    key = _cache_key(
+        {**_create_params(model, messages, funcs, max_tokens), "raw_msg": raw_msg}
+    )
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        write_response(mode, prompt, cached, write_path)
+        return cached
+
     while retry <= max_retry:
         try:
-            params = _create_params(model, messages, funcs)
-            res = None
-
-            if str(model) == "2":
-                ...
-                # llama = LocalLlamaClient()
-                # res = llama.complete(prompt=prompt)
-            elif funcs:
-                res = get_response(
-                    openai.chat.completions.create(**params),
-                    raw_msg=raw_msg,
-                    funcs=funcs,
-                )
-            else:
-                res = get_response(
-                    openai.chat.completions.create(**params),
-                    raw_msg=raw_msg,
-                    funcs=funcs,
-                )
+            params = _create_params(model, messages, funcs, max_tokens)
+            response = _request(CHAT, params)
+            res = get_response(response, raw_msg=raw_msg, funcs=funcs)
 
+            _cache_set(key, res)
             write_response(mode, prompt, res, write_path)
 
             return res
@@ -193,6 +1071,7 @@ def chat(
 
             # Increment the retry attempts
             retry += 1
+            metrics.inc("llm_retries_total", model=model, caller=current_caller())
 
             # If reached the maximum retry attempts, return the error message
             if retry > max_retry:
@@ -200,8 +1079,11 @@ def chat(
                     f"Error communicating with OpenAI (attempt {retry}/{max_retry}): {oops}"
                 )
 
-            # Calculate the waiting time for exponential backoff
+            # Calculate the waiting time for exponential backoff. After a 429 the
+            # drained rate limiter already holds the next attempt back.
             wait_time = initial_wait * (backoff_factor ** (retry - 1))
+            if isinstance(oops, openai.RateLimitError):
+                wait_time = 0
 
             # Print the error and wait before retrying
             logger.warning(
@@ -227,6 +1109,7 @@ class Chat:
         return chat(**kwargs)
 
 
+@with_caller
 async def achat(
     prompt=DEFAULT_PROMPT,
     sys_msg=DEFAULT_SYS_MSG,
@@ -239,10 +1122,17 @@ async def achat(
     raw_msg=False,
     write_path=None,
     mode="a+",
+    bypass_cache=False,
+    max_tokens=None,
+    dedupe=True,
+    hedge=None,
+    function_call=None,
 ) -> Union[str, dict]:
     """
     Customized completion function that interacts with the OpenAI API, capable of handling prompts, system messages,
     and specific functions. If the content length is too long, it will shorten the content and retry.
+    Concurrent identical calls share one request unless ``dedupe`` is False; ``hedge`` overrides hedging.
+    ``function_call={"name": ...}`` forces a call to one of ``funcs``.
     """
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -251,31 +1141,67 @@ async def achat(
     if funcs is None:
         funcs = []
 
+    model = get_model(model)
+
+    messages = _fit_messages(messages, model, funcs, max_tokens)
+
+    request = {
+        **_create_params(model, messages, funcs, max_tokens, function_call),
+        "raw_msg": raw_msg,
+    }
+    key = _cache_key(request)
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        await awrite_response(mode, prompt, cached, write_path)
+        return cached
+
+    res = await single_flight.do(
+        _flight_key(request, dedupe),
+        lambda: _achat_with_retry(
+            messages,
+            model,
+            funcs,
+            max_tokens,
+            raw_msg,
+            max_retry,
+            backoff_factor,
+            initial_wait,
+            hedge,
+            function_call,
+        ),
+    )
+
+    _cache_set(key, res)
+    await awrite_response(mode, prompt, res, write_path)
+
+    return res
+
+
+async def _achat_with_retry(
+    messages,
+    model,
+    funcs,
+    max_tokens,
+    raw_msg,
+    max_retry,
+    backoff_factor,
+    initial_wait,
+    hedge=None,
+    function_call=None,
+):
     # Initialize retry attempts
     retry = 0
 
     # Run the loop for retry attempts
     while retry <= max_retry:
         try:
-            params = _create_params(model, messages, funcs)
-            res = None
-
-            if funcs:
-                res = get_response(
-                    await AsyncCompletions.chat.completions.create(**params),
-                    raw_msg=raw_msg,
-                    funcs=funcs,
-                )
-            else:
-                res = get_response(
-                    await openai.chat.completions.create(**params),
-                    raw_msg=raw_msg,
-                    funcs=funcs,
-                )
+            params = _create_params(model, messages, funcs, max_tokens, function_call)
 
-            await awrite_response(mode, prompt, res, write_path)
+            async def send_to(target):
+                return await _arequest(CHAT, {**params, "model": target})
 
-            return res
+            response = await hedging.run(model, send_to, hedge)
+            return get_response(response, raw_msg=raw_msg, funcs=funcs)
         except Exception as oops:
             logger.warning(oops)
             # If the error is due to maximum context length, chop the messages and retry
@@ -286,6 +1212,7 @@ async def achat(
                 continue
 
             retry += 1
+            metrics.inc("llm_retries_total", model=model, caller=current_caller())
 
             if retry > max_retry:
                 raise ValueError(
@@ -293,13 +1220,48 @@ async def achat(
                 )
 
             wait_time = initial_wait * (backoff_factor ** (retry - 1))
+            if isinstance(oops, openai.RateLimitError):
+                wait_time = 0
 
-            print(
+            logger.warning(
                 f"Error communicating with OpenAI (attempt {retry}/{max_retry}): {oops}"
             )
             await asyncio.sleep(wait_time)
 
 
+async def achat_stream(
+    prompt=DEFAULT_PROMPT,
+    sys_msg=DEFAULT_SYS_MSG,
+    msgs=None,
+    model=DEFAULT_MODEL,
+    bypass_cache=False,
+    max_tokens=None,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of ``achat`` for plain-text replies. Yields content deltas as
+    they arrive; function calling is not supported while streaming.
+    """
+    messages = _create_messages(sys_msg, prompt, msgs)
+    model = get_model(model)
+    messages = _fit_messages(messages, model, None, max_tokens)
+    params = _create_params(model, messages, max_tokens=max_tokens)
+
+    key = _cache_key({**params, "raw_msg": False})
+    cached = _cache_get(key, bypass_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for chunk in _astream(CHAT, params):
+        delta = _chunk_text(chunk)
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    _cache_set(key, "".join(parts).strip())
+
+
 def write_response(mode, prompt, res, write_path):
     if write_path and os.path.isdir(write_path):
         # name = generate_filename(prompt)
@@ -323,6 +1285,9 @@ async def awrite_response(mode, prompt, res, write_path):
 
 
 def get_response(res, raw_msg, funcs):
+    if hasattr(res, "model_dump"):
+        res = res.model_dump(exclude_none=True)
+
     msg = res.get("choices")[0].get("message")
 
     if raw_msg:
@@ -350,18 +1315,31 @@ def get_response(res, raw_msg, funcs):
         return msg.get("content", "").strip()
 
 
-def _create_params(model, messages, funcs=None):
+def _create_params(model, messages, funcs=None, max_tokens=None, function_call=None):
     parameters = {
         "model": get_model(model),
         "messages": messages,
     }
+    if max_tokens:
+        parameters["max_tokens"] = max_tokens
     if funcs:
         parameters["functions"] = funcs
-        parameters["function_call"] = "auto"
+        parameters["function_call"] = function_call or "auto"
 
     return parameters
 
 
+def _fit_messages(messages, model, funcs=None, max_tokens=None):
+    """
+    Trim the conversation locally so it fits the model's context window, leaving
+    room for the reply and the function definitions.
+    """
+    reserve = max_tokens or DEFAULT_COMPLETION_ESTIMATE
+    if funcs:
+        reserve += count_tokens(json.dumps(funcs), model)
+    return fit_messages(messages, model, reserve)
+
+
 def _create_messages(sys_msg, prompt, msgs):
     messages = []
 
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+from typing import Optional
+
+from loguru import logger
+
+from utils.complete import ResponseCache, metrics, with_caller
+from utils.providers import get_provider
+from utils.token_tools import count_tokens, split_tokens
+
+DEFAULT_SPR_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "aismt", "spr_cache.sqlite"
+)
+# Prompts shorter than this many tokens are sent as they are
+DEFAULT_COMPRESS_THRESHOLD = int(os.getenv("AISMT_COMPRESS_THRESHOLD", "2000"))
+SPR_MODEL = "3i"
+# Largest piece compressed in one request, leaving room for the SPR instructions
+SPR_CHUNK_TOKENS = 2500
+# Reply budget per piece: about a fifth of its length, within these bounds
+SPR_RATIO = 5
+SPR_MIN_TOKENS = 100
+SPR_MAX_TOKENS = 600
+
+metrics.counter("llm_prompt_compressions_total", "Long prompts compressed to an SPR, by cache use.")
+metrics.counter("llm_prompt_compression_tokens_total", "Prompt tokens before and after compression.")
+metrics.histogram(
+    "llm_prompt_compression_ratio",
+    "Compressed over original prompt tokens.",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0),
+)
+
+_spr_cache: Optional[ResponseCache] = None
+_spr_cache_lock = threading.Lock()
+
+
+def spr_cache() -> ResponseCache:
+    """
+    The on-disk SPR store, shared by every process that points
+    ``AISMT_SPR_CACHE`` at the same file.
+    """
+    global _spr_cache
+    with _spr_cache_lock:
+        if _spr_cache is None:
+            path = os.getenv("AISMT_SPR_CACHE", DEFAULT_SPR_CACHE_PATH)
+            _spr_cache = ResponseCache(path=path, deterministic_only=False)
+        return _spr_cache
+
+
+def compression_enabled(compress: Optional[bool] = None) -> bool:
+    if compress is not None:
+        return compress
+    return os.getenv("AISMT_COMPRESS_PROMPTS", "").lower() in ("1", "true", "yes")
+
+
+def _record(original: int, compressed: int, cached: bool) -> None:
+    simulated = str(get_provider().simulated).lower()
+    metrics.inc("llm_prompt_compressions_total", cached=str(cached).lower(), simulated=simulated)
+    metrics.inc("llm_prompt_compression_tokens_total", original, kind="original", simulated=simulated)
+    metrics.inc("llm_prompt_compression_tokens_total", compressed, kind="compressed", simulated=simulated)
+    metrics.observe("llm_prompt_compression_ratio", compressed / original, simulated=simulated)
+    logger.info(
+        f"Compressed prompt {original} -> {compressed} tokens "
+        f"({compressed / original:.0%}{', cached' if cached else ''})"
+    )
+
+
+@with_caller
+async def compress_prompt(
+    prompt: str,
+    compress: Optional[bool] = None,
+    threshold: int = None,
+    model: str = SPR_MODEL,
+) -> str:
+    """
+    Replace a prompt of ``threshold`` tokens or more with its Sparse Priming
+    Representation, if compression is on (``compress`` or
+    ``AISMT_COMPRESS_PROMPTS``). Each SPR is made once per content hash and
+    model and kept in ``spr_cache``. A compression that saves nothing returns
+    the prompt unchanged.
+    """
+    if not prompt or not compression_enabled(compress):
+        return prompt
+
+    original = count_tokens(prompt)
+    if original < (threshold or DEFAULT_COMPRESS_THRESHOLD):
+        return prompt
+
+    cache = spr_cache()
+    key = ResponseCache.make_key(spr=prompt, model=model)
+    entry = cache.get(key)
+    if entry is not None:
+        _record(original, entry["tokens"], cached=True)
+        return entry["spr"]
+
+    from utils.create_prompts import spr
+
+    pieces = split_tokens(prompt, SPR_CHUNK_TOKENS)
+    parts = await asyncio.gather(
+        *(
+            spr(
+                piece,
+                model=model,
+                max_tokens=min(SPR_MAX_TOKENS, max(SPR_MIN_TOKENS, count_tokens(piece) // SPR_RATIO)),
+            )
+            for piece in pieces
+        )
+    )
+    compressed = "\n".join(part.strip() for part in parts).strip()
+    tokens = count_tokens(compressed)
+    if not compressed or tokens >= original:
+        compressed, tokens = prompt, original
+
+    # Mock and dry-run replies must not be kept as real compressions
+    if not get_provider().simulated:
+        cache.set(key, {"spr": compressed, "tokens": tokens, "original_tokens": original})
+    _record(original, tokens, cached=False)
+    return compressed
+
+
+def compression_stats() -> dict:
+    original = metrics.total("llm_prompt_compression_tokens_total", kind="original")
+    compressed = metrics.total("llm_prompt_compression_tokens_total", kind="compressed")
+    return {
+        "compressions": int(metrics.total("llm_prompt_compressions_total")),
+        "cached": int(metrics.total("llm_prompt_compressions_total", cached="true")),
+        "tokens_saved": int(original - compressed),
+        "ratio": compressed / original if original else 1.0,
+    }
@@ -1,13 +1,15 @@
 import ast
+import json
+import time
 from textwrap import dedent
-from typing import Callable, Type, TypeVar
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Type, TypeVar
 
 import anyio
-import autopep8
 import loguru
-from icontract import ensure, require
+from icontract import ViolationError, ensure, require
 
-from .complete import acreate
+from .complete import acreate, acreate_stream
+from .executor_tools import run_parser
 
 
 # Add a pre-condition to check the type of the 'prompt' variable
@@ -19,19 +21,10 @@ from .complete import acreate
     and min_len <= len(result) <= max_len,
     "List length must be within min_len and max_len, and all elements must be strings.",
 )
-async def create_list(prompt, min_len=1, max_len=20, **kwargs) -> list:
-    # Explicitly stating the constraints and expectations in the prompt
-    instructions = dedent(
-        f"Create a PerfectPep8Python list of strings"
-        f"The list should be based on the prompt: \n\n```prompt\n\n{prompt}\n\n```\n\n"
-        f"The list should have a minimum length of {min_len} and a maximum length of {max_len}. "
-        "Make sure the list is formatted according to PEP8 guidelines. Please complete the following code block: "
-        f"```python\n"
-        f"# I have IMPLEMENTED your PerfectPythonProductionCode® AGI enterprise innovative and opinionated "
-        f"list based on your prompt. I have validated that this list does not match the order of the prompt.\n"
-        f"from typing import List\n"
-        f'perfect_str_list: List[str] = ["'
-    )
+async def create_list(
+    prompt, min_len=1, max_len=20, parse_in_pool: bool = None, **kwargs
+) -> list:
+    instructions = _list_instructions(prompt, min_len, max_len)
 
     result = await acreate(
         prompt=instructions,
@@ -42,7 +35,9 @@ async def create_list(prompt, min_len=1, max_len=20, **kwargs) -> list:
 
     try:
         # Extract the list and validate its elements are strings
-        extracted_list = extract_list('["' + result)
+        extracted_list = await run_parser(
+            extract_list, '["' + result, in_pool=parse_in_pool
+        )
         return extracted_list
     # If list extraction fails, this section will execute
     except (ValueError, SyntaxError) as e:
@@ -65,12 +60,149 @@ async def create_list(prompt, min_len=1, max_len=20, **kwargs) -> list:
             max_tokens=2000,
             **kwargs,
         )
-        return extract_list('["' + fixed_list)
+        return await run_parser(
+            extract_list, '["' + fixed_list, in_pool=parse_in_pool
+        )
+
+
+def _list_instructions(prompt, min_len, max_len) -> str:
+    # Explicitly stating the constraints and expectations in the prompt
+    return dedent(
+        f"Create a PerfectPep8Python list of strings"
+        f"The list should be based on the prompt: \n\n```prompt\n\n{prompt}\n\n```\n\n"
+        f"The list should have a minimum length of {min_len} and a maximum length of {max_len}. "
+        "Make sure the list is formatted according to PEP8 guidelines. Please complete the following code block: "
+        f"```python\n"
+        f"# I have IMPLEMENTED your PerfectPythonProductionCode® AGI enterprise innovative and opinionated "
+        f"list based on your prompt. I have validated that this list does not match the order of the prompt.\n"
+        f"from typing import List\n"
+        f'perfect_str_list: List[str] = ["'
+    )
+
+
+# Closing quote for each opening quote, smart quotes included
+_QUOTES = {
+    '"': '"',
+    "'": "'",
+    "\u201c": "\u201d",
+    "\u201d": "\u201d",
+    "\u2018": "\u2019",
+    "\u2019": "\u2019",
+}
+_BRACKETS = {"{": "}", "[": "]", "(": ")"}
+_JSON_WORDS = {"true": "True", "false": "False", "null": "None"}
+
+
+def _repair_literal(text: str) -> List[str]:
+    """
+    Rewrite an LLM-emitted literal into candidates for ``ast.literal_eval``, most
+    complete first. Smart quotes become plain quotes, JSON keywords become Python
+    ones, text after the literal is dropped, and a truncated literal is closed
+    either as-is or after its last complete element.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    text = text[min(starts):] if starts else text
+
+    out: List[str] = []
+    stack: List[str] = []
+    # Where each complete element ends, with the brackets still open there
+    checkpoints: List[Tuple[int, List[str]]] = []
+    closer: Optional[str] = None
+    i = 0
+
+    while i < len(text):
+        char = text[i]
+        if closer is not None:
+            if char == "\\" and i + 1 < len(text):
+                out.append(text[i : i + 2])
+                i += 2
+                continue
+            if char == closer or (closer == "\u201d" and char == "\u201c"):
+                out.append('"' if closer not in "'\"" else closer)
+                closer = None
+            elif char == "\n":
+                out.append("\\n")
+            elif char == '"' and closer not in "'\"":
+                out.append('\\"')
+            else:
+                out.append(char)
+        elif char in _QUOTES:
+            closer = _QUOTES[char]
+            out.append(char if char in "'\"" else '"')
+        elif char in _BRACKETS:
+            stack.append(_BRACKETS[char])
+            out.append(char)
+        elif char in "}])":
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+            checkpoints.append((len(out), list(stack)))
+        elif char == ",":
+            out.append(char)
+            checkpoints.append((len(out) - 1, list(stack)))
+        elif char.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_JSON_WORDS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    if not stack:
+        return ["".join(out)]
+
+    candidates = []
+    if closer is None:
+        candidates.append("".join(out).rstrip().rstrip(",:") + "".join(reversed(stack)))
+    for length, open_brackets in reversed(checkpoints):
+        body = "".join(out[:length]).rstrip().rstrip(",:")
+        candidates.append(body + "".join(reversed(open_brackets)))
+    return candidates
+
+
+def parse_literal(text: str, kind: Optional[type] = None) -> Any:
+    """
+    Parse a dict, list or JSON literal written by an LLM. Well-formed input goes
+    straight through ``json.loads`` or ``ast.literal_eval``; otherwise trailing
+    commas, single or smart quotes, JSON keywords, trailing prose and truncated
+    endings are repaired locally. Raises ValueError if nothing parses or the
+    result is not a ``kind``.
+    """
+    text = text.strip()
+    missing = object()
+    result = missing
+
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            result = parse(text)
+            break
+        except (ValueError, SyntaxError, TypeError, RecursionError, MemoryError):
+            continue
+
+    if result is missing:
+        for candidate in _repair_literal(text):
+            try:
+                result = ast.literal_eval(candidate)
+                break
+            except (ValueError, SyntaxError, TypeError, RecursionError, MemoryError):
+                continue
+
+    if result is missing:
+        raise ValueError(f"Could not parse a literal from: {text[:200]}")
+    if kind is not None and not isinstance(result, kind):
+        raise ValueError(f"Expected {kind.__name__}, got {type(result).__name__}.")
+    return result
 
 
 def extract_list(input_str: str) -> list:
     # Safely evaluate the input string to generate the list, ensuring all elements are strings
-    extracted_list = ast.literal_eval(input_str)
+    extracted_list = parse_literal(input_str, list)
     if not all(isinstance(item, str) for item in extracted_list):
         raise ValueError("All elements in the list must be strings.")
     return extracted_list
@@ -92,18 +224,10 @@ def extract_list(input_str: str) -> list:
     and min_len <= len(result) <= max_len,
     "Dictionary size must be within min_len and max_len, and all keys and values must be strings.",
 )
-async def create_dict(prompt, min_len=1, max_len=20, **kwargs) -> dict:
-    # Explicit instructions without line breaks within the dictionary
-    instructions = dedent(
-        f"""Create a Python dictionary where both keys and values are strings.
-The dictionary should have a minimum size of {min_len} and a maximum size of {max_len}.
-It should be formatted according to PEP8 guidelines with no line breaks within the dictionary.
-The dictionary should be based on the prompt: \n\n```prompt\n\n{prompt}\n\n```\n\n
-Please complete the following code block:
-```python
-from typing import Dict
-perfect_str_dict: Dict[str, str] = {{"""
-    )
+async def create_dict(
+    prompt, min_len=1, max_len=20, parse_in_pool: bool = None, **kwargs
+) -> dict:
+    instructions = _dict_instructions(prompt, min_len, max_len)
 
     result = await acreate(
         prompt=instructions,
@@ -114,7 +238,9 @@ perfect_str_dict: Dict[str, str] = {{"""
 
     try:
         # Extract the dictionary and validate its keys and values are strings
-        extracted_dict = extract_dict("{" + result.replace("\n", ""))
+        extracted_dict = await run_parser(
+            extract_dict, "{" + result.replace("\n", ""), in_pool=parse_in_pool
+        )
         return extracted_dict
     except (ValueError, SyntaxError) as e:
         loguru.logger.warning(f"Invalid dictionary generated: {e} {result}")
@@ -137,14 +263,217 @@ perfect_str_dict: Dict[str, str] = {{"""
             max_tokens=2000,
             **kwargs,
         )
-        return extract_dict("{" + fixed_dict.replace("\n", ""))
+        return await run_parser(
+            extract_dict, "{" + fixed_dict.replace("\n", ""), in_pool=parse_in_pool
+        )
+
+
+def _dict_instructions(prompt, min_len, max_len) -> str:
+    # Explicit instructions without line breaks within the dictionary
+    return dedent(
+        f"""Create a Python dictionary where both keys and values are strings.
+The dictionary should have a minimum size of {min_len} and a maximum size of {max_len}.
+It should be formatted according to PEP8 guidelines with no line breaks within the dictionary.
+The dictionary should be based on the prompt: \n\n```prompt\n\n{prompt}\n\n```\n\n
+Please complete the following code block:
+```python
+from typing import Dict
+perfect_str_dict: Dict[str, str] = {{"""
+    )
 
 
 def extract_dict(input_str: str) -> dict:
     # Safely evaluate the input string to generate the dictionary, ensuring all keys and values are strings
-    input_str = autopep8.fix_code(input_str).strip()
-    extracted_dict = ast.literal_eval(input_str)
-    return extracted_dict
+    return parse_literal(input_str, dict)
+
+
+class LiteralStreamParser:
+    """
+    Parses a list or dict literal as it streams in. ``feed`` returns the elements
+    (or ``(key, value)`` pairs) each chunk completes; text before the opening
+    bracket and after the closing one is ignored.
+    """
+
+    def __init__(self):
+        self.kind: Optional[type] = None
+        self.done = False
+        self._element: List[str] = []
+        self._depth = 0
+        self._closer: Optional[str] = None
+        self._escaped = False
+
+    def feed(self, text: str) -> list:
+        items = []
+        for char in text:
+            if self.done:
+                break
+            if self._closer is not None:
+                self._element.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self._closer or (self._closer == "\u201d" and char == "\u201c"):
+                    self._closer = None
+            elif self._depth == 0:
+                if char in "[{":
+                    self.kind = list if char == "[" else dict
+                    self._depth = 1
+            elif char in _QUOTES:
+                self._closer = _QUOTES[char]
+                self._element.append(char)
+            elif char in "}])" and self._depth == 1:
+                self.done = True
+                items += self._flush()
+            elif char == "," and self._depth == 1:
+                items += self._flush()
+            else:
+                self._depth += char in _BRACKETS
+                self._depth -= char in "}])"
+                self._element.append(char)
+        return items
+
+    def close(self) -> list:
+        """
+        The last element of a stream that stopped without a closing bracket. An
+        element cut off inside a string or bracket is dropped.
+        """
+        if self.done or self._closer is not None or self._depth != 1:
+            return []
+        return self._flush()
+
+    def _flush(self) -> list:
+        text = "".join(self._element).strip()
+        self._element = []
+        if not text:
+            return []
+        try:
+            if self.kind is dict:
+                return list(parse_literal("{" + text + "}", dict).items())
+            return parse_literal("[" + text + "]", list)[:1]
+        except ValueError:
+            loguru.logger.warning(f"Skipping unparseable element: {text}")
+            return []
+
+
+async def _stream_literal(
+    instructions: str, opening: str, valid: Callable[[Any], bool], max_len: int, **kwargs
+) -> AsyncIterator[Any]:
+    parser = LiteralStreamParser()
+    parser.feed(opening)
+    count = 0
+    stream = acreate_stream(prompt=instructions, **kwargs)
+    try:
+        async for chunk in stream:
+            for item in parser.feed(chunk):
+                if not valid(item):
+                    loguru.logger.warning(f"Skipping invalid element: {item!r}")
+                    continue
+                yield item
+                count += 1
+                if count >= max_len:
+                    return
+            if parser.done:
+                return
+        for item in parser.close():
+            if valid(item):
+                yield item
+    finally:
+        # Closing the stream early cancels the request, so no more tokens are paid for
+        await stream.aclose()
+
+
+@require(lambda prompt: isinstance(prompt, str))
+async def create_list_stream(prompt, min_len=1, max_len=20, **kwargs) -> AsyncIterator[str]:
+    """
+    ``create_list`` that yields each string as soon as it has streamed in and
+    stops the request once ``max_len`` strings have arrived. Raises
+    ``icontract.ViolationError`` if fewer than ``min_len`` arrive.
+    """
+    count = 0
+    async for item in _stream_literal(
+        _list_instructions(prompt, min_len, max_len),
+        '["',
+        lambda item: isinstance(item, str),
+        max_len,
+        stop=["```", "\n\n"],
+        max_tokens=2000,
+        **kwargs,
+    ):
+        count += 1
+        yield item
+
+    if count < min_len:
+        raise ViolationError(
+            f"List length must be within min_len and max_len, got {count} of {min_len}..{max_len}."
+        )
+
+
+@require(lambda prompt: isinstance(prompt, str))
+async def create_dict_stream(
+    prompt, min_len=1, max_len=20, **kwargs
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    ``create_dict`` that yields ``(key, value)`` pairs as they stream in and stops
+    the request once ``max_len`` pairs have arrived. Raises
+    ``icontract.ViolationError`` if fewer than ``min_len`` arrive.
+    """
+    count = 0
+    async for pair in _stream_literal(
+        _dict_instructions(prompt, min_len, max_len),
+        "{",
+        lambda pair: isinstance(pair[0], str) and isinstance(pair[1], str),
+        max_len,
+        stop=["```", "\n\n"],
+        max_tokens=3000,
+        **kwargs,
+    ):
+        count += 1
+        yield pair
+
+    if count < min_len:
+        raise ViolationError(
+            f"Dictionary size must be within min_len and max_len, got {count} of {min_len}..{max_len}."
+        )
+
+
+BENCHMARK_SAMPLES = [
+    "{'name': 'Ada', 'langs': ['python', 'c'], 'active': True}",
+    '{"name": "Ada", "langs": ["python", "c",], "active": true,}',
+    "{\u201cname\u201d: \u201cAda\u201d, \u201cnote\u201d: \u201cit\u2019s fine\u201d} Here is my reasoning...",
+    '{"title": "Report", "sections": ["intro", "methods", "resu',
+]
+
+
+def benchmark_parse_literal(samples: List[str] = None, number: int = 50) -> dict:
+    """
+    Mean seconds per sample for the old autopep8 + ``ast.literal_eval`` path and
+    for ``parse_literal``, plus how many samples each one parsed.
+    """
+    import autopep8
+
+    def legacy(text):
+        return ast.literal_eval(autopep8.fix_code(text).strip())
+
+    samples = samples or BENCHMARK_SAMPLES
+    report = {}
+    for name, parse in (("autopep8", legacy), ("parse_literal", parse_literal)):
+        parsed = 0
+        started = time.perf_counter()
+        for _ in range(number):
+            for text in samples:
+                try:
+                    parse(text)
+                    parsed += 1
+                except (ValueError, SyntaxError):
+                    pass
+        elapsed = time.perf_counter() - started
+        report[name] = {
+            "seconds_per_call": elapsed / (number * len(samples)),
+            "parsed": parsed // number,
+        }
+    report["samples"] = len(samples)
+    return report
 
 
 # To run the code, you can use asyncio
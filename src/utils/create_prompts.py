@@ -1,9 +1,7 @@
 import ast
-import inspect
 import json
-from json import JSONDecodeError
 from textwrap import dedent
-from typing import Callable
+from typing import Any, Callable, List
 
 import anyio
 import inflection
@@ -13,15 +11,25 @@ from icontract import require, ensure
 
 from typetemp.template.typed_template import TypedTemplate
 from utils.complete import acreate, achat
+from utils.compress_tools import compress_prompt
 from utils.create_primatives import (
     create_list,
     create_python_primitive,
     create_dict,
     extract_dict,
+    parse_literal,
 )
 from utils.file_tools import write, extract_code
 from utils.models import get_model
 from utils.radon_workbench import fix_code
+from utils.schema_tools import (
+    function_spec,
+    output_token_budget,
+    prompt_schema,
+    record_structured,
+    validate_arguments,
+)
+from utils.token_tools import count_message_tokens, count_tokens
 
 
 async def create_domain_model_from_yaml(
@@ -263,8 +271,10 @@ async def __create(
     temperature=0.0,
     stop=None,
     suffix="",
+    compress=None,
 ):
     model = get_model(model)
+    prompt = await compress_prompt(prompt, compress)
 
     create_prompt = TypedTemplate(
         source=__create_template, prompt=prompt, md_type=md_type, suffix=suffix
@@ -295,16 +305,18 @@ async def __chat(
     filepath=None,
     temperature=0.0,
     model="gpt4",
+    compress=None,
     **kwargs,
 ):
     model = get_model(model)
+    prompt = await compress_prompt(prompt, compress)
 
     prompt = dedent(
         f"""
     {prompt}
     ```{md_type}\n# Here is your PerfectPythonProductionCode® AGI response. Tests have been written to a different file:\n"""
     )
-    result = await achat(prompt=prompt, model=model)
+    result = await achat(prompt=prompt, model=model, max_tokens=max_tokens)
     loguru.logger.info(f"Prompt: {result}")
     loguru.logger.info(f"Result: {result}")
 
@@ -326,7 +338,7 @@ async def spr(
 # INSTRUCTIONS: You are tasked with generating a Sparse Priming Representation (SPR) from the provided text. SPRs encapsulate information in a highly compressed format. Your objective is to condense the given content, focusing on its essence, and represent it within a fraction of its original length. Abide by the following principles:
 
 - Extract core ideas, disregarding specific examples or detailed explanations.
-- Main# Here is your PerfectPythonProductionCode® AGI response.\n\ntain critical relationships and underlying principles.
+- Maintain critical relationships and underlying principles.
 - Use succinct, clear language, aiming for maximum compression with minimum loss of essential content.
 
 Do not include any references or content outside of the given input. 
@@ -584,22 +596,111 @@ async def create_tailwind_landing(
             f.write(markup)
 
 
+STRUCTURED_SYS_MSG = "You fill in function arguments from the user's request. Only call the function."
+# Times invalid arguments are sent back to the model with the errors found
+STRUCTURED_MAX_REASKS = 2
+# Cheapest chat model with function calling; pass ``model`` for a stronger one
+STRUCTURED_MODEL = "3"
+
+
+async def _call_structured(
+    prompt: str,
+    spec: dict,
+    validate: Callable[[dict], Any],
+    model: str = None,
+    max_reasks: int = STRUCTURED_MAX_REASKS,
+    max_tokens: int = None,
+) -> Any:
+    model = get_model(model or STRUCTURED_MODEL)
+    budget = max_tokens or output_token_budget(spec["parameters"])
+    messages = [
+        {"role": "system", "content": STRUCTURED_SYS_MSG},
+        {"role": "user", "content": prompt},
+    ]
+    prompt_tokens = completion_tokens = 0
+    error = None
+
+    for attempt in range(max_reasks + 1):
+        msg = await achat(
+            msgs=messages,
+            funcs=[spec],
+            function_call={"name": spec["name"]},
+            model=model,
+            max_tokens=budget,
+            raw_msg=True,
+        )
+        arguments = (msg.get("function_call") or {}).get("arguments") or msg.get("content") or ""
+        prompt_tokens += count_message_tokens(messages, model) + count_tokens(json.dumps(spec), model)
+        completion_tokens += count_tokens(arguments, model)
+
+        try:
+            result = validate(parse_literal(arguments, dict))
+        except ValueError as e:
+            error = e
+            loguru.logger.warning(f"Invalid {spec['name']} arguments: {e} {arguments}")
+            messages = messages + [
+                {
+                    "role": "assistant",
+                    "content": None,
+                    "function_call": {"name": spec["name"], "arguments": arguments},
+                },
+                {
+                    "role": "user",
+                    "content": f"Those arguments are invalid: {e} Call {spec['name']} again with corrected arguments.",
+                },
+            ]
+            continue
+
+        record_structured(spec["name"], True, attempt, prompt_tokens, completion_tokens)
+        return result
+
+    record_structured(spec["name"], False, max_reasks, prompt_tokens, completion_tokens)
+    raise ValueError(f"No valid {spec['name']} arguments after {max_reasks + 1} attempts: {error}")
+
+
+@require(lambda prompt: isinstance(prompt, str))
+async def create_structured(
+    prompt: str,
+    target: Any,
+    model: str = None,
+    max_reasks: int = STRUCTURED_MAX_REASKS,
+    max_tokens: int = None,
+) -> dict:
+    """
+    Kwargs for ``target`` (a pydantic model, dataclass, class or function) from a
+    prompt. The JSON schema of its signature is sent as a forced function call,
+    the reply is capped to what the schema needs, and arguments that fail local
+    validation are re-asked with the errors. See ``structured_output_stats``.
+    """
+    spec = function_spec(target)
+    return await _call_structured(
+        f"Fill in {spec['name']} for this request:\n\n{prompt}",
+        spec,
+        lambda arguments: validate_arguments(target, arguments, spec["parameters"]),
+        model=model,
+        max_reasks=max_reasks,
+        max_tokens=max_tokens,
+    )
+
+
 @require(lambda prompt: isinstance(prompt, str))
 @require(lambda cls: issubclass(cls, object))
 @ensure(lambda result, cls: isinstance(result, dict))
-async def create_data(prompt: str, cls: type) -> dict:
+async def create_data(prompt: str, cls: type, structured: bool = False) -> dict:
     """
-    Create a dict of data from a prompt that can be passed to the given class as kwargs
+    Create a dict of data from a prompt that can be passed to the given class as kwargs.
+    With ``structured`` the fields are asked for as a function call on ``STRUCTURED_MODEL``.
     """
+    if structured:
+        return await create_structured(prompt, cls)
 
     instructions = dedent(
         f"""Create a JSON response that contains data corresponding to the class {cls.__name__} based on the prompt.
     The json loads like this: json.loads(response)
     This is going to be used to create an instance of {cls.__name__}. It will crash if you add any additional information.
-    After the JSON, provide a doctoral thesis explaining your thought process.
 
     ```python
-    {inspect.getsource(cls)}
+    {prompt_schema(cls).render()}
     ```
 
     ```prompt
@@ -618,15 +719,10 @@ async def create_data(prompt: str, cls: type) -> dict:
         max_tokens=3000,
     )
 
-    # Safely evaluate to expected type
+    # Repair locally first; only ask the model to fix what cannot be parsed
     try:
-        extracted_dict = json.loads("{" + result.replace("\n", ""))
-
-        if not isinstance(extracted_dict, dict):
-            raise TypeError(f"Expected dict, got {type(extracted_dict)}.")
-
-        return extracted_dict
-    except (SyntaxError, TypeError, JSONDecodeError) as e:
+        return parse_literal("{" + result, dict)
+    except ValueError as e:
         loguru.logger.warning(f"Invalid {cls.__name__} generated: {e} {result}")
         fix_instructions = dedent(
             f"""You are a JSON fixing assistant.
@@ -642,16 +738,19 @@ async def create_data(prompt: str, cls: type) -> dict:
             stop=["```"],
             max_tokens=2000,
         )
-        return json.loads("{" + corrected_result.replace("\n", ""))
+        return parse_literal("{" + corrected_result, dict)
 
 
 @require(lambda prompt: isinstance(prompt, str))
 @require(lambda cabal: isinstance(cabal, Callable))
-@ensure(lambda result, cls: isinstance(result, dict))
-async def create_kwargs(prompt: str, cabal: Callable) -> dict:
+@ensure(lambda result: isinstance(result, dict))
+async def create_kwargs(prompt: str, cabal: Callable, structured: bool = False) -> dict:
     """
-    Create a dict of data from a prompt that can be passed to the given class as kwargs
+    Create a dict of data from a prompt that can be passed to the given class as kwargs.
+    With ``structured`` the fields are asked for as a function call on ``STRUCTURED_MODEL``.
     """
+    if structured:
+        return await create_structured(prompt, cabal)
 
     instructions = dedent(
         f"""
@@ -659,10 +758,9 @@ async def create_kwargs(prompt: str, cabal: Callable) -> dict:
     Do not add any additional information to the JSON. Only use the information provided in the prompt.
     This is going to be used to call of {cabal.__name__}. It will crash if you add any additional information.
     Provide values for all the fields in the class. 
-    After the JSON, provide a doctoral thesis explaining your thought process.
 
     ```python
-    {inspect.getsource(cabal)}
+    {prompt_schema(cabal).render()}
     ```
 
     ```prompt
@@ -681,15 +779,10 @@ async def create_kwargs(prompt: str, cabal: Callable) -> dict:
         max_tokens=250,
     )
 
-    # Safely evaluate to expected type
+    # Repair locally first; only ask the model to fix what cannot be parsed
     try:
-        extracted_dict = extract_dict("{" + result.replace("\n", ""))
-
-        if not isinstance(extracted_dict, dict):
-            raise TypeError(f"Expected dict, got {type(extracted_dict)}.")
-
-        return extracted_dict
-    except (SyntaxError, TypeError, JSONDecodeError) as e:
+        return extract_dict("{" + result)
+    except ValueError as e:
         loguru.logger.warning(f"Invalid {cabal.__name__} generated: {e} {result}")
         fix_instructions = dedent(
             f"""You are a JSON fixing assistant.
@@ -706,20 +799,106 @@ async def create_kwargs(prompt: str, cabal: Callable) -> dict:
             stop=["```"],
             max_tokens=2000,
         )
-        return json.loads("{" + corrected_result.replace("\n", ""))
+        return extract_dict("{" + corrected_result)
+
+
+PYDANTIC_FIELD_TYPES = ["str", "int", "float", "bool", "list", "dict", "tuple", "set"]
+
+
+def _pydantic_class_spec(class_name: str, min_fields: int, max_fields: int) -> dict:
+    field = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string", "description": "snake_case field name"},
+            "type": {"enum": PYDANTIC_FIELD_TYPES},
+            "description": {"type": "string"},
+        },
+        "required": ["name", "type"],
+    }
+    properties = {
+        "docstring": {"type": "string", "description": "One line describing the class"},
+        "fields": {
+            "type": "array",
+            "items": field,
+            "minItems": min_fields,
+            "maxItems": max_fields,
+        },
+    }
+    if not class_name:
+        properties["class_name"] = {
+            "type": "string",
+            "description": "Descriptive, singular CapWords name such as BlogPost or InvoiceItem",
+        }
+    return {
+        "name": "define_pydantic_class",
+        "description": "Define a Pydantic model with primitive field types.",
+        "parameters": {"type": "object", "properties": properties, "required": list(properties)},
+    }
+
+
+def _check_pydantic_class(arguments: dict, min_fields: int, max_fields: int) -> dict:
+    errors = []
+    fields = arguments.get("fields")
+    if not isinstance(fields, list) or not min_fields <= len(fields) <= max_fields:
+        errors.append(f"Give between {min_fields} and {max_fields} fields.")
+        fields = []
+    names = [str(field.get("name", "")) for field in fields if isinstance(field, dict)]
+    if len(names) != len(fields) or len(set(names)) != len(names):
+        errors.append("Every field needs a unique name.")
+    errors += [f"'{name}' is not a valid field name." for name in names if not name.isidentifier()]
+    errors += [
+        f"Field type must be one of {PYDANTIC_FIELD_TYPES}, got {field.get('type')!r}."
+        for field in fields
+        if isinstance(field, dict) and field.get("type") not in PYDANTIC_FIELD_TYPES
+    ]
+    if "class_name" in arguments and not str(arguments["class_name"]).isidentifier():
+        errors.append(f"'{arguments['class_name']}' is not a valid class name.")
+    if errors:
+        raise ValueError(" ".join(errors))
+    return arguments
+
+
+def _render_pydantic_class(class_name: str, docstring: str, fields: List[dict]) -> str:
+    docstring = " ".join(str(docstring).replace('"', "'").split())
+    lines = ["from pydantic import BaseModel", "", "", f"class {class_name}(BaseModel):"]
+    lines += [f'    """{docstring}"""', ""]
+    for field in fields:
+        comment = " ".join(str(field.get("description") or "").split())
+        lines.append(f"    {field['name']}: {field['type']}" + (f"  # {comment}" if comment else ""))
+    return "\n".join(lines) + "\n"
 
 
 async def create_pydantic_class(
-    prompt: str, class_name: str = None, min_fields=2, max_fields=5, file_path=None
+    prompt: str,
+    class_name: str = None,
+    min_fields=2,
+    max_fields=5,
+    file_path=None,
+    structured: bool = False,
 ) -> str:
     """
     Generate a Pydantic class based on a prompt.
     Args:
         prompt (str): The prompt describing the class fields.
         class_name (str): The name for the generated Pydantic class.
+        structured (bool): Ask for the fields as a function call on ``STRUCTURED_MODEL``
+            and write the code locally.
     Returns:
         type: The generated Pydantic class.
     """
+    if structured:
+        arguments = await _call_structured(
+            f"Define a Pydantic class for this prompt:\n\n{prompt}",
+            _pydantic_class_spec(class_name, min_fields, max_fields),
+            lambda arguments: _check_pydantic_class(arguments, min_fields, max_fields),
+        )
+        cls_code = _render_pydantic_class(
+            class_name or arguments["class_name"], arguments["docstring"], arguments["fields"]
+        )
+        if file_path:
+            await write(contents=cls_code, filename=file_path)
+        return cls_code
+
     if not class_name:
         name_prompt = f"""You are a Pydantic class naming assistant.
         Be Descriptive: Choose a name that describes what the model represents. For example, User, BlogPost, Invoice. Avoid generic names like Data or Model.
@@ -814,9 +993,6 @@ async def create_git_patch(prompt: str, max_tokens=2500, model=None, filepath=No
     return result
 
 
-import anyio
-
-
 async def main2():
     prompt = """ADSC is a key Scriptcase Partner for Canada. Scriptcase is a strong
     Business Intelligence & Web Application Code Generator platform used by
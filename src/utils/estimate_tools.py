@@ -0,0 +1,230 @@
+import functools
+import inspect
+import json
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.complete import DEFAULT_METRICS_PATH, current_caller, metrics
+from utils.journal_tools import as_journal
+from utils.llm_scheduler import scheduler
+from utils.models import request_cost, router
+from utils.providers import MockProvider, use_provider
+from utils.rate_limiter import DEFAULT_COMPLETION_ESTIMATE, count_prompt_tokens
+
+# Seconds assumed per request for models with no recorded latency
+DEFAULT_LATENCY = 2.0
+
+NUMBERED_ITEM = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+def load_latencies(path: str = None) -> Dict[str, float]:
+    """
+    Mean request latency per model from the metrics summary the CLIs write at exit,
+    merged with the metrics recorded so far in this process.
+    """
+    path = path or os.getenv("AISMT_METRICS_FILE") or DEFAULT_METRICS_PATH
+    histograms = []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            histograms += json.load(f)["histograms"].get("llm_request_duration_seconds", [])
+    histograms += metrics.snapshot()["histograms"].get("llm_request_duration_seconds", [])
+
+    totals: Dict[str, Tuple[float, int]] = {}
+    for series in histograms:
+        model = series["labels"].get("model")
+        seconds, count = totals.get(model, (0.0, 0))
+        totals[model] = (seconds + series["sum"], count + series["count"])
+
+    return {model: seconds / count for model, (seconds, count) in totals.items() if count}
+
+
+@dataclass
+class EstimateRow:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    seconds: float = 0.0
+
+    def add(self, other: "EstimateRow") -> None:
+        self.requests += other.requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cost += other.cost
+        self.seconds += other.seconds
+
+
+class Estimate:
+    """
+    Requests, tokens, dollars and seconds a dry run would have spent, broken down
+    by caller (the workflow task or module) and model. Completion tokens are the
+    requested ``max_tokens``, so tokens and cost are upper bounds.
+    """
+
+    def __init__(self, latencies: Dict[str, float] = None):
+        self.rows: Dict[Tuple[str, str], EstimateRow] = {}
+        self.latencies = load_latencies() if latencies is None else latencies
+        self.errors: List[str] = []
+        # Workflow tasks left out of a dry run because they may have side effects
+        self.skipped: List[str] = []
+
+    def latency(self, model: str) -> float:
+        if model in self.latencies:
+            return self.latencies[model]
+        live = router.latency_quantile(model, 0.5)
+        return DEFAULT_LATENCY if live is None else live
+
+    def add(self, caller: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        row = self.rows.setdefault((caller, model), EstimateRow())
+        row.add(
+            EstimateRow(
+                requests=1,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost=request_cost(model, prompt_tokens, completion_tokens),
+                seconds=self.latency(model),
+            )
+        )
+
+    @property
+    def total(self) -> EstimateRow:
+        total = EstimateRow()
+        for row in self.rows.values():
+            total.add(row)
+        return total
+
+    @property
+    def wall_seconds(self) -> float:
+        """
+        Rough wall time with the scheduler's full concurrency in use.
+        """
+        return self.total.seconds / max(1, scheduler.max_concurrency)
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": [
+                {"caller": caller, "model": model, **asdict(row)}
+                for (caller, model), row in self.rows.items()
+            ],
+            "total": asdict(self.total),
+            "wall_seconds": self.wall_seconds,
+            "errors": self.errors,
+            "skipped": self.skipped,
+        }
+
+    def render(self) -> str:
+        header = (
+            f"{'caller':<40} {'model':<28} {'requests':>8} {'prompt':>9} "
+            f"{'completion':>10} {'cost $':>9} {'seconds':>9}"
+        )
+        lines = [header, "-" * len(header)]
+
+        def line(caller: str, model: str, row: EstimateRow) -> str:
+            return (
+                f"{caller[:40]:<40} {model[:28]:<28} {row.requests:>8} {row.prompt_tokens:>9} "
+                f"{row.completion_tokens:>10} {row.cost:>9.4f} {row.seconds:>9.1f}"
+            )
+
+        for (caller, model), row in sorted(self.rows.items()):
+            lines.append(line(caller, model, row))
+        lines.append("-" * len(header))
+        lines.append(line("total", "", self.total))
+        lines.append(
+            f"Estimated wall time at {scheduler.max_concurrency} concurrent calls: "
+            f"{self.wall_seconds:.1f}s"
+        )
+        lines += [f"Skipped (may have side effects): {name}" for name in self.skipped]
+        lines += [f"Stopped early: {error}" for error in self.errors]
+        return "\n".join(lines)
+
+
+def estimate_reply(prompt: str, params: dict) -> str:
+    # Answer numbered prompt_filter requests in full so they are not re-asked
+    if prompt.rstrip().endswith("Answers:"):
+        numbers = NUMBERED_ITEM.findall(prompt)
+        return " ".join(f"{number}:T" for number in numbers)
+    return MockProvider.default_reply(prompt, params)
+
+
+class EstimateProvider(MockProvider):
+    """
+    Answers instantly with mock replies and records each request in an ``Estimate``.
+    """
+
+    name = "estimate"
+
+    def __init__(self, report: Estimate, reply: Callable[[str, dict], str] = None):
+        super().__init__(reply=reply or estimate_reply)
+        self.replies_arguments = reply is not None
+        self.report = report
+
+    def _record(self, params: dict) -> None:
+        prompt = params.get("prompt")
+        choices = len(prompt) if isinstance(prompt, list) else 1
+        completion = (params.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE) * choices
+        self.report.add(
+            current_caller(), params["model"], count_prompt_tokens(params), completion
+        )
+
+    def complete(self, endpoint, params):
+        self._record(params)
+        return super().complete(endpoint, params)
+
+    async def acomplete(self, endpoint, params):
+        self._record(params)
+        return await super().acomplete(endpoint, params)
+
+    def stream(self, endpoint, params, on_headers=None):
+        self._record(params)
+        return super().stream(endpoint, params, on_headers)
+
+    def astream(self, endpoint, params, on_headers=None):
+        self._record(params)
+        return super().astream(endpoint, params, on_headers)
+
+
+@contextmanager
+def estimating(report: Optional[Estimate] = None):
+    """
+    Send the LLM calls made inside the block to an ``EstimateProvider`` and yield
+    the ``Estimate`` they add up to. No API request is made.
+    """
+    report = report or Estimate()
+    with use_provider(EstimateProvider(report)):
+        yield report
+
+
+def dry_runnable(func):
+    """
+    Give an async prompt_* helper a ``dry_run`` keyword. A dry run prints and
+    returns the ``Estimate`` for the call instead of its result, counting only the
+    items its journal has not finished yet. Nothing is written to an
+    ``output_path`` the helper takes.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, dry_run: bool = False, **kwargs):
+        if not dry_run:
+            return await func(*args, **kwargs)
+
+        # Placeholder replies must not overwrite the caller's output file
+        if "output_path" in signature.parameters:
+            bound = signature.bind_partial(*args, **kwargs)
+            if bound.arguments.get("output_path") is not None:
+                bound.arguments["output_path"] = None
+                args, kwargs = bound.args, bound.kwargs
+
+        # Items the journal already holds are skipped, but nothing is written to it
+        if kwargs.get("journal") is not None:
+            kwargs["journal"] = as_journal(kwargs["journal"]).snapshot()
+
+        with estimating() as report:
+            await func(*args, **kwargs)
+        print(report.render())
+        return report
+
+    return wrapper
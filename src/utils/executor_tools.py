@@ -0,0 +1,60 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# Worker processes for parsing LLM output; defaults to one per core
+DEFAULT_PARSE_WORKERS = int(os.getenv("AISMT_PARSE_WORKERS", os.cpu_count() or 1))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    """
+    The process-wide pool that parsers run in, started on first use. Workers are
+    spawned rather than forked so the locks held by the scheduler and router
+    threads are never copied into a child.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=DEFAULT_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            atexit.register(shutdown_parse_pool)
+        return _pool
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_in_pool_default() -> bool:
+    return os.getenv("AISMT_PARSE_POOL", "").lower() in ("1", "true", "yes")
+
+
+async def run_parser(
+    parser: Callable[..., Any], *args: Any, in_pool: Optional[bool] = None
+) -> Any:
+    """
+    Await ``parser(*args)``. In the pool the event loop keeps serving other
+    responses while the parse runs on another core; ``parser`` and its arguments
+    must be picklable, so pass module-level functions. ``in_pool`` defaults to the
+    ``AISMT_PARSE_POOL`` environment variable.
+    """
+    if in_pool is None:
+        in_pool = parse_in_pool_default()
+    if not in_pool:
+        return parser(*args)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(parse_pool(), parser, *args)
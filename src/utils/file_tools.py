@@ -1,7 +1,10 @@
+import hashlib
 import json
 import re
+from collections import OrderedDict
 from pathlib import Path
 from time import gmtime, strftime
+from typing import List
 
 import anyio
 import openai
@@ -45,6 +48,107 @@ async def gen_extension(
     return filename.split(".")[-1]
 
 
+# Words that never name a file: English filler and common code keywords
+STOPWORDS = frozenset(
+    """
+    a about above after again against all also am an and any are as at be because
+    been before being below between both but by can could did do does doing down
+    during each few for from further had has have having he her here hers him his
+    how i if in into is it its itself just let me more most my no nor not now of off
+    on once only or other our ours out over own same she should so some such than
+    that the their theirs them then there these they this those through to too
+    under until up use used using very was we were what when where which while who
+    whom why will with would you your yours
+    def class import from return self none true false async await print pass elif
+    else lambda yield raise try except finally with global const var function new
+    here please following example write create make generate based text
+    """.split()
+)
+FILENAME_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]*|[^\sA-Za-z0-9_]+")
+# Longest phrase taken whole from the content
+MAX_PHRASE_WORDS = 3
+# Generated names remembered by content hash
+FILENAME_CACHE_SIZE = 1024
+
+_filename_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _candidate_phrases(text: str) -> List[List[str]]:
+    phrases, current = [], []
+    for token in FILENAME_WORD.findall(text):
+        word = token.lower().strip("_")
+        if not word[:1].isalpha() or word in STOPWORDS or len(word) < 2:
+            if current:
+                phrases.append(current)
+            current = []
+            continue
+        current.append(word)
+        if len(current) == MAX_PHRASE_WORDS:
+            phrases.append(current)
+            current = []
+    if current:
+        phrases.append(current)
+    return phrases
+
+
+def keyword_slug(text: str, max_words: int = 5, max_chars: int = 60) -> str:
+    """
+    A lowercase underscore slug of the text's key phrases, ranked RAKE-style:
+    words score by co-occurrence degree over frequency and phrases by the sum of
+    their words. Returns "" when the text has no usable words.
+    """
+    phrases = _candidate_phrases(text)
+    frequency, degree = {}, {}
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] = frequency.get(word, 0) + 1
+            degree[word] = degree.get(word, 0) + len(phrase)
+
+    def score(indexed):
+        index, phrase = indexed
+        return -sum(degree[word] / frequency[word] for word in phrase), index
+
+    words: List[str] = []
+    seen = set()
+    for _, phrase in sorted(enumerate(phrases), key=score):
+        if tuple(phrase) in seen:
+            continue
+        seen.add(tuple(phrase))
+        words += [word for word in phrase if word not in words]
+        if len(words) >= max_words:
+            break
+
+    slug = ""
+    for word in words[:max_words]:
+        candidate = f"{slug}_{word}" if slug else word
+        if len(candidate) > max_chars:
+            break
+        slug = candidate
+    return slug or "_".join(words)[:max_chars]
+
+
+def _remember_filename(key: str, stem: str) -> str:
+    _filename_cache[key] = stem
+    _filename_cache.move_to_end(key)
+    while len(_filename_cache) > FILENAME_CACHE_SIZE:
+        _filename_cache.popitem(last=False)
+    return stem
+
+
+def unique_filename(filename: str, path: str = "") -> str:
+    """
+    ``filename``, or ``name_2.ext``, ``name_3.ext``... if it is taken in ``path``.
+    """
+    stem, dot, extension = filename.rpartition(".")
+    if not dot:
+        stem, extension = filename, ""
+    candidate, number = filename, 1
+    while Path(path + candidate).exists():
+        number += 1
+        candidate = f"{stem}_{number}{dot}{extension}"
+    return candidate
+
+
 @require(lambda prompt: isinstance(prompt, str))
 @ensure(lambda result: isinstance(result, str))
 async def generate_filename(
@@ -56,10 +160,41 @@ async def generate_filename(
     max_chars=60,
     char_limit=300,
     time_stamp=False,
+    use_llm=False,
     **completion_kwargs,
 ) -> str:
+    """
+    Name a file after its contents. The name comes from the content's key phrases
+    unless ``use_llm`` asks the model for one; either way it is remembered by
+    content hash.
+    """
     prompt = prompt[:char_limit]
+    key = hashlib.sha256(f"{use_llm}:{max_chars}:{prompt}".encode("utf-8")).hexdigest()
+
+    if key in _filename_cache:
+        filename = _remember_filename(key, _filename_cache[key])
+    elif use_llm:
+        filename = _remember_filename(key, await _llm_filename(prompt, min_chars, max_chars))
+    else:
+        stem = keyword_slug(prompt, max_chars=max_chars) or f"file_{key[:8]}"
+        filename = _remember_filename(key, stem)
+
+    if prefix:
+        filename = f"{prefix}_{filename}"
+
+    if suffix:
+        filename = f"{filename}_{suffix}"
+
+    if time_stamp:
+        filename = f"{filename}_{strftime('%Y-%m-%d_%H-%M-%S', gmtime())}"
 
+    if extension:
+        filename = f"{filename}.{extension}"
+
+    return filename
+
+
+async def _llm_filename(prompt, min_chars, max_chars) -> str:
     completion_prompt = (
         f"Generate a concise filename based on the text: '{prompt}'. "
         f"The filename should:\n"
@@ -81,21 +216,7 @@ async def generate_filename(
 
     # Post-process the filename
     filename = re.sub(r"[^a-zA-Z0-9_]", "", filename)
-    filename = filename[:max_chars]
-
-    if prefix:
-        filename = f"{prefix}_{filename}"
-
-    if suffix:
-        filename = f"{filename}_{suffix}"
-
-    if time_stamp:
-        filename = f"{filename}_{strftime('%Y-%m-%d_%H-%M-%S', gmtime())}"
-
-    if extension:
-        filename = f"{filename}.{extension}"
-
-    return filename
+    return filename[:max_chars]
 
 
 def extract_filename(text: str, allowed_extensions=None) -> str:
@@ -150,6 +271,7 @@ async def write(
     extension="txt",
     time_stamp=False,
     path="",
+    use_llm=False,
 ):
     if extension == "yaml" or extension == "yml":
         contents = yaml.dump(
@@ -160,8 +282,9 @@ async def write(
 
     if not filename:
         filename = await generate_filename(
-            prompt=contents, extension=extension, time_stamp=time_stamp
+            prompt=contents, extension=extension, time_stamp=time_stamp, use_llm=use_llm
         )
+        filename = unique_filename(filename, path)
 
     async with await anyio.open_file(path + filename, mode=mode) as f:
         await f.write(contents)
@@ -0,0 +1,141 @@
+import copy
+import json
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional, Union
+
+
+# Records written between fsyncs. Each record still reaches the OS as it is
+# written, so only a power loss can lose the unsynced ones.
+JOURNAL_FSYNC_EVERY = 50
+
+
+def _encode(key: Any) -> str:
+    # Tuples and lists encode alike, so tuple keys survive the JSON round trip
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+def _sync_close(f) -> None:
+    if not f.closed:
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+
+class PromptJournal:
+    """
+    Append-only JSONL record of finished prompt_* items. Every line holds a key and
+    either the response or the error it failed with. Reopening the journal loads
+    the keys that have a response, so a restarted job can skip them; failed keys
+    are retried.
+
+    Records are fsynced every ``fsync_every`` writes and when the journal is
+    closed or garbage collected, rather than once per record on the event loop.
+    """
+
+    def __init__(self, path: str, fsync_every: int = JOURNAL_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.responses: Dict[str, Any] = {}
+        self.failures: Dict[str, str] = {}
+        self.read_only = False
+        self._lock = threading.Lock()
+        self._file = None
+        self._closer = None
+        self._unsynced = 0
+
+        if os.path.exists(path):
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            content = f.read()
+
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line torn by a crash mid-write
+                continue
+            key = _encode(entry["key"])
+            if "error" in entry:
+                self.failures[key] = entry["error"]
+            else:
+                self.responses[key] = entry["response"]
+                self.failures.pop(key, None)
+
+        if content and not content.endswith("\n"):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    def _append(self, entry: dict) -> None:
+        if self.read_only:
+            return
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._closer = weakref.finalize(self, _sync_close, self._file)
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        """
+        Fsync and close the file. A later record reopens it.
+        """
+        with self._lock:
+            if self._closer is not None:
+                self._closer()
+            self._file = self._closer = None
+            self._unsynced = 0
+
+    def __enter__(self) -> "PromptJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def snapshot(self) -> "PromptJournal":
+        """
+        A copy that still skips the finished keys but never writes to the file.
+        """
+        view = copy.copy(self)
+        view.responses = dict(self.responses)
+        view.failures = dict(self.failures)
+        view.read_only = True
+        return view
+
+    def __contains__(self, key: Any) -> bool:
+        return _encode(key) in self.responses
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.responses.get(_encode(key), default)
+
+    def record(self, key: Any, response: Any) -> None:
+        self._append({"key": key, "response": response})
+        self.responses[_encode(key)] = response
+        self.failures.pop(_encode(key), None)
+
+    def record_failure(self, key: Any, error: BaseException) -> None:
+        message = f"{type(error).__name__}: {error}"
+        self._append({"key": key, "error": message})
+        self.failures[_encode(key)] = message
+
+
+def as_journal(journal: Union[str, PromptJournal, None]) -> Optional[PromptJournal]:
+    """
+    Accept a journal path or an open ``PromptJournal``.
+    """
+    if journal is None or isinstance(journal, PromptJournal):
+        return journal
+    return PromptJournal(os.fspath(journal))
@@ -0,0 +1,210 @@
+import asyncio
+import enum
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+DEFAULT_MAX_CONCURRENCY = 32
+# Seconds a queued call waits before it is promoted by one priority class
+DEFAULT_AGING = 10.0
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+
+_priority: ContextVar[Optional[Priority]] = ContextVar("llm_priority", default=None)
+
+
+@contextmanager
+def llm_priority(level: Priority):
+    """
+    Run LLM calls made inside the block, including tasks it starts, at ``level``.
+    """
+    token = _priority.set(Priority(level))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    enqueued: float
+    # Counted in ``_queued`` until admitted or cancelled
+    queued: bool = True
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for LLM calls. At most ``max_concurrency`` calls
+    run at once. Queued calls are admitted by priority class and round-robin
+    between callers within a class, so one caller's fan-out cannot crowd out the
+    others. A call that has waited ``aging`` seconds counts as one class more
+    urgent per interval waited, so bulk work is delayed but never starved.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        aging: float = DEFAULT_AGING,
+        default_priority: Priority = Priority.NORMAL,
+    ):
+        self.max_concurrency = max_concurrency
+        self.aging = aging
+        self.default_priority = default_priority
+        self.running = 0
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Waiter]]"] = {
+            level: OrderedDict() for level in Priority
+        }
+        # Waiters still queued, counted as they come and go because every
+        # ``acquire`` checks it
+        self._queued = 0
+        self._admitted = {level: 0 for level in Priority}
+        self._waited = {level: 0.0 for level in Priority}
+        self._lock = threading.Lock()
+
+    def current_priority(self) -> Priority:
+        level = _priority.get()
+        return self.default_priority if level is None else level
+
+    def _next_waiter(self, now: float) -> Optional[_Waiter]:
+        best = None
+        for level, callers in self._queues.items():
+            # Drop waiters that were cancelled while queued
+            for caller in list(callers):
+                waiters = callers[caller]
+                while waiters and waiters[0].future.done():
+                    waiters.popleft()
+                if not waiters:
+                    del callers[caller]
+            if not callers:
+                continue
+
+            oldest = min(waiters[0].enqueued for waiters in callers.values())
+            boost = int((now - oldest) / self.aging) if self.aging else 0
+            if best is None or level - boost < best[0]:
+                best = (level - boost, level)
+
+        if best is None:
+            return None
+
+        callers = self._queues[best[1]]
+        caller, waiters = next(iter(callers.items()))
+        waiter = waiters.popleft()
+        waiter.queued = False
+        self._queued -= 1
+        callers.move_to_end(caller)
+        if not waiters:
+            del callers[caller]
+        return waiter
+
+    def _record(self, level: Priority, waited: float) -> None:
+        with self._lock:
+            self._admitted[level] += 1
+            self._waited[level] += waited
+
+    async def acquire(self, priority: Priority = None, caller: str = "unknown") -> None:
+        level = self.current_priority() if priority is None else Priority(priority)
+        started = time.monotonic()
+
+        with self._lock:
+            if self.running < self.max_concurrency and not self._queued:
+                self.running += 1
+                future = None
+            else:
+                future = asyncio.get_running_loop().create_future()
+                waiter = _Waiter(future, started)
+                self._queues[level].setdefault(caller, deque()).append(waiter)
+                self._queued += 1
+
+        if future is not None:
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    # Still queued: ``_next_waiter`` drops it later without counting it
+                    if waiter.queued:
+                        waiter.queued = False
+                        self._queued -= 1
+                # The slot may have been handed over just before the cancellation
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+
+        self._record(level, time.monotonic() - started)
+
+    def release(self) -> None:
+        with self._lock:
+            waiter = self._next_waiter(time.monotonic())
+            if waiter is None:
+                self.running -= 1
+                return
+
+        # The slot passes straight to the waiter, so ``running`` is unchanged
+        self._hand_over(waiter.future)
+
+    def _hand_over(self, future: asyncio.Future) -> None:
+        loop = future.get_loop()
+        if loop.is_closed():
+            self.release()
+            return
+
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+
+        if current is loop:
+            future.set_result(None)
+        else:
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def _resolve(self, future: asyncio.Future) -> None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = None, caller: str = "unknown"):
+        await self.acquire(priority, caller)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "max_concurrency": self.max_concurrency,
+                "waiting": {
+                    level.name.lower(): sum(len(w) for w in callers.values())
+                    for level, callers in self._queues.items()
+                },
+                "admitted": {
+                    level.name.lower(): count for level, count in self._admitted.items()
+                },
+                "mean_wait": {
+                    level.name.lower(): (
+                        self._waited[level] / self._admitted[level]
+                        if self._admitted[level]
+                        else 0.0
+                    )
+                    for level in Priority
+                },
+            }
+
+
+scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("AISMT_LLM_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+)
@@ -1,10 +1,19 @@
 import datetime
-import random
-from typing import List
-
-from itertools import cycle
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence
+
+from loguru import logger
 from pydantic import BaseModel
 
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+LATENCY_WINDOW = 200
+
 gpt_4_models = [
     "gpt-4",
     "gpt-4-0314",
@@ -61,6 +70,94 @@ best_models = [
     "text-davinci-003",
 ]
 
+# Prompt + completion tokens each model accepts
+model_context_windows = {
+    "gpt-4": 8_192,
+    "gpt-4-0314": 8_192,
+    "gpt-4-0613": 8_192,
+    "gpt-3.5-turbo": 4_096,
+    "gpt-3.5-turbo-0301": 4_096,
+    "gpt-3.5-turbo-0613": 4_096,
+    "gpt-3.5-turbo-16k": 16_384,
+    "gpt-3.5-turbo-16k-0613": 16_384,
+    "gpt-3.5-turbo-instruct": 4_096,
+    "gpt-3.5-turbo-instruct-0914": 4_096,
+    "text-davinci-003": 4_097,
+    "text-davinci-002": 4_097,
+    "davinci-002": 16_384,
+    "babbage-002": 16_384,
+    "davinci-instruct-beta": 2_049,
+    "curie-instruct-beta": 2_049,
+    "text-curie-001": 2_049,
+}
+
+
+def context_window(model: str) -> Optional[int]:
+    """
+    The model's context window in tokens, or None if it is not known here.
+    """
+    return model_context_windows.get(model)
+
+
+def is_completion_model(model: str) -> bool:
+    """
+    True for models served by the legacy completions endpoint, which accepts a
+    list of prompts in one request.
+    """
+    if model.startswith("gpt-4"):
+        return False
+    if model.startswith("gpt-3.5-turbo"):
+        return "instruct" in model
+    return True
+
+
+# Requests and tokens per minute. These are starting points only: the rate
+# limiter corrects them from the x-ratelimit-* response headers.
+DEFAULT_RATE_LIMIT = (3_500, 90_000)
+
+model_rate_limits = {
+    "gpt-4": (200, 10_000),
+    "gpt-4-0314": (200, 10_000),
+    "gpt-4-0613": (200, 10_000),
+    "gpt-3.5-turbo": (3_500, 90_000),
+    "gpt-3.5-turbo-0301": (3_500, 90_000),
+    "gpt-3.5-turbo-0613": (3_500, 90_000),
+    "gpt-3.5-turbo-16k": (3_500, 180_000),
+    "gpt-3.5-turbo-16k-0613": (3_500, 180_000),
+    "gpt-3.5-turbo-instruct": (3_500, 90_000),
+    "gpt-3.5-turbo-instruct-0914": (3_500, 90_000),
+    "text-davinci-003": (3_000, 250_000),
+    "text-davinci-002": (3_000, 250_000),
+}
+
+# USD per 1K prompt and completion tokens
+model_pricing = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-0314": (0.03, 0.06),
+    "gpt-4-0613": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-0301": (0.0015, 0.002),
+    "gpt-3.5-turbo-0613": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-3.5-turbo-16k-0613": (0.003, 0.004),
+    "gpt-3.5-turbo-instruct": (0.0015, 0.002),
+    "gpt-3.5-turbo-instruct-0914": (0.0015, 0.002),
+    "text-davinci-003": (0.02, 0.02),
+    "text-davinci-002": (0.02, 0.02),
+    "davinci-002": (0.002, 0.002),
+    "babbage-002": (0.0004, 0.0004),
+    "text-curie-001": (0.002, 0.002),
+}
+
+
+def request_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Price of a request in USD; 0.0 for models without a known price.
+    """
+    prompt_price, completion_price = model_pricing.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
 # 2k max tokens
 ok_models = [
     "text-davinci-002",
@@ -133,60 +230,200 @@ all_models = [
 ]
 
 
-def round_robin_ok_models():
-    models = cycle(ok_models)
-
-    while True:
-        yield next(models)
-
-
-def round_robin_gpt_4_models():
-    models = cycle(gpt_4_models)
-
-    random.shuffle(gpt_4_models)
-
-    while True:
-        yield next(models)
-
-
-def round_robin_instruct_models():
-    models = cycle(instruct_models)
-
-    while True:
-        yield next(models)
-
-
-def round_robin_best_models():
-    models = cycle(best_models)
-
-    while True:
-        yield next(models)
-
-
-def round_robin_turbo_models():
-    models = cycle(turbo_models)
-
-    while True:
-        yield next(models)
+@dataclass
+class ModelStats:
+    """
+    Health and load statistics for a single model.
+    """
+
+    weight: float = 1.0
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy(now),
+            "p50_latency": self.latency_quantile(0.5),
+            "p95_latency": self.latency_quantile(0.95),
+        }
+
+
+class ModelRouter:
+    """
+    Stateful load balancer over the model pools. Picks the model with the fewest
+    outstanding requests relative to its weight, rotating between ties so idle
+    pools are served round-robin. A circuit breaker ejects a model after
+    ``failure_threshold`` consecutive 429/5xx responses and lets it back in once
+    ``cooldown`` seconds have passed.
+    """
+
+    def __init__(
+        self,
+        pools: Dict[str, Sequence[str]] = None,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+    ):
+        self.pools = pools or {
+            "best": best_models,
+            "ok": ok_models,
+            "gpt4": gpt_4_models,
+            "turbo": turbo_models,
+            "instruct": instruct_models,
+        }
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._stats: Dict[str, ModelStats] = {}
+        self._cursor = itertools.count()
+        self._lock = threading.Lock()
+
+    def _stats_for(self, model: str) -> ModelStats:
+        if model not in self._stats:
+            self._stats[model] = ModelStats()
+        return self._stats[model]
+
+    def set_weight(self, model: str, weight: float) -> None:
+        if weight <= 0:
+            raise ValueError(f"Weight for {model} must be positive, got {weight}")
+        with self._lock:
+            self._stats_for(model).weight = weight
+
+    def pick(self, models: Sequence[str]) -> str:
+        """
+        Choose a model from ``models``, skipping ejected ones while any are healthy.
+        """
+        if not models:
+            raise ValueError("Cannot pick from an empty model list.")
+
+        with self._lock:
+            now = time.monotonic()
+            candidates = [m for m in models if self._stats_for(m).healthy(now)]
+            candidates = candidates or list(models)
+
+            offset = next(self._cursor) % len(candidates)
+            rotated = candidates[offset:] + candidates[:offset]
+
+            return min(
+                rotated,
+                key=lambda m: self._stats[m].in_flight / self._stats[m].weight,
+            )
+
+    def route(self, alias: str) -> str:
+        return self.pick(self.pools[alias])
+
+    def alternate(self, model: str) -> Optional[str]:
+        """
+        A healthy model other than ``model`` from any pool that contains it and
+        is served by the same endpoint, or None if there is none.
+        """
+        completion = is_completion_model(model)
+        siblings = {
+            m: None
+            for pool in self.pools.values()
+            if model in pool
+            for m in pool
+            if m != model and is_completion_model(m) == completion
+        }
+
+        with self._lock:
+            now = time.monotonic()
+            healthy = [m for m in siblings if self._stats_for(m).healthy(now)]
+
+        return self.pick(healthy) if healthy else None
+
+    def latency_quantile(self, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        The ``q`` quantile of recent successful latencies for ``model``, or None
+        while fewer than ``min_samples`` have been recorded.
+        """
+        with self._lock:
+            stats = self._stats_for(model)
+            if len(stats.latencies) < min_samples:
+                return None
+            return stats.latency_quantile(q)
+
+    def begin(self, model: str) -> float:
+        with self._lock:
+            self._stats_for(model).in_flight += 1
+        return time.monotonic()
+
+    def end(self, model: str, started: float, error: Exception = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.in_flight -= 1
+            stats.requests += 1
+
+            if error is None:
+                stats.consecutive_failures = 0
+                stats.latencies.append(now - started)
+                return
+
+            status = getattr(error, "status_code", None)
+            if status is None or (status != 429 and status < 500):
+                return
+
+            stats.failures += 1
+            stats.consecutive_failures += 1
+
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.ejected_until = now + self.cooldown
+                # Half-open: a single failure after the cooldown ejects it again
+                stats.consecutive_failures = self.failure_threshold - 1
+                logger.warning(
+                    f"Ejecting {model} for {self.cooldown:.0f}s after repeated {status} responses"
+                )
+
+    @contextmanager
+    def track(self, model: str):
+        """
+        Count a request against ``model`` for load balancing and health tracking.
+        """
+        started = self.begin(model)
+        try:
+            yield
+        except BaseException as oops:  # Cancellation must release the slot too
+            self.end(model, started, oops)
+            raise
+        else:
+            self.end(model, started)
+
+    def stats(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {model: stats.as_dict(now) for model, stats in self._stats.items()}
+
+
+router = ModelRouter()
 
 
 def get_model(model):
-    if model == "best":
-        return next(round_robin_best_models())
-    elif model == "ok":
-        return next(round_robin_ok_models())
-    elif model == "gpt4":
-        return next(round_robin_gpt_4_models())
+    if model in ("best", "ok", "gpt4", "turbo"):
+        return router.route(model)
     elif model == "3":
         return "gpt-3.5-turbo-0613"
     elif model == "3i":
         return "gpt-3.5-turbo-instruct"
     elif model == "4":
         return "gpt-4-0613"
-    elif model == "turbo":
-        return next(round_robin_turbo_models())
     elif not model:
-        return next(round_robin_instruct_models())
+        return router.route("instruct")
     else:
         return model
 
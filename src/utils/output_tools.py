@@ -1,3 +1,6 @@
+from typing import AsyncIterator
+
+import anyio
 import pyperclip
 import typer
 
@@ -6,24 +9,58 @@ from utils.file_tools import write
 
 
 async def handle_output(
-    config: OptionConfig
+    config: OptionConfig, stream: AsyncIterator[str] = None
 ) -> None:
     output = config.output_file
-    response = config.response
     auto_output = config.auto_save
 
     mode = "a+" if config.append_to_output else "w"
 
-    if output:
-        await write(response, filename=output, mode=mode)
+    if stream is not None:
+        # Write each chunk to the output file (or stdout) as it arrives
+        config.response = await _consume_stream(stream, config, mode)
+    elif output:
+        await write(config.response, filename=output, mode=mode)
+
+    response = config.response
+
     if auto_output:
         config.output_file = await write(response, extension=config.file_extension)
 
     pyperclip.copy(response)
 
     if config.verbose:
-        typer.echo(f"Output: {response}")
+        if stream is None:
+            typer.echo(f"Output: {response}")
         if output:
             typer.echo(f"Output saved to {output}")
         if auto_output:
             typer.echo(f"Output saved to {config.output_file}")
+
+
+async def _consume_stream(
+    stream: AsyncIterator[str], config: OptionConfig, mode: str
+) -> str:
+    chunks = []
+    echo = config.verbose or not config.output_file
+    sink = None
+
+    if config.output_file:
+        sink = await anyio.open_file(config.output_file, mode=mode)
+
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            if sink:
+                await sink.write(chunk)
+                await sink.flush()
+            if echo:
+                typer.echo(chunk, nl=False)
+    finally:
+        if sink:
+            await sink.aclose()
+
+    if echo:
+        typer.echo()
+
+    return "".join(chunks).strip()
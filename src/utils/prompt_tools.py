@@ -1,14 +1,62 @@
+import asyncio
+import contextlib
+import csv
 import functools
+import hashlib
 import itertools
+import math
+import re
 import time
 
 # import anyio
-from typing import Iterable, List, Dict
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from icontract import ensure, require
 
-from utils.complete import acreate
-from utils.models import ok_models, instruct_models, get_model
+from utils.complete import (
+    DEFAULT_BATCH_SIZE,
+    acreate,
+    acreate_many,
+    caller_scope,
+    current_caller,
+    with_caller,
+)
+from utils.compress_tools import compress_prompt
+from utils.estimate_tools import dry_runnable
+from utils.executor_tools import run_parser
+from utils.journal_tools import PromptJournal, as_journal
+from utils.llm_scheduler import Priority, llm_priority
+from utils.models import (
+    get_model,
+    instruct_models,
+    is_completion_model,
+    ok_models,
+    router,
+)
+
+# Calls a scheduler keeps outstanding at once
+DEFAULT_MAX_IN_FLIGHT = 16
+# Completed matrix cells buffered before they are written out
+MATRIX_CHUNK_SIZE = 500
+MATRIX_COLUMNS = ("x", "y", "response")
+# Items numbered into one prompt_filter request
+DEFAULT_FILTER_PACK = 25
+# Values merged per combine call in a tree reduction
+DEFAULT_FAN_IN = 8
+
+Items = Union[Iterable[Any], AsyncIterable[Any]]
 
 
 def timer(func):
@@ -32,6 +80,13 @@ def model_generator(models: List[str]):
     return itertools.cycle(models)
 
 
+def packable(models: List[str]) -> bool:
+    """
+    True if every model in the pool takes a list of prompts per request.
+    """
+    return all(is_completion_model(get_model(model)) for model in models)
+
+
 # 3. OpenAI Call
 async def call_openai(
     prompt: str, model_name: str, max_tokens: int = 50, temperature: float = 0.7
@@ -60,8 +115,208 @@ async def timed_openai_call(
 
 
 # 5. Concurrent Execution
-async def prompt_map(
-    prompts_iterable: Iterable[str],
+async def aiterate(items: Items) -> AsyncIterator[Any]:
+    """
+    Iterate a sync or async iterable asynchronously, one item at a time.
+    """
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def achunked(items: Items, size: int) -> AsyncIterator[List[Any]]:
+    chunk = []
+    async for item in aiterate(items):
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def sliding_window(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Items,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Run ``func`` over ``items`` with at most ``max_in_flight`` calls outstanding,
+    starting the next call as soon as one finishes. Yields ``(index, result)`` in
+    completion order. Items are pulled lazily, so the input may be unbounded.
+    LLM requests made by the calls are attributed to the code iterating the window.
+    """
+    if max_in_flight < 1:
+        raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+    caller = current_caller()
+
+    def spawn(step: Callable[..., Awaitable[Any]], *args) -> asyncio.Future:
+        async def run():
+            with caller_scope(caller):
+                return await step(*args)
+
+        return asyncio.ensure_future(run())
+
+    source = aiterate(items)
+    running: Dict[asyncio.Future, int] = {}
+    pull = None
+    exhausted = False
+    next_index = 0
+
+    try:
+        while True:
+            # The next item is pulled in a task of its own so that a slow async
+            # source never holds up results that are already done
+            if pull is None and not exhausted and len(running) < max_in_flight:
+                pull = spawn(source.__anext__)
+
+            waiting = set(running) | ({pull} if pull else set())
+            if not waiting:
+                return
+
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if pull in done:
+                done.discard(pull)
+                try:
+                    item = pull.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                else:
+                    running[spawn(func, item)] = next_index
+                    next_index += 1
+                pull = None
+
+            for task in done:
+                yield running.pop(task), task.result()
+    finally:
+        for task in running:
+            if not task.done():
+                task.cancel()
+        # The source cannot be closed while a pull is suspended inside it
+        if pull is not None and not pull.done():
+            pull.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await pull
+        await source.aclose()
+
+
+async def gather_window(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Items,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> List[Any]:
+    """
+    ``sliding_window`` collected into a list in input order.
+    """
+    results = {}
+    async for index, result in sliding_window(func, items, max_in_flight):
+        results[index] = result
+    return [results[index] for index in range(len(results))]
+
+
+# Messages passed to tree_reduce's grouping loop
+_ITEM, _RESULT, _END, _ERROR = "item", "result", "end", "error"
+
+
+async def tree_reduce(
+    items: Items,
+    combine: Callable[[List[Any]], Awaitable[Any]],
+    fan_in: int = DEFAULT_FAN_IN,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> Optional[Any]:
+    """
+    Reduce ``items`` to a single value by awaiting ``combine`` on groups of
+    ``fan_in`` values, feeding every result back in until one value is left.
+    Groups are formed as soon as ``fan_in`` values are ready and run through
+    ``sliding_window``, so levels overlap and wall time grows with log(N). Values
+    from different levels may share a group and input order is not kept.
+    Returns None for empty input.
+    """
+    if fan_in < 2:
+        raise ValueError(f"fan_in must be at least 2, got {fan_in}")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    final = []
+
+    async def feed():
+        try:
+            async for item in aiterate(items):
+                await queue.put((_ITEM, item))
+        except Exception as oops:
+            await queue.put((_ERROR, oops))
+        else:
+            await queue.put((_END, None))
+
+    async def groups():
+        ready = []
+        outstanding = 0
+        source_done = False
+
+        while True:
+            while len(ready) >= fan_in:
+                group, ready = ready[:fan_in], ready[fan_in:]
+                outstanding += 1
+                yield group
+
+            if source_done and outstanding == 0 and queue.empty():
+                if len(ready) > 1:
+                    group, ready = ready, []
+                    outstanding += 1
+                    yield group
+                    continue
+                final.extend(ready)
+                return
+
+            kind, value = await queue.get()
+            if kind == _ERROR:
+                raise value
+            if kind == _END:
+                source_done = True
+                continue
+            if kind == _RESULT:
+                outstanding -= 1
+            ready.append(value)
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        async for _, result in sliding_window(combine, groups(), max_in_flight):
+            queue.put_nowait((_RESULT, result))
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+
+    return final[0] if final else None
+
+
+async def aenumerate(items: Items) -> AsyncIterator[Tuple[int, Any]]:
+    index = 0
+    async for item in aiterate(items):
+        yield index, item
+        index += 1
+
+
+# How prompt_map builds each prompt
+PROMPT_TEMPLATE = "{base_prompt} {prefix} {item} {suffix}"
+# How prompt_matrix builds each cell's prompt
+MATRIX_TEMPLATE = "{base_prompt} {item}"
+
+
+def journal_key(index: int, prompt: str) -> str:
+    """
+    Default journal key for a prompt_map item: its position plus a digest of the
+    full prompt, so a changed input or base prompt is not mistaken for done.
+    """
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{index}:{digest}"
+
+
+async def prompt_map_as_completed(
+    prompts_iterable: Items,
     base_prompt: str = "",
     max_tokens: int = 50,
     model_list: List[str] = None,
@@ -69,36 +324,169 @@ async def prompt_map(
     suffix: str = "",
     stop: List[str] = None,
     temperature: float = 0.0,
-) -> List[str]:
-    model_gen = model_generator(model_list or instruct_models)
-    responses = []
+    prompts_per_request: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    journal: Union[str, PromptJournal] = None,
+    key: Callable[[int, str], Any] = journal_key,
+    parser: Callable[[str], Any] = None,
+    compress: Optional[bool] = None,
+    template: str = PROMPT_TEMPLATE,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Like ``prompt_map`` but yields ``(index, response)`` as responses arrive.
+    At most ``max_in_flight`` requests are outstanding at any time.
 
-    async def generate_response(index: int, item: str) -> None:
-        model_name = next(model_gen)
-        prompt = f"{base_prompt} {prefix} {item} {suffix}"
-        print(f"Prompt: {prompt}")
-        response = await acreate(
-            prompt=prompt,
-            model=model_name,
-            max_tokens=max_tokens,
-            stop=stop,
-            temperature=temperature,
+    With a ``journal`` every response is appended to it under ``key(index, prompt)``
+    and items already in it are not sent again. A failed item is recorded in the
+    journal and yielded as None instead of cancelling the rest of the map.
+
+    A ``parser`` (e.g. ``extract_code``) is applied to each response as soon as
+    it arrives. With ``AISMT_PARSE_POOL`` set it runs in the parse process pool,
+    overlapping with the requests still in flight. The journal keeps the raw
+    responses.
+
+    A long ``base_prompt`` is compressed once up front when ``compress`` (or
+    ``AISMT_COMPRESS_PROMPTS``) is on; see ``compress_prompt``. Each prompt is
+    ``template`` filled in with ``base_prompt``, ``prefix``, ``item`` and ``suffix``.
+    """
+    models = model_list or instruct_models
+    journal = as_journal(journal)
+    base_prompt = await compress_prompt(base_prompt, compress)
+
+    async def parse(response: Optional[str]) -> Any:
+        if parser is None or response is None:
+            return response
+        return await run_parser(parser, response)
+
+    def render(item: str) -> str:
+        return template.format(
+            base_prompt=base_prompt, prefix=prefix, item=item, suffix=suffix
         )
-        print(f"Response: {response}")
-        responses.append((index, response))
 
-    async with anyio.create_task_group() as tg:
-        for index, item in enumerate(prompts_iterable):
-            tg.start_soon(generate_response, index, item)
+    def done(item_key) -> bool:
+        return journal is not None and item_key in journal
+
+    if prompts_per_request > 1 and packable(models):
+
+        async def send_batch(batch: List[Tuple[int, str]]) -> List[Optional[str]]:
+            prompts = [render(item) for _, item in batch]
+            keys = [key(index, prompt) for (index, _), prompt in zip(batch, prompts)]
+            responses = [journal.get(k) if done(k) else None for k in keys]
+
+            todo = [i for i, k in enumerate(keys) if not done(k)]
+            if not todo:
+                return await asyncio.gather(*map(parse, responses))
+
+            for i in todo:
+                print(f"Prompt: {prompts[i]}")
+            try:
+                fresh = await acreate_many(
+                    [prompts[i] for i in todo],
+                    models=models,
+                    batch_size=prompts_per_request,
+                    max_tokens=max_tokens,
+                    stop=stop,
+                    temperature=temperature,
+                )
+            except Exception as oops:
+                if journal is None:
+                    raise
+                for i in todo:
+                    journal.record_failure(keys[i], oops)
+                return await asyncio.gather(*map(parse, responses))
+
+            for i, response in zip(todo, fresh):
+                print(f"Response: {response}")
+                responses[i] = response
+                if journal is not None:
+                    journal.record(keys[i], response)
+            return await asyncio.gather(*map(parse, responses))
+
+        batches = achunked(aenumerate(prompts_iterable), prompts_per_request)
+        async for batch_index, responses in sliding_window(
+            send_batch, batches, max_in_flight
+        ):
+            for offset, response in enumerate(responses):
+                yield batch_index * prompts_per_request + offset, response
+        return
+
+    async def send(pair: Tuple[int, str]) -> Optional[str]:
+        index, item = pair
+        prompt = render(item)
+        item_key = key(index, prompt)
+        if done(item_key):
+            return await parse(journal.get(item_key))
+
+        print(f"Prompt: {prompt}")
+        try:
+            response = await acreate(
+                prompt=prompt,
+                model=router.pick(models),
+                max_tokens=max_tokens,
+                stop=stop,
+                temperature=temperature,
+            )
+        except Exception as oops:
+            if journal is None:
+                raise
+            journal.record_failure(item_key, oops)
+            return None
 
-    # Sort the responses by index
-    sorted_responses = [resp for _, resp in sorted(responses)]
+        print(f"Response: {response}")
+        if journal is not None:
+            journal.record(item_key, response)
+        return await parse(response)
 
-    return sorted_responses
+    async for index, response in sliding_window(
+        send, aenumerate(prompts_iterable), max_in_flight
+    ):
+        yield index, response
 
 
+@dry_runnable
+@with_caller
+async def prompt_map(
+    prompts_iterable: Items,
+    base_prompt: str = "",
+    max_tokens: int = 50,
+    model_list: List[str] = None,
+    prefix: str = "",
+    suffix: str = "",
+    stop: List[str] = None,
+    temperature: float = 0.0,
+    prompts_per_request: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    journal: Union[str, PromptJournal] = None,
+    key: Callable[[int, str], Any] = journal_key,
+    parser: Callable[[str], Any] = None,
+    compress: Optional[bool] = None,
+) -> List[Any]:
+    responses = {}
+    async for index, response in prompt_map_as_completed(
+        prompts_iterable,
+        base_prompt=base_prompt,
+        max_tokens=max_tokens,
+        model_list=model_list,
+        prefix=prefix,
+        suffix=suffix,
+        stop=stop,
+        temperature=temperature,
+        prompts_per_request=prompts_per_request,
+        max_in_flight=max_in_flight,
+        journal=journal,
+        key=key,
+        parser=parser,
+        compress=compress,
+    ):
+        responses[index] = response
+
+    return [responses[index] for index in range(len(responses))]
+
+
+@dry_runnable
+@with_caller
 async def batched_prompt_map(
-    prompts_iterable: Iterable[str],
+    prompts_iterable: Items,
     base_prompt: str = "",
     max_tokens: int = 50,
     model_list: List[str] = None,
@@ -107,15 +495,17 @@ async def batched_prompt_map(
     stop: List[str] = None,
     temperature: float = 0.0,
     batch_size: int = 5,
+    journal: Union[str, PromptJournal] = None,
+    parser: Callable[[str], Any] = None,
+    compress: Optional[bool] = None,
 ):
     """
-    This function takes a batch size and kwargs and returns a list of responses.
+    ``prompt_map`` with at most ``batch_size`` requests in flight, queued as bulk
+    work behind interactive calls.
     """
-    responses = []
-    for i in range(0, len(prompts_iterable), batch_size):
-        batch = prompts_iterable[i : i + batch_size]
-        batch_responses = await prompt_map(
-            prompts_iterable=batch,
+    with llm_priority(Priority.BULK):
+        return await prompt_map(
+            prompts_iterable,
             base_prompt=base_prompt,
             max_tokens=max_tokens,
             model_list=model_list,
@@ -123,11 +513,15 @@ async def batched_prompt_map(
             suffix=suffix,
             stop=stop,
             temperature=temperature,
+            max_in_flight=batch_size,
+            journal=journal,
+            parser=parser,
+            compress=compress,
         )
-        responses.extend(batch_responses)
-    return responses
 
 
+@dry_runnable
+@with_caller
 async def prompt_dict(
     prompts_dict: Dict[str, str],
     base_prompt: str = "",
@@ -137,29 +531,33 @@ async def prompt_dict(
     suffix: str = "",
     stop: List[str] = None,
     temperature: float = 0.0,
-) -> Dict[str, str]:
-    model_gen = model_generator(model_list or instruct_models)
+    prompts_per_request: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    journal: Union[str, PromptJournal] = None,
+    parser: Callable[[str], Any] = None,
+    compress: Optional[bool] = None,
+) -> Dict[str, Any]:
+    keys = list(prompts_dict)
     responses = {}
-
-    async def generate_response(key: str, item: str) -> None:
-        model_name = next(model_gen)
-        prompt = f"{base_prompt} {prefix} {item} {suffix}"
-        print(f"Prompt: {prompt}")
-        response = await acreate(
-            prompt=prompt,
-            model=model_name,
-            max_tokens=max_tokens,
-            stop=stop,
-            temperature=temperature,
-        )
-        print(f"Response: {response}")
-        responses[key] = response
-
-    async with anyio.create_task_group() as tg:
-        for key, item in prompts_dict.items():
-            tg.start_soon(generate_response, key, item)
-
-    return responses
+    async for index, response in prompt_map_as_completed(
+        prompts_dict.values(),
+        base_prompt=base_prompt,
+        max_tokens=max_tokens,
+        model_list=model_list,
+        prefix=prefix,
+        suffix=suffix,
+        stop=stop,
+        temperature=temperature,
+        prompts_per_request=prompts_per_request,
+        max_in_flight=max_in_flight,
+        journal=journal,
+        key=lambda index, prompt: keys[index],
+        parser=parser,
+        compress=compress,
+    ):
+        responses[keys[index]] = response
+
+    return {key: responses[key] for key in keys}
 
 
 # [Rest of your functions and example usage]
@@ -175,11 +573,92 @@ async def prompt_dict(
 # print(f"Responses: in {elapsed_time:.2f} seconds.", responses_best_models)
 
 
+# "3:T", "3 = false", "3) yes" ...
+FILTER_ANSWER = re.compile(r"(\d+)\s*[:=.)-]?\s*(true|false|yes|no|t|f|y|n)\b", re.IGNORECASE)
+# Rounds of re-asking for missing answers before items are asked one by one
+FILTER_ROUNDS = 2
+
+
+def filter_request_prompt(base_prompt: str, items: List[str]) -> str:
+    numbered = "\n".join(f"{number}. {item}" for number, item in enumerate(items, 1))
+    return (
+        f"{base_prompt}\n"
+        f"Answer T (true) or F (false) for each numbered item below.\n"
+        f"{numbered}\n"
+        f"Reply on a single line with one answer per item, like: 1:T 2:F 3:T\n"
+        f"Answers:"
+    )
+
+
+def parse_filter_answers(text: str, count: int) -> Dict[int, bool]:
+    """
+    Read a "1:T 2:F ..." answer vector. Returns the 1-based item numbers that got
+    a well-formed answer; the first answer for a number wins.
+    """
+    answers = {}
+    for number, verdict in FILTER_ANSWER.findall(text):
+        number = int(number)
+        if 1 <= number <= count and number not in answers:
+            answers[number] = verdict[0].lower() in ("t", "y")
+    return answers
+
+
+def filter_answer_tokens(count: int) -> int:
+    # Roughly three tokens per "12:T" answer, plus some slack
+    return 3 * count + 4
+
+
+async def _packed_filter_verdicts(
+    base_prompt: str,
+    items: List[str],
+    model_list: List[str],
+    items_per_request: int,
+) -> Dict[int, bool]:
+    verdicts: Dict[int, bool] = {}
+    pending = list(range(len(items)))
+    size = items_per_request
+    sent = set()
+
+    for round_number in range(1 + FILTER_ROUNDS):
+        if not pending:
+            break
+        # Re-asking the same prompt gets the same answer back from the cache or a
+        # temperature 0 model, so each round halves the groups and flips the order
+        if round_number:
+            size = max(1, size // 2)
+        order = pending[::-1] if round_number % 2 else pending
+        groups, prompts = [], []
+        for start in range(0, len(order), size):
+            group = order[start : start + size]
+            prompt = filter_request_prompt(base_prompt, [items[i] for i in group])
+            if prompt not in sent:
+                groups.append(group)
+                prompts.append(prompt)
+        if not prompts:
+            break
+        sent.update(prompts)
+
+        responses = await prompt_map(
+            prompts,
+            max_tokens=filter_answer_tokens(max(len(group) for group in groups)),
+            model_list=model_list,
+        )
+        for group, response in zip(groups, responses):
+            for number, verdict in parse_filter_answers(response, len(group)).items():
+                verdicts[group[number - 1]] = verdict
+        pending = [i for i in pending if i not in verdicts]
+
+    return verdicts
+
+
+@dry_runnable
+@with_caller
 async def prompt_filter(
     base_prompt: str,
     prompts_iterable: Iterable[str],
     model_list: List[str] = None,
     max_tokens: int = 50,
+    items_per_request: int = DEFAULT_FILTER_PACK,
 ) -> List[str]:
     """
     This function takes a base prompt and filters an iterable based on responses from OpenAI.
@@ -188,30 +667,38 @@ async def prompt_filter(
         base_prompt (str): The base prompt for generating boolean responses.
         prompts_iterable (iterable): An iterable (e.g., list, tuple) of strings to be filtered.
         model_list (List[str]): List of models to be used in round-robin fashion. If None, defaults to instruct_models.
-        max_tokens (int): The maximum number of tokens in each response.
+        max_tokens (int): The maximum number of tokens in each per-item response.
+        items_per_request (int): Items numbered into one prompt that is answered with a
+            "1:T 2:F ..." vector. Items whose answer is missing or malformed are asked
+            again, and one at a time as a last resort. Use 1 to ask per item.
 
     Returns:
         list: A list of items from the iterable that pass the condition specified by the prompt.
     """
+    items = list(prompts_iterable)
 
-    filterable = [
-        f"Create a Python bool based on the prompt: '{prompt}'."
-        f"\nPlease complete the following code block:\n"
-        f"```python\n"
-        f"from typing import bool\n"
-        f"# {prompt} \n"
-        f"perfect_bool: bool = "
-        for prompt in prompts_iterable
-    ]
+    verdicts = {}
+    if items_per_request > 1:
+        verdicts = await _packed_filter_verdicts(
+            base_prompt, items, model_list, items_per_request
+        )
 
-    responses = await prompt_map(filterable, base_prompt, max_tokens, model_list)
-    results = [
-        item
-        for item, resp in zip(prompts_iterable, responses)
-        if "true" in resp.lower()
-    ]
+    remaining = [i for i in range(len(items)) if i not in verdicts]
+    if remaining:
+        filterable = [
+            f"Create a Python bool based on the prompt: '{items[i]}'."
+            f"\nPlease complete the following code block:\n"
+            f"```python\n"
+            f"from typing import bool\n"
+            f"# {items[i]} \n"
+            f"perfect_bool: bool = "
+            for i in remaining
+        ]
+        responses = await prompt_map(filterable, base_prompt, max_tokens, model_list)
+        for i, resp in zip(remaining, responses):
+            verdicts[i] = "true" in resp.lower()
 
-    return results
+    return [item for i, item in enumerate(items) if verdicts[i]]
 
 
 filter_prompt = "Is the statement in quotes positive?"
@@ -232,12 +719,43 @@ from typing import Callable, Iterable, List
 import anyio
 
 
+@with_caller
+async def prompt_tree_reduce(
+    texts: Items,
+    combine_prompt: str,
+    fan_in: int = DEFAULT_FAN_IN,
+    model_list: List[str] = None,
+    max_tokens: int = 250,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> Optional[str]:
+    """
+    Merge ``texts`` into one with an LLM, asking ``combine_prompt`` over numbered
+    groups of ``fan_in`` texts at a time (see ``tree_reduce``).
+    """
+    models = model_list or instruct_models
+
+    async def combine(group: List[str]) -> str:
+        numbered = "\n\n".join(f"{n}. {text}" for n, text in enumerate(group, 1))
+        return await acreate(
+            prompt=f"{combine_prompt}\n\n{numbered}\n\n",
+            model=router.pick(models),
+            max_tokens=max_tokens,
+        )
+
+    return await tree_reduce(texts, combine, fan_in, max_in_flight)
+
+
+@dry_runnable
+@with_caller
 async def prompt_reduce(
     base_prompt: str,
     prompts_iterable: Iterable[str],
-    reducer: Callable[[List[str]], List[str]],
+    reducer: Callable[[List[str]], List[str]] = None,
     model_list: List[str] = None,
     max_tokens: int = 50,
+    combine_prompt: str = None,
+    fan_in: int = DEFAULT_FAN_IN,
+    combine_max_tokens: int = 250,
 ) -> List[str]:
     """
     Uses the prompt_map function to collect responses and then reduces the responses based on a given reducer function.
@@ -245,19 +763,42 @@ async def prompt_reduce(
     Args:
         base_prompt (str): The base prompt for generating responses.
         prompts_iterable (Iterable[str]): An iterable of strings to generate responses for.
-        reducer (Callable[[List[str]], List[str]]): A function to reduce the list of generated responses.
+        reducer (Callable[[List[str]], List[str]]): Optional; a function to reduce the list of
+            generated responses. Without one the responses are returned as they are.
         model_list (List[str]): Optional; list of models to use. If None, uses a default.
         max_tokens (int): Optional; max tokens for each response.
+        combine_prompt (str): Optional; merge the responses with an LLM tree reduction
+            using this prompt instead of collecting them. ``reducer``, if given, is
+            then applied to the single merged response.
+        fan_in (int): Optional; responses merged per combine call.
+        combine_max_tokens (int): Optional; max tokens for each combine call.
 
     Returns:
         A reduced list of responses based on the reducer function.
     """
-
-    # First, we generate the responses based on the iterable and the base prompt
-    responses = await prompt_map(prompts_iterable, base_prompt, max_tokens, model_list)
-
-    # Then, we reduce the list of responses using the reducer function
-    return reducer(responses)
+    if combine_prompt is None:
+        # First, we generate the responses based on the iterable and the base prompt
+        responses = await prompt_map(prompts_iterable, base_prompt, max_tokens, model_list)
+
+        # Then, we reduce the list of responses using the reducer function, if any
+        return reducer(responses) if reducer else responses
+
+    # Combine responses as they arrive rather than after the whole map
+    responses = (
+        response
+        async for _, response in prompt_map_as_completed(
+            prompts_iterable, base_prompt, max_tokens, model_list
+        )
+    )
+    merged = await prompt_tree_reduce(
+        responses,
+        combine_prompt,
+        fan_in=fan_in,
+        model_list=model_list,
+        max_tokens=combine_max_tokens,
+    )
+    result = [] if merged is None else [merged]
+    return reducer(result) if reducer else result
 
 
 async def create_python_class_from_function_names(
@@ -280,11 +821,13 @@ async def create_python_class_from_function_names(
     return f"class {class_name}:\n{functions_str}"
 
 
+@dry_runnable
 @require(lambda x_prompts_iterable: all(isinstance(x, str) for x in x_prompts_iterable))
 @require(lambda y_prompts_iterable: all(isinstance(y, str) for y in y_prompts_iterable))
 @require(lambda max_tokens: isinstance(max_tokens, int) and max_tokens > 0)
 @ensure(lambda result: isinstance(result, list))
 @timer
+@with_caller
 async def prompt_matrix(
     x_prompts_iterable: Iterable[str],
     y_prompts_iterable: Iterable[str],
@@ -292,28 +835,161 @@ async def prompt_matrix(
     model: str = None,
     temperature: float = 0.7,
     max_tokens: int = 50,
+    prompts_per_request: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    journal: Union[str, PromptJournal] = None,
 ) -> List[str]:
-    responses = []
-
-    async def generate_response(index, prompt) -> None:
-        response = await acreate(
-            prompt=prompt, model=model, max_tokens=max_tokens, temperature=temperature
+    """
+    Responses for every (x, y) pair, row by row. Repeated x or y prompts are
+    asked once and their response is repeated in each cell they appear in.
+    """
+    x_prompts = list(x_prompts_iterable)
+    y_prompts = list(y_prompts_iterable)
+
+    cells = {}
+    async for x, y, response in prompt_matrix_as_completed(
+        x_prompts,
+        y_prompts,
+        base_prompt=base_prompt,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        prompts_per_request=prompts_per_request,
+        max_in_flight=max_in_flight,
+        journal=journal,
+    ):
+        cells[x, y] = response
+
+    return [cells[x, y] for x in x_prompts for y in y_prompts]
+
+
+async def prompt_matrix_as_completed(
+    x_prompts_iterable: Iterable[str],
+    y_prompts_iterable: Iterable[str],
+    base_prompt: str = "",
+    model: str = None,
+    temperature: float = 0.7,
+    max_tokens: int = 50,
+    prompts_per_request: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    journal: Union[str, PromptJournal] = None,
+) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+    """
+    Yield ``(x, y, response)`` for each distinct cell of the matrix as it completes.
+    Repeated x or y prompts are asked once, and cells are generated lazily from
+    the Cartesian product rather than built up front.
+    """
+    x_prompts = list(dict.fromkeys(x_prompts_iterable))
+    y_prompts = list(dict.fromkeys(y_prompts_iterable))
+
+    def cell(index: int) -> Tuple[str, str]:
+        return x_prompts[index // len(y_prompts)], y_prompts[index % len(y_prompts)]
+
+    def cell_key(index: int, prompt: str) -> Tuple[int, int, str, str]:
+        row, column = divmod(index, len(y_prompts))
+        return row, column, x_prompts[row], y_prompts[column]
+
+    async for index, response in prompt_map_as_completed(
+        (f"{x} {y}" for x, y in itertools.product(x_prompts, y_prompts)),
+        base_prompt=base_prompt,
+        max_tokens=max_tokens,
+        model_list=[model] if model else None,
+        temperature=temperature,
+        prompts_per_request=prompts_per_request,
+        max_in_flight=max_in_flight,
+        journal=journal,
+        key=cell_key,
+        template=MATRIX_TEMPLATE,
+    ):
+        yield (*cell(index), response)
+
+
+class _CsvSink:
+    def __init__(self, path: str):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(MATRIX_COLUMNS)
+
+    def write(self, rows: List[tuple]) -> None:
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _ParquetSink:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as oops:
+            raise ImportError("Writing Parquet output requires pyarrow.") from oops
+
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string()) for column in MATRIX_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows: List[tuple]) -> None:
+        columns = list(zip(*rows))
+        self.writer.write_table(
+            self.pa.Table.from_arrays(
+                [self.pa.array(column, self.pa.string()) for column in columns],
+                schema=self.schema,
+            )
         )
-        responses.append((index, response))
 
-    prompts = [
-        f"{base_prompt} {x_prompt} {y_prompt}"
-        for x_prompt in x_prompts_iterable
-        for y_prompt in y_prompts_iterable
-    ]
+    def close(self) -> None:
+        self.writer.close()
+
+
+@dry_runnable
+@with_caller
+async def prompt_matrix_table(
+    x_prompts_iterable: Iterable[str],
+    y_prompts_iterable: Iterable[str],
+    base_prompt: str = "",
+    output_path: str = None,
+    chunk_size: int = MATRIX_CHUNK_SIZE,
+    **kwargs,
+):
+    """
+    Run ``prompt_matrix_as_completed`` into a table with ``x``, ``y`` and ``response``
+    columns. Without ``output_path`` a pandas DataFrame indexed by (x, y) is
+    returned. With a ``.csv`` or ``.parquet`` path, rows are written every
+    ``chunk_size`` cells as they complete and the path is returned, so large
+    sweeps never hold every response in memory.
+    """
+    cells = prompt_matrix_as_completed(
+        x_prompts_iterable, y_prompts_iterable, base_prompt, **kwargs
+    )
+
+    if output_path is None:
+        import pandas as pd
+
+        rows = [row async for row in cells]
+        return pd.DataFrame(rows, columns=MATRIX_COLUMNS).set_index(["x", "y"])
 
-    async with anyio.create_task_group() as tg:
-        for index, item in enumerate(prompts):
-            tg.start_soon(generate_response, index, item)
+    if str(output_path).endswith(".parquet"):
+        sink = _ParquetSink(output_path)
+    elif str(output_path).endswith(".csv"):
+        sink = _CsvSink(output_path)
+    else:
+        raise ValueError(f"Unsupported matrix output format: {output_path}")
 
-    sorted_responses = [resp for _, resp in sorted(responses)]
+    try:
+        rows = []
+        async for row in cells:
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                sink.write(rows)
+                rows = []
+        if rows:
+            sink.write(rows)
+    finally:
+        sink.close()
 
-    return sorted_responses
+    return output_path
 
 
 # Example usage
@@ -339,14 +1015,17 @@ class Verifiers:
     A class designed to judge the validity of thoughts and answers produced by language models. This verifier can assess if a thought is a valid form of reasoning for deriving an answer from a question and if the answer is correct.
     """
 
+    generate_prompt = "Given the concept of 'Self-Taught Reasoner' and 'rationale generation with rationalization', propose solutions for: {problem}"
+    verify_prompt = "Is this useful to an expert?"
+
     def __init__(self):
-        pass
+        self.last_run = {}
 
     async def generate_solutions(self, problem: str) -> List[str]:
         """
         Generates solutions for a given problem leveraging OpenAI prompts, inspired by the idea of adding explicit "thought" variables to improve model performance.
         """
-        base_prompt = f"Given the concept of 'Self-Taught Reasoner' and 'rationale generation with rationalization', propose solutions for: {problem}"
+        base_prompt = self.generate_prompt.format(problem=problem)
         solutions = await prompt_map(
             [problem for _ in range(5)],
             base_prompt,
@@ -360,8 +1039,7 @@ class Verifiers:
         """
         Validates the provided solutions based on the concept of "verification" labels, which determine if a solution is derived through valid reasoning.
         """
-        base_prompt = "Is this useful to an expert?"
-        verified_solutions = await prompt_filter(base_prompt, solutions)
+        verified_solutions = await prompt_filter(self.verify_prompt, solutions)
         return verified_solutions
 
     async def pick_best_solution(self, verified_solutions: List[str]) -> str:
@@ -375,6 +1053,71 @@ class Verifiers:
             0
         ]  # Return the first item as it should contain the best solution
 
+    async def _candidate(self, problem: str, temperature: float) -> Tuple[str, bool]:
+        solution = await acreate(
+            prompt=f"{self.generate_prompt.format(problem=problem)}  {problem} ",
+            model=router.pick(ok_models),
+            max_tokens=300,
+            temperature=temperature,
+        )
+        verified = await prompt_filter(self.verify_prompt, [solution])
+        return solution, bool(verified)
+
+    @with_caller
+    async def solve(
+        self,
+        problem: str,
+        passes_needed: int = 2,
+        max_candidates: int = 10,
+        temperature: float = 0.7,
+    ) -> Optional[str]:
+        """
+        Generate, verify and select as one pipeline. Each candidate is verified as
+        soon as it is generated, and the run stops, cancelling outstanding work,
+        once ``passes_needed`` candidates pass. The number of candidates in flight
+        follows the pass rate seen so far, up to ``max_candidates`` in total.
+        Returns None if no candidate passes.
+        """
+        passed: List[str] = []
+        checked = 0
+        started = 0
+        running = set()
+
+        def wanted() -> int:
+            # Laplace-smoothed pass rate, so the first round assumes one in two
+            rate = (len(passed) + 1) / (checked + 2)
+            needed = math.ceil((passes_needed - len(passed)) / rate)
+            return min(max_candidates - started, needed - len(running))
+
+        try:
+            while len(passed) < passes_needed:
+                for _ in range(max(0, wanted())):
+                    running.add(asyncio.ensure_future(self._candidate(problem, temperature)))
+                    started += 1
+                if not running:
+                    break
+
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    checked += 1
+                    if task.exception() is not None:
+                        print(f"Candidate failed: {task.exception()}")
+                        continue
+                    solution, ok = task.result()
+                    if ok:
+                        passed.append(solution)
+        finally:
+            for task in running:
+                task.cancel()
+
+        self.last_run = {"candidates": started, "checked": checked, "passed": len(passed)}
+
+        if len(passed) <= 1:
+            return passed[0] if passed else None
+        return await self.pick_best_solution(passed[:passes_needed])
+
 
 # async def main():
 #     verifier = Verifiers()
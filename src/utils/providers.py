@@ -0,0 +1,404 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Iterator, Mapping, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+from utils.token_tools import count_tokens
+
+# Endpoints a provider has to serve
+COMPLETIONS = "completions"
+CHAT = "chat"
+
+DEFAULT_CASSETTE_DIR = "cassettes"
+
+ProviderResponse = Tuple[dict, Mapping[str, str]]
+
+
+class Provider(ABC):
+    """
+    Backend that executes completion and chat requests for ``utils.complete``.
+
+    ``params`` are OpenAI-style request parameters. Responses are returned as plain
+    dicts in the OpenAI JSON shape together with any response headers, and streams
+    yield chunk dicts. ``rate_limited`` tells the caller whether requests should
+    go through the shared rate limiter. Requests to a ``simulated`` provider skip
+    the response cache and routing statistics, and their metrics are labelled
+    ``simulated="true"``.
+    """
+
+    name = "base"
+    rate_limited = False
+    simulated = False
+
+    @abstractmethod
+    def complete(self, endpoint: str, params: dict) -> ProviderResponse:
+        pass
+
+    @abstractmethod
+    async def acomplete(self, endpoint: str, params: dict) -> ProviderResponse:
+        pass
+
+    @abstractmethod
+    def stream(self, endpoint: str, params: dict, on_headers: Callable = None) -> Iterator[dict]:
+        pass
+
+    @abstractmethod
+    def astream(
+        self, endpoint: str, params: dict, on_headers: Callable = None
+    ) -> AsyncIterator[dict]:
+        pass
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    rate_limited = True
+
+    def __init__(self):
+        self._aclient = None
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        # Created lazily so that importing utils.complete needs no API key
+        if self._aclient is None:
+            self._aclient = AsyncOpenAI()
+        return self._aclient
+
+    @staticmethod
+    def _resource(client, endpoint: str):
+        return client.completions if endpoint == COMPLETIONS else client.chat.completions
+
+    def complete(self, endpoint: str, params: dict) -> ProviderResponse:
+        raw = self._resource(openai, endpoint).with_raw_response.create(**params)
+        return raw.parse().model_dump(exclude_none=True), raw.headers
+
+    async def acomplete(self, endpoint: str, params: dict) -> ProviderResponse:
+        raw = await self._resource(self.aclient, endpoint).with_raw_response.create(
+            **params
+        )
+        return raw.parse().model_dump(exclude_none=True), raw.headers
+
+    def stream(self, endpoint: str, params: dict, on_headers: Callable = None) -> Iterator[dict]:
+        raw = self._resource(openai, endpoint).with_raw_response.create(
+            stream=True, **params
+        )
+        if on_headers:
+            on_headers(raw.headers)
+
+        stream = raw.parse()
+        try:
+            for chunk in stream:
+                yield chunk.model_dump(exclude_none=True)
+        finally:
+            stream.response.close()
+
+    async def astream(
+        self, endpoint: str, params: dict, on_headers: Callable = None
+    ) -> AsyncIterator[dict]:
+        raw = await self._resource(self.aclient, endpoint).with_raw_response.create(
+            stream=True, **params
+        )
+        if on_headers:
+            on_headers(raw.headers)
+
+        stream = raw.parse()
+        try:
+            async for chunk in stream:
+                yield chunk.model_dump(exclude_none=True)
+        finally:
+            await stream.response.aclose()
+
+
+def _text_chunks(endpoint: str, text: str) -> Iterator[dict]:
+    for index, word in enumerate(text.split(" ")):
+        piece = word if index == 0 else f" {word}"
+        if endpoint == COMPLETIONS:
+            yield {"choices": [{"index": 0, "text": piece}]}
+        else:
+            yield {"choices": [{"index": 0, "delta": {"content": piece}}]}
+
+
+def _request_digest(endpoint: str, params: dict) -> str:
+    payload = json.dumps({"endpoint": endpoint, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MockProvider(Provider):
+    """
+    Deterministic offline backend. The reply to a request depends only on the
+    request, and each call sleeps ``latency`` seconds plus the time it would take
+    to emit the reply at ``tokens_per_second``. Pass ``reply`` to control the text;
+    for a function call request it supplies the arguments JSON. Mock traffic is
+    ``simulated``: it never reaches the caches or router statistics, and its
+    metrics are labelled so framework overhead can be measured apart from real
+    traffic.
+    """
+
+    name = "mock"
+    simulated = True
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        reply: Callable[[str, dict], str] = None,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply or self.default_reply
+        self.replies_arguments = reply is not None
+
+    @staticmethod
+    def default_reply(prompt: str, params: dict) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"mock response {digest}"
+
+    def _prompts(self, endpoint: str, params: dict) -> list:
+        if endpoint == CHAT:
+            return [str(params["messages"][-1].get("content") or "")]
+        prompt = params.get("prompt", "")
+        return prompt if isinstance(prompt, list) else [prompt]
+
+    def _duration(self, texts: list, model: str) -> float:
+        if not self.tokens_per_second:
+            return self.latency
+        tokens = sum(count_tokens(text, model) for text in texts)
+        return self.latency + tokens / self.tokens_per_second
+
+    def _response(self, endpoint: str, params: dict) -> Tuple[dict, list]:
+        model = params.get("model", "mock")
+        prompts = self._prompts(endpoint, params)
+        texts = [self.reply(prompt, params) for prompt in prompts]
+
+        if endpoint == COMPLETIONS:
+            choices = [
+                {"index": index, "text": text, "finish_reason": "stop"}
+                for index, text in enumerate(texts)
+            ]
+        elif params.get("functions"):
+            name = params["functions"][0]["name"]
+            message = {
+                "role": "assistant",
+                "function_call": {
+                    "name": name,
+                    "arguments": texts[0] if self.replies_arguments else "{}",
+                },
+            }
+            choices = [{"index": 0, "message": message, "finish_reason": "function_call"}]
+        else:
+            message = {"role": "assistant", "content": texts[0]}
+            choices = [{"index": 0, "message": message, "finish_reason": "stop"}]
+
+        prompt_tokens = sum(count_tokens(prompt, model) for prompt in prompts)
+        completion_tokens = sum(count_tokens(text, model) for text in texts)
+        payload = {
+            "id": f"mock-{_request_digest(endpoint, params)[:24]}",
+            "object": "text_completion" if endpoint == COMPLETIONS else "chat.completion",
+            "model": model,
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return payload, texts
+
+    def complete(self, endpoint: str, params: dict) -> ProviderResponse:
+        payload, texts = self._response(endpoint, params)
+        time.sleep(self._duration(texts, payload["model"]))
+        return payload, {}
+
+    async def acomplete(self, endpoint: str, params: dict) -> ProviderResponse:
+        payload, texts = self._response(endpoint, params)
+        await asyncio.sleep(self._duration(texts, payload["model"]))
+        return payload, {}
+
+    def stream(self, endpoint: str, params: dict, on_headers: Callable = None) -> Iterator[dict]:
+        _, texts = self._response(endpoint, params)
+        time.sleep(self.latency)
+        for chunk in _text_chunks(endpoint, texts[0]):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield chunk
+
+    async def astream(
+        self, endpoint: str, params: dict, on_headers: Callable = None
+    ) -> AsyncIterator[dict]:
+        _, texts = self._response(endpoint, params)
+        await asyncio.sleep(self.latency)
+        for chunk in _text_chunks(endpoint, texts[0]):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield chunk
+
+
+class CassetteProvider(Provider):
+    """
+    Record/replay backend that stores one JSON file per request under ``path``.
+
+    - ``record``: send every request to ``inner`` and save the response.
+    - ``replay``: serve saved responses only; an unknown request raises KeyError.
+    - ``auto``: replay when a response is saved, otherwise record it.
+    """
+
+    name = "cassette"
+
+    def __init__(
+        self, path: str = DEFAULT_CASSETTE_DIR, mode: str = "replay", inner: Provider = None
+    ):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.inner = inner or OpenAIProvider()
+        self.rate_limited = mode != "replay" and self.inner.rate_limited
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, endpoint: str, params: dict) -> str:
+        return os.path.join(self.path, f"{_request_digest(endpoint, params)}.json")
+
+    def _load(self, endpoint: str, params: dict) -> Optional[dict]:
+        filename = self._file(endpoint, params)
+        if self.mode == "record" or not os.path.exists(filename):
+            if self.mode == "replay":
+                raise KeyError(f"No recorded response for this request in {filename}")
+            return None
+        with open(filename) as f:
+            return json.load(f)["response"]
+
+    def _save(self, endpoint: str, params: dict, payload: dict) -> None:
+        with open(self._file(endpoint, params), "w") as f:
+            json.dump({"endpoint": endpoint, "request": params, "response": payload}, f, indent=2)
+
+    def complete(self, endpoint: str, params: dict) -> ProviderResponse:
+        payload = self._load(endpoint, params)
+        if payload is not None:
+            return payload, {}
+        payload, headers = self.inner.complete(endpoint, params)
+        self._save(endpoint, params, payload)
+        return payload, headers
+
+    async def acomplete(self, endpoint: str, params: dict) -> ProviderResponse:
+        payload = self._load(endpoint, params)
+        if payload is not None:
+            return payload, {}
+        payload, headers = await self.inner.acomplete(endpoint, params)
+        self._save(endpoint, params, payload)
+        return payload, headers
+
+    @staticmethod
+    def _streamed_payload(endpoint: str, parts: list) -> dict:
+        text = "".join(parts)
+        if endpoint == COMPLETIONS:
+            return {"choices": [{"index": 0, "text": text}]}
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+
+    @staticmethod
+    def _payload_text(endpoint: str, payload: dict) -> str:
+        choice = payload["choices"][0]
+        if endpoint == COMPLETIONS:
+            return choice.get("text", "")
+        return choice["message"].get("content") or ""
+
+    def stream(self, endpoint: str, params: dict, on_headers: Callable = None) -> Iterator[dict]:
+        payload = self._load(endpoint, params)
+        if payload is not None:
+            yield from _text_chunks(endpoint, self._payload_text(endpoint, payload))
+            return
+
+        parts = []
+        for chunk in self.inner.stream(endpoint, params, on_headers):
+            parts.append(_chunk_text(endpoint, chunk))
+            yield chunk
+        self._save(endpoint, params, self._streamed_payload(endpoint, parts))
+
+    async def astream(
+        self, endpoint: str, params: dict, on_headers: Callable = None
+    ) -> AsyncIterator[dict]:
+        payload = self._load(endpoint, params)
+        if payload is not None:
+            for chunk in _text_chunks(endpoint, self._payload_text(endpoint, payload)):
+                yield chunk
+            return
+
+        parts = []
+        async for chunk in self.inner.astream(endpoint, params, on_headers):
+            parts.append(_chunk_text(endpoint, chunk))
+            yield chunk
+        self._save(endpoint, params, self._streamed_payload(endpoint, parts))
+
+
+def _chunk_text(endpoint: str, chunk: dict) -> str:
+    if not chunk.get("choices"):
+        return ""
+    choice = chunk["choices"][0]
+    if endpoint == COMPLETIONS:
+        return choice.get("text") or ""
+    return (choice.get("delta") or {}).get("content") or ""
+
+
+def provider_from_env() -> Provider:
+    """
+    Build the provider named by AISMT_LLM_PROVIDER: openai (default), mock, or one
+    of the cassette modes record/replay/auto (stored under AISMT_LLM_CASSETTE).
+    The mock's timing comes from AISMT_LLM_MOCK_LATENCY and AISMT_LLM_MOCK_TPS.
+    """
+    name = os.getenv("AISMT_LLM_PROVIDER", "openai").lower()
+    cassette = os.getenv("AISMT_LLM_CASSETTE", DEFAULT_CASSETTE_DIR)
+
+    if name == "openai":
+        return OpenAIProvider()
+    elif name == "mock":
+        tokens_per_second = os.getenv("AISMT_LLM_MOCK_TPS")
+        return MockProvider(
+            latency=float(os.getenv("AISMT_LLM_MOCK_LATENCY", "0")),
+            tokens_per_second=float(tokens_per_second) if tokens_per_second else None,
+        )
+    elif name in ("record", "replay", "auto"):
+        return CassetteProvider(path=cassette, mode=name)
+    else:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+
+_provider: Optional[Provider] = None
+_scoped_provider: ContextVar[Optional[Provider]] = ContextVar("llm_provider", default=None)
+
+
+def get_provider() -> Provider:
+    global _provider
+    scoped = _scoped_provider.get()
+    if scoped is not None:
+        return scoped
+    if _provider is None:
+        _provider = provider_from_env()
+    return _provider
+
+
+def set_provider(provider: Provider) -> Provider:
+    """
+    Route every utils.complete call through ``provider``. Returns the previous one.
+    """
+    global _provider
+    previous, _provider = _provider, provider
+    return previous
+
+
+@contextmanager
+def use_provider(provider: Provider):
+    """
+    Route calls made inside the block, including tasks it starts, to ``provider``
+    without affecting the rest of the process.
+    """
+    token = _scoped_provider.set(provider)
+    try:
+        yield provider
+    finally:
+        _scoped_provider.reset(token)
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+from loguru import logger
+
+from utils.models import DEFAULT_RATE_LIMIT, model_rate_limits
+from utils.token_tools import count_message_tokens, count_tokens
+
+# Completion budget assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_ESTIMATE = 256
+
+
+def count_prompt_tokens(params: dict) -> int:
+    """
+    Tokens in the prompt or messages of a completions or chat request.
+    """
+    model = params.get("model") or "gpt-3.5-turbo"
+
+    if "messages" in params:
+        return count_message_tokens(params["messages"], model)
+
+    prompt = params.get("prompt", "")
+    if isinstance(prompt, list):
+        return sum(count_tokens(p, model) for p in prompt)
+    return count_tokens(prompt, model)
+
+
+def estimate_request_tokens(params: dict) -> int:
+    """
+    Estimate how many tokens a request counts against the TPM quota: the prompt
+    plus the completion budget for every choice, which OpenAI reserves up front.
+    """
+    prompt = params.get("prompt")
+    choices = len(prompt) if isinstance(prompt, list) else 1
+
+    completion = params.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+    return count_prompt_tokens(params) + completion * choices
+
+
+class TokenBucket:
+    """
+    A token bucket that refills ``capacity`` tokens per minute. Reservations are
+    taken immediately and may drive the balance negative; the caller then waits
+    until the debt is repaid, so waiters are served in arrival order.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Take ``amount`` tokens and return the seconds to wait before using them.
+        """
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], now: float) -> None:
+        """
+        Align the bucket with the limit and remaining quota reported by the server.
+        """
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class ModelRateLimiter:
+    """
+    Per-model requests-per-minute and tokens-per-minute limiter shared by every LLM
+    entry point. ``acquire`` waits on the event loop; ``acquire_sync`` is the
+    thread-safe facade for the synchronous ``create``/``chat`` path. Both draw
+    from the same buckets.
+    """
+
+    def __init__(self, limits: Mapping[str, Tuple[int, int]] = None):
+        self.limits = dict(model_rate_limits if limits is None else limits)
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            rpm, tpm = self.limits.get(model, DEFAULT_RATE_LIMIT)
+            self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[model]
+
+    def reserve(self, model: str, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            requests, token_bucket = self._buckets_for(model)
+            return max(requests.reserve(1, now), token_bucket.reserve(tokens, now))
+
+    async def acquire(self, model: str, tokens: int) -> None:
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            logger.debug(f"Rate limiting {model} for {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, model: str, tokens: int) -> None:
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            logger.debug(f"Rate limiting {model} for {delay:.2f}s")
+            time.sleep(delay)
+
+    def update_from_headers(self, model: str, headers: Mapping[str, str]) -> None:
+        """
+        Correct the buckets from OpenAI's x-ratelimit-* response headers.
+        """
+
+        def header(name: str) -> Optional[float]:
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._lock:
+            now = time.monotonic()
+            requests, token_bucket = self._buckets_for(model)
+            requests.sync(
+                header("x-ratelimit-limit-requests"),
+                header("x-ratelimit-remaining-requests"),
+                now,
+            )
+            token_bucket.sync(
+                header("x-ratelimit-limit-tokens"),
+                header("x-ratelimit-remaining-tokens"),
+                now,
+            )
+
+    def on_rate_limited(self, model: str) -> None:
+        """
+        Empty the buckets after a 429 so queued callers wait for the refill instead
+        of retrying into the same wall.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self._buckets_for(model):
+                bucket.drain(now)
+
+
+rate_limiter = ModelRateLimiter()
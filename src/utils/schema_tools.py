@@ -0,0 +1,390 @@
+import collections.abc
+import dataclasses
+import enum
+import hashlib
+import inspect
+import re
+import threading
+import types
+import typing
+import weakref
+from typing import Any, Dict, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from utils.complete import metrics
+from utils.token_tools import count_tokens
+
+# Reply tokens budgeted per value when capping structured output
+STRING_TOKENS = 64
+SCALAR_TOKENS = 4
+ARRAY_ITEMS = 5
+MIN_OUTPUT_TOKENS = 32
+MAX_OUTPUT_TOKENS = 1024
+# Nesting followed through $ref before a value is treated as unconstrained
+MAX_SCHEMA_DEPTH = 4
+# Characters of docstring kept in a compiled prompt schema
+SUMMARY_CHARS = 300
+
+_PRIMITIVES = {
+    str: {"type": "string"},
+    int: {"type": "integer"},
+    float: {"type": "number"},
+    bool: {"type": "boolean"},
+    type(None): {"type": "null"},
+    list: {"type": "array"},
+    tuple: {"type": "array"},
+    set: {"type": "array"},
+    dict: {"type": "object"},
+}
+
+metrics.counter("llm_structured_calls_total", "Structured output calls by outcome.")
+metrics.counter("llm_structured_reasks_total", "Structured output calls re-asked after invalid arguments.")
+metrics.counter("llm_structured_tokens_total", "Prompt and reply tokens of structured output calls.")
+
+
+def is_pydantic_model(target: Any) -> bool:
+    return isinstance(target, type) and issubclass(target, BaseModel)
+
+
+def type_schema(annotation: Any) -> dict:
+    """
+    JSON schema for a type annotation. Types it cannot describe are left open.
+    """
+    if annotation in (inspect.Parameter.empty, Any):
+        return {}
+    if annotation in _PRIMITIVES:
+        return dict(_PRIMITIVES[annotation])
+
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (Union, types.UnionType):
+        options = [type_schema(arg) for arg in args]
+        return {} if {} in options else {"anyOf": options}
+    if origin is Literal:
+        return {"enum": list(args)}
+    if origin in (list, tuple, set, frozenset) or (
+        isinstance(origin, type) and issubclass(origin, collections.abc.Sequence)
+    ):
+        return {"type": "array", "items": type_schema(args[0])} if args else {"type": "array"}
+    if origin is dict or (isinstance(origin, type) and issubclass(origin, collections.abc.Mapping)):
+        schema = {"type": "object"}
+        if len(args) == 2 and type_schema(args[1]):
+            schema["additionalProperties"] = type_schema(args[1])
+        return schema
+
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        return {"enum": [member.value for member in annotation]}
+    if is_pydantic_model(annotation) or dataclasses.is_dataclass(annotation):
+        return json_schema(annotation)
+    return {}
+
+
+def _type_hints(target: Any) -> Dict[str, Any]:
+    try:
+        return typing.get_type_hints(target)
+    except Exception:
+        # Forward references that do not resolve outside the defining module
+        return {}
+
+
+def json_schema(target: Any) -> dict:
+    """
+    JSON schema for the keyword arguments of a pydantic model, a dataclass, a
+    class's ``__init__`` or a function.
+    """
+    if is_pydantic_model(target):
+        return target.model_json_schema()
+
+    properties, required = {}, []
+    if dataclasses.is_dataclass(target):
+        hints = _type_hints(target)
+        for field in dataclasses.fields(target):
+            if not field.init:
+                continue
+            properties[field.name] = type_schema(hints.get(field.name, field.type))
+            if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING:
+                required.append(field.name)
+    else:
+        hints = _type_hints(target.__init__ if isinstance(target, type) else target)
+        for name, param in inspect.signature(target).parameters.items():
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            properties[name] = type_schema(hints.get(name, param.annotation))
+            if param.default is param.empty:
+                required.append(name)
+
+    return {"type": "object", "properties": properties, "required": required}
+
+
+def doc_summary(target: Any) -> str:
+    """
+    The first paragraph of the target's docstring on one line.
+    """
+    doc = inspect.getdoc(target) or ""
+    return " ".join(doc.split("\n\n")[0].split())
+
+
+@dataclasses.dataclass(frozen=True)
+class PromptSchema:
+    """
+    A class or callable compiled once into what a prompt needs to know about it:
+    its signature, the first paragraph of its docstring and its JSON schema.
+    """
+
+    qualname: str
+    source_hash: str
+    signature: str
+    summary: str
+    schema: dict = dataclasses.field(repr=False)
+    tokens: int = 0
+    source_tokens: int = 0
+
+    def render(self) -> str:
+        return f"{self.signature}\n    {self.summary}" if self.summary else self.signature
+
+
+def _qualname(target: Any) -> str:
+    return f"{getattr(target, '__module__', '')}.{getattr(target, '__qualname__', repr(target))}"
+
+
+def _signature_line(target: Any) -> str:
+    name = getattr(target, "__name__", type(target).__name__)
+    try:
+        signature = inspect.signature(target)
+    except (TypeError, ValueError):
+        signature = "(...)"
+    if isinstance(target, type):
+        return f"class {name}{str(signature).split(' -> ')[0]}"
+    prefix = "async def" if inspect.iscoroutinefunction(target) else "def"
+    return f"{prefix} {name}{signature}"
+
+
+def compile_prompt_schema(target: Any, source: str = None) -> PromptSchema:
+    if source is None:
+        try:
+            source = inspect.getsource(target)
+        except (OSError, TypeError):
+            source = ""
+    signature = _signature_line(target)
+    try:
+        schema = json_schema(target)
+    except (TypeError, ValueError):
+        schema = {"type": "object", "properties": {}, "required": []}
+
+    summary = doc_summary(target)
+    if len(summary) > SUMMARY_CHARS:
+        summary = summary[:SUMMARY_CHARS].rsplit(" ", 1)[0] + "..."
+
+    compiled = PromptSchema(
+        qualname=_qualname(target),
+        source_hash=hashlib.sha256((source or signature).encode("utf-8")).hexdigest(),
+        signature=signature,
+        summary=summary,
+        schema=schema,
+        source_tokens=count_tokens(source),
+    )
+    return dataclasses.replace(compiled, tokens=count_tokens(compiled.render()))
+
+
+class PromptSchemaRegistry:
+    """
+    Compiled prompt schemas keyed by qualified name and source hash. Targets seen
+    before are found by identity, so the source is read once per object.
+    """
+
+    def __init__(self):
+        self._by_target: "weakref.WeakKeyDictionary[Any, PromptSchema]" = weakref.WeakKeyDictionary()
+        self._by_source: Dict[Tuple[str, str], PromptSchema] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, target: Any) -> PromptSchema:
+        # Bound methods are created on every access; key them by their function
+        key_target = getattr(target, "__func__", target)
+        with self._lock:
+            try:
+                compiled = self._by_target.get(key_target)
+            except TypeError:
+                # Not weakly referenceable
+                compiled = None
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+
+        compiled = compile_prompt_schema(target)
+        key = (compiled.qualname, compiled.source_hash)
+        with self._lock:
+            if key in self._by_source:
+                self.hits += 1
+                compiled = self._by_source[key]
+            else:
+                self.misses += 1
+                self._by_source[key] = compiled
+            try:
+                self._by_target[key_target] = compiled
+            except TypeError:
+                pass
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_target = weakref.WeakKeyDictionary()
+            self._by_source.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._by_source.values())
+            return {
+                "entries": len(entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "tokens": sum(entry.tokens for entry in entries),
+                "source_tokens": sum(entry.source_tokens for entry in entries),
+            }
+
+
+prompt_schemas = PromptSchemaRegistry()
+
+
+def prompt_schema(target: Any) -> PromptSchema:
+    return prompt_schemas.get(target)
+
+
+def function_spec(target: Any, schema: dict = None) -> dict:
+    """
+    An OpenAI function definition whose arguments are the target's fields.
+    """
+    compiled = prompt_schema(target)
+    name = re.sub(r"[^a-zA-Z0-9_-]", "_", getattr(target, "__name__", "create"))[:64]
+    return {
+        "name": name,
+        "description": compiled.summary or f"Arguments for {name}",
+        "parameters": schema or compiled.schema,
+    }
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    ref = schema.get("$ref", "")
+    if not ref.startswith("#/"):
+        return schema
+    for part in ref[2:].split("/"):
+        root = root.get(part, {})
+    return root
+
+
+def _value_tokens(schema: dict, root: dict, depth: int) -> int:
+    if depth > MAX_SCHEMA_DEPTH:
+        return STRING_TOKENS
+    schema = _resolve(schema, root)
+
+    if "enum" in schema:
+        return max((len(str(value)) // 4 + 2 for value in schema["enum"]), default=SCALAR_TOKENS)
+    options = schema.get("anyOf") or schema.get("oneOf")
+    if options:
+        return max(_value_tokens(option, root, depth + 1) for option in options)
+
+    kind = schema.get("type")
+    if kind in ("integer", "number", "boolean", "null"):
+        return SCALAR_TOKENS
+    if kind == "array":
+        items = schema.get("maxItems", ARRAY_ITEMS)
+        return 2 + items * (_value_tokens(schema.get("items", {}), root, depth + 1) + 1)
+    if kind == "object" and "properties" in schema:
+        return 2 + sum(
+            len(name) // 4 + 3 + _value_tokens(value, root, depth + 1)
+            for name, value in schema["properties"].items()
+        )
+    return STRING_TOKENS
+
+
+def output_token_budget(schema: dict) -> int:
+    """
+    ``max_tokens`` for a reply holding one value of ``schema``, clamped to
+    ``MIN_OUTPUT_TOKENS``..``MAX_OUTPUT_TOKENS``.
+    """
+    budget = _value_tokens(schema, schema, 0)
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, budget))
+
+
+def _matches(schema: dict, value: Any) -> bool:
+    if "enum" in schema:
+        return value in schema["enum"]
+    if "anyOf" in schema:
+        return any(_matches(option, value) for option in schema["anyOf"])
+    kind = schema.get("type")
+    if kind == "string":
+        return isinstance(value, str)
+    if kind == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == "boolean":
+        return isinstance(value, bool)
+    if kind == "array":
+        return isinstance(value, list) and all(
+            _matches(schema.get("items", {}), item) for item in value
+        )
+    if kind == "object":
+        return isinstance(value, dict)
+    if kind == "null":
+        return value is None
+    return True
+
+
+def validate_arguments(target: Any, arguments: dict, schema: dict = None) -> dict:
+    """
+    Check the arguments a model returned for ``target`` and return them as
+    kwargs. Raises ValueError describing every problem, for re-asking.
+    """
+    if not isinstance(arguments, dict):
+        raise ValueError(f"Expected a JSON object, got {type(arguments).__name__}.")
+
+    if is_pydantic_model(target):
+        try:
+            return target.model_validate(arguments).model_dump()
+        except ValueError as e:
+            raise ValueError(str(e)) from e
+
+    schema = schema or json_schema(target)
+    properties = schema["properties"]
+    errors = [f"Missing required field '{name}'." for name in schema["required"] if name not in arguments]
+    for name, value in arguments.items():
+        if name in properties and not _matches(properties[name], value):
+            errors.append(f"Field '{name}' does not match {properties[name]}: {value!r}.")
+    if errors:
+        raise ValueError(" ".join(errors))
+
+    accepts_any = not dataclasses.is_dataclass(target) and any(
+        param.kind == param.VAR_KEYWORD for param in inspect.signature(target).parameters.values()
+    )
+    return {name: value for name, value in arguments.items() if accepts_any or name in properties}
+
+
+def record_structured(
+    target: str, ok: bool, reasks: int, prompt_tokens: int, completion_tokens: int
+) -> None:
+    metrics.inc("llm_structured_calls_total", target=target, status="ok" if ok else "error")
+    if reasks:
+        metrics.inc("llm_structured_reasks_total", reasks, target=target)
+    metrics.inc("llm_structured_tokens_total", prompt_tokens, target=target, kind="prompt")
+    metrics.inc("llm_structured_tokens_total", completion_tokens, target=target, kind="completion")
+
+
+def structured_output_stats(target: Optional[str] = None) -> dict:
+    """
+    Re-ask rate and mean tokens per structured output call, for one target or all.
+    """
+    labels = {} if target is None else {"target": target}
+    calls = metrics.total("llm_structured_calls_total", **labels)
+    reasks = metrics.total("llm_structured_reasks_total", **labels)
+    prompt = metrics.total("llm_structured_tokens_total", kind="prompt", **labels)
+    completion = metrics.total("llm_structured_tokens_total", kind="completion", **labels)
+    return {
+        "calls": int(calls),
+        "failures": int(metrics.total("llm_structured_calls_total", status="error", **labels)),
+        "reask_rate": reasks / calls if calls else 0.0,
+        "avg_prompt_tokens": prompt / calls if calls else 0.0,
+        "avg_completion_tokens": completion / calls if calls else 0.0,
+    }
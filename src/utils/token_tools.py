@@ -0,0 +1,146 @@
+from functools import lru_cache
+from typing import List
+
+from loguru import logger
+
+from utils.models import context_window
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+# Tokens OpenAI adds around every chat message and to prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    Return the (cached) tiktoken encoding for ``model``, or None without tiktoken.
+    """
+    global tiktoken
+
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as oops:  # The BPE files are downloaded on first use
+        logger.warning(f"Falling back to estimated token counts: {oops}")
+        tiktoken = None
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text or "") // 4)  # About four characters per token
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-3.5-turbo") -> int:
+    return REPLY_PRIMING + sum(
+        count_tokens(str(msg.get("content") or ""), model) + MESSAGE_OVERHEAD
+        for msg in messages
+    )
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """
+    Cut ``text`` down to at most ``max_tokens`` tokens, keeping the beginning.
+    """
+    max_tokens = max(0, max_tokens)
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def split_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> List[str]:
+    """
+    Split ``text`` into pieces of at most ``max_tokens`` tokens, breaking between
+    paragraphs where possible.
+    """
+    pieces, current, size = [], [], 0
+    for paragraph in text.split("\n\n"):
+        tokens = count_tokens(paragraph, model)
+        while tokens > max_tokens:
+            head = truncate_tokens(paragraph, max_tokens, model)
+            pieces.append(head)
+            paragraph = paragraph[len(head) :]
+            tokens = count_tokens(paragraph, model)
+        if current and size + tokens > max_tokens:
+            pieces.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += tokens
+    if current:
+        pieces.append("\n\n".join(current))
+    return [piece for piece in pieces if piece.strip()]
+
+
+@lru_cache(maxsize=None)
+def _warn_unknown_window(model: str) -> None:
+    logger.warning(f"Unknown context window for {model}; sending messages untrimmed.")
+
+
+def fit_messages(messages: List[dict], model: str, reserve: int) -> List[dict]:
+    """
+    Trim ``messages`` so they fit the model's context window with ``reserve``
+    tokens left for the reply.
+
+    The leading system message and the final message are kept; the oldest
+    messages in between are dropped first. If the kept messages still do not
+    fit, the longest of them is truncated. The result is deterministic for a
+    given input. Messages for a model with an unknown context window are sent
+    as they are. Raises ValueError if ``reserve`` leaves no room for the kept
+    messages.
+    """
+    window = context_window(model)
+    if window is None:
+        _warn_unknown_window(model)
+        return messages
+
+    budget = window - reserve
+    sizes = [
+        count_tokens(str(msg.get("content") or ""), model) + MESSAGE_OVERHEAD
+        for msg in messages
+    ]
+    total = REPLY_PRIMING + sum(sizes)
+
+    if total <= budget:
+        return messages
+
+    pinned = {len(messages) - 1}
+    if messages and messages[0].get("role") == "system":
+        pinned.add(0)
+
+    keep = list(range(len(messages)))
+    for index in range(len(messages)):
+        if total <= budget:
+            break
+        if index not in pinned:
+            keep.remove(index)
+            total -= sizes[index]
+
+    trimmed = [dict(messages[index]) for index in keep]
+
+    if total > budget:
+        longest = max(range(len(trimmed)), key=lambda i: sizes[keep[i]])
+        allowed = sizes[keep[longest]] - MESSAGE_OVERHEAD - (total - budget)
+        if allowed < 1:
+            raise ValueError(
+                f"{model} has a {window} token context window and {reserve} are reserved "
+                f"for the reply, which leaves no room for the system and last messages. "
+                f"Lower max_tokens."
+            )
+        trimmed[longest]["content"] = truncate_tokens(
+            str(trimmed[longest].get("content") or ""), allowed, model
+        )
+
+    return trimmed
@@ -4,6 +4,7 @@ import httpx
 from fastapi.testclient import TestClient
 
 from aismt.api import app
+from utils.providers import MockProvider, set_provider
 
 client = TestClient(app)
 
@@ -12,3 +13,21 @@ def test_read_root() -> None:
     """Test that reading the root is successful."""
     response = client.get("/")
     assert httpx.codes.is_success(response.status_code)
+
+
+def test_metrics() -> None:
+    """Test that the metrics endpoint serves the Prometheus text format."""
+    response = client.get("/metrics")
+    assert httpx.codes.is_success(response.status_code)
+    assert "# TYPE llm_requests_total counter" in response.text
+
+
+def test_complete_stream() -> None:
+    """Test that the stream endpoint returns the completion as plain text."""
+    previous = set_provider(MockProvider(reply=lambda prompt, params: f"echo {prompt}"))
+    try:
+        response = client.get("/complete/stream", params={"prompt": "hello world"})
+    finally:
+        set_provider(previous)
+    assert httpx.codes.is_success(response.status_code)
+    assert response.text == "echo hello world"
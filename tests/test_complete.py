@@ -0,0 +1,223 @@
+"""Test the LLM request plumbing in utils.complete."""
+
+import asyncio
+
+import anyio
+import pytest
+
+from utils import complete
+from utils.complete import (
+    HedgePolicy,
+    ResponseCache,
+    SingleFlight,
+    acreate,
+    acreate_many,
+    acreate_stream,
+    metrics,
+)
+from utils.estimate_tools import estimating
+from utils.models import router
+from utils.prompt_tools import prompt_map
+from utils.providers import MockProvider, Provider, use_provider
+
+
+def test_prompt_map_caller_label() -> None:
+    """Test that prompt_map requests are attributed to the module calling it."""
+
+    async def job() -> None:
+        await prompt_map(["a", "b", "c"], "Say", model_list=["gpt-4"])
+        await prompt_map(["d", "e"], "Say")
+
+    with estimating() as report:
+        anyio.run(job)
+
+    assert {caller for caller, _ in report.rows} == {__name__}
+    assert report.total.requests == 4
+
+
+class ShuffledProvider(MockProvider):
+    """Echo each prompt, returning packed choices in reverse and dropping some."""
+
+    def __init__(self, drop: int = 0):
+        super().__init__(reply=lambda prompt, params: f"re: {prompt}")
+        self.drop = drop
+        self.requests = []
+
+    async def acomplete(self, endpoint: str, params: dict):
+        self.requests.append(params["prompt"])
+        payload, headers = await super().acomplete(endpoint, params)
+        choices = payload["choices"][::-1]
+        if self.drop:
+            choices, self.drop = choices[self.drop :], 0
+        return {**payload, "choices": choices}, headers
+
+
+def test_acreate_many_maps_choices_by_index() -> None:
+    """Test that packed choices come back in prompt order and duplicates are sent once."""
+    provider = ShuffledProvider()
+    with use_provider(provider):
+        results = anyio.run(
+            lambda: acreate_many(["a", "b", "a", "c"], model="gpt-3.5-turbo-instruct", temperature=0)
+        )
+
+    assert results == ["re: a", "re: b", "re: a", "re: c"]
+    assert provider.requests == [["a", "b", "c"]]
+
+
+def test_acreate_many_resends_missing_choices() -> None:
+    """Test that prompts left out of a packed reply are sent again."""
+    provider = ShuffledProvider(drop=1)
+    with use_provider(provider):
+        results = anyio.run(
+            lambda: acreate_many(["a", "b", "c"], model="gpt-3.5-turbo-instruct", temperature=0)
+        )
+
+    assert results == ["re: a", "re: b", "re: c"]
+    assert provider.requests == [["a", "b", "c"], ["c"]]
+
+
+def test_early_stream_close_is_cancelled() -> None:
+    """Test that a stream closed early is not recorded as a failed request."""
+
+    async def first_chunk() -> str:
+        stream = acreate_stream(prompt="p", model="early-close-model")
+        async for chunk in stream:
+            break
+        await stream.aclose()
+        return chunk
+
+    with use_provider(MockProvider(reply=lambda prompt, params: "one two three")):
+        assert anyio.run(first_chunk) == "one"
+
+    labels = {"model": "early-close-model", "simulated": "true"}
+    assert metrics.total("llm_requests_total", status="cancelled", **labels) == 1
+    assert metrics.total("llm_requests_total", **labels) == 1
+
+
+def test_provider_is_abstract() -> None:
+    """Test that a provider missing a request method cannot be instantiated."""
+
+    class CompleteOnly(Provider):
+        def complete(self, endpoint, params):
+            return {}, {}
+
+    with pytest.raises(TypeError):
+        CompleteOnly()
+
+
+class Clock:
+    """A settable stand-in for ``time.time``."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_response_cache_ttl(monkeypatch) -> None:
+    """Test that entries older than the TTL are misses and are deleted."""
+    clock = Clock()
+    monkeypatch.setattr(complete.time, "time", clock)
+    cache = ResponseCache(path=":memory:", ttl=60)
+
+    cache.set("key", {"text": "hi"})
+    clock.now += 59
+    assert cache.get("key") == {"text": "hi"}
+    clock.now += 2
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 1
+
+
+def test_response_cache_lru_eviction(monkeypatch) -> None:
+    """Test that the least recently read entries are evicted past max_entries."""
+    clock = Clock()
+    monkeypatch.setattr(complete.time, "time", clock)
+    cache = ResponseCache(path=":memory:", max_entries=2)
+
+    cache.set("a", 1)
+    clock.now += 1
+    cache.set("b", 2)
+    clock.now += 1
+    assert cache.get("a") == 1
+    clock.now += 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert not ResponseCache(path=":memory:").cacheable(0.7)
+
+
+def test_single_flight_coalesces_identical_requests() -> None:
+    """Test that concurrent identical requests share one provider call."""
+    sent = []
+
+    def reply(prompt: str, params: dict) -> str:
+        sent.append(prompt)
+        return f"re: {prompt}"
+
+    async def ask() -> list:
+        return await asyncio.gather(
+            acreate(prompt="same", model="gpt-3.5-turbo-instruct", max_tokens=5),
+            acreate(prompt="same", model="gpt-3.5-turbo-instruct", max_tokens=5),
+            acreate(prompt="other", model="gpt-3.5-turbo-instruct", max_tokens=5),
+        )
+
+    with use_provider(MockProvider(latency=0.05, reply=reply)):
+        assert anyio.run(ask) == ["re: same", "re: same", "re: other"]
+
+    assert sorted(sent) == ["other", "same"]
+
+
+def test_single_flight_cancels_with_last_waiter() -> None:
+    """Test that the shared request outlives one cancelled waiter but not all of them."""
+    flight = SingleFlight()
+    started = []
+
+    async def slow() -> str:
+        started.append(True)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run() -> None:
+        first = asyncio.ensure_future(flight.do("key", slow))
+        second = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+
+        third = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        task = flight._in_flight["key"][0]
+        third.cancel()
+        await asyncio.wait({task}, timeout=1)
+        assert task.cancelled()
+
+    anyio.run(run)
+    assert len(started) == 2
+    assert flight.stats()["shared"] == 1
+
+
+def test_hedge_slow_request(monkeypatch) -> None:
+    """Test that a request slower than its model's usual latency is raced on a sibling."""
+    monkeypatch.setattr(router, "pools", {"pool": ["hedge-slow", "hedge-fast"]})
+    router.end("hedge-slow", router.begin("hedge-slow") - 0.01)
+    policy = HedgePolicy(quantile=0.5, budget=1.0, min_samples=1)
+    sent = []
+
+    async def send(model: str) -> str:
+        sent.append(model)
+        await asyncio.sleep(5 if model == "hedge-slow" else 0)
+        return model
+
+    async def run() -> tuple:
+        unhedged = await policy.run("hedge-fast", send, hedge=True)
+        hedged = await policy.run("hedge-slow", send, hedge=True)
+        return unhedged, hedged
+
+    assert anyio.run(run) == ("hedge-fast", "hedge-fast")
+    assert sent == ["hedge-fast", "hedge-slow", "hedge-fast"]
+    assert policy.stats() == {"requests": 2, "hedges": 1, "hedge_wins": 1}
+    # Off by default: no hedge without opting in
+    assert anyio.run(policy.run, "hedge-slow", lambda model: asyncio.sleep(0, model)) == "hedge-slow"
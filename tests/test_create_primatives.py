@@ -0,0 +1,41 @@
+"""Test the LLM literal parser and streaming primitives."""
+
+import anyio
+import pytest
+
+from utils.create_primatives import create_dict_stream, parse_literal
+from utils.providers import MockProvider, use_provider
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("{'a': 1, 'b': [1, 2,],}", {"a": 1, "b": [1, 2]}),
+        ('{"a": true, "b": null}', {"a": True, "b": None}),
+        ("{“name”: “Ada”} Because...", {"name": "Ada"}),
+        ('{"a": "x", "b": ["y", "z', {"a": "x", "b": ["y"]}),
+        ('["a", "b", "c', ["a", "b"]),
+    ],
+)
+def test_parse_literal(text: str, expected: object) -> None:
+    """Test that malformed LLM literals are repaired locally."""
+    assert parse_literal(text) == expected
+
+
+def test_parse_literal_failure() -> None:
+    """Test that unparseable text raises ValueError."""
+    with pytest.raises(ValueError):
+        parse_literal("{'a': }", dict)
+
+
+def test_create_dict_stream_skips_non_string_values() -> None:
+    """Test that streamed pairs meet create_dict's string-to-string contract."""
+
+    async def collect() -> list:
+        return [pair async for pair in create_dict_stream("Colors", min_len=1)]
+
+    reply = '"sky": "blue", "count": 2, "grass": "green"}'
+    with use_provider(MockProvider(reply=lambda prompt, params: reply)):
+        pairs = anyio.run(collect)
+
+    assert pairs == [("sky", "blue"), ("grass", "green")]
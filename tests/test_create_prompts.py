@@ -0,0 +1,51 @@
+"""Test structured output with the mock provider."""
+
+from dataclasses import dataclass
+
+import anyio
+
+from utils.create_prompts import create_data
+from utils.providers import MockProvider, use_provider
+
+
+@dataclass
+class Person:
+    """A person."""
+
+    name: str
+    age: int
+
+
+def test_create_data_structured() -> None:
+    """Test that invalid arguments are re-asked on the cheap function-calling model."""
+    requests = []
+
+    def reply(prompt: str, params: dict) -> str:
+        requests.append(params)
+        return '{"name": "Ada"}' if len(requests) == 1 else '{"name": "Ada", "age": 36}'
+
+    with use_provider(MockProvider(reply=reply)):
+        data = anyio.run(
+            lambda: create_data("Ada Lovelace, 36 years old", Person, structured=True)
+        )
+
+    assert data == {"name": "Ada", "age": 36}
+    assert len(requests) == 2
+    assert {params["model"] for params in requests} == {"gpt-3.5-turbo-0613"}
+    assert requests[0]["function_call"] == {"name": "Person"}
+
+
+def test_create_data_default_is_unstructured() -> None:
+    """Test that create_data keeps the completion prompt unless structured output is asked for."""
+    requests = []
+
+    def reply(prompt: str, params: dict) -> str:
+        requests.append(params)
+        return '"name": "Ada", "age": 36}'
+
+    with use_provider(MockProvider(reply=reply)):
+        data = anyio.run(create_data, "Ada Lovelace, 36 years old", Person)
+
+    assert data == {"name": "Ada", "age": 36}
+    assert len(requests) == 1
+    assert "function_call" not in requests[0]
@@ -0,0 +1,38 @@
+"""Test running output parsers in utils.executor_tools."""
+
+import json
+import os
+
+import anyio
+
+from utils.executor_tools import run_parser, shutdown_parse_pool
+from utils.prompt_tools import prompt_map
+from utils.providers import MockProvider, use_provider
+
+
+def test_run_parser_in_pool() -> None:
+    """Test that parsers run inline by default and in a worker process on request."""
+    try:
+        assert anyio.run(run_parser, os.getpid) == os.getpid()
+        assert anyio.run(lambda: run_parser(os.getpid, in_pool=True)) != os.getpid()
+        assert anyio.run(lambda: run_parser(json.loads, '{"a": 1}', in_pool=True)) == {"a": 1}
+    finally:
+        shutdown_parse_pool()
+
+
+def test_prompt_map_parser(monkeypatch) -> None:
+    """Test that prompt_map applies the parser in the pool when AISMT_PARSE_POOL is set."""
+    monkeypatch.setenv("AISMT_PARSE_POOL", "1")
+
+    def reply(prompt: str, params: dict) -> str:
+        return json.dumps({"item": prompt.split()[-1]})
+
+    try:
+        with use_provider(MockProvider(reply=reply)):
+            parsed = anyio.run(
+                lambda: prompt_map(["a", "b"], "Say", prompts_per_request=1, parser=json.loads)
+            )
+    finally:
+        shutdown_parse_pool()
+
+    assert parsed == [{"item": "a"}, {"item": "b"}]
@@ -0,0 +1,48 @@
+"""Test local filename generation in utils.file_tools."""
+
+import anyio
+
+from utils.file_tools import generate_filename, keyword_slug, unique_filename
+from utils.providers import MockProvider, use_provider
+
+
+def test_keyword_slug() -> None:
+    """Test that the slug keeps key phrases in rank order within the limits."""
+    text = "Write a Python function that parses invoice PDF files and extracts line items"
+
+    assert keyword_slug(text) == "parses_invoice_pdf_extracts_line"
+    assert keyword_slug(text) == keyword_slug(text)
+    assert keyword_slug("Invoice parser; invoice parser! CSV export", max_words=3) == "invoice_parser_csv"
+    assert len(keyword_slug(text, max_chars=20)) <= 20
+    assert keyword_slug("the and of") == ""
+
+
+def test_unique_filename(tmp_path) -> None:
+    """Test that taken names get a numeric suffix before the extension."""
+    path = f"{tmp_path}/"
+    assert unique_filename("notes.txt", path) == "notes.txt"
+
+    (tmp_path / "notes.txt").touch()
+    (tmp_path / "notes_2.txt").touch()
+    (tmp_path / "README").touch()
+    assert unique_filename("notes.txt", path) == "notes_3.txt"
+    assert unique_filename("README", path) == "README_2"
+
+
+def test_generate_filename_without_llm() -> None:
+    """Test that filenames come from the content unless the LLM is asked for one."""
+    sent = []
+
+    def reply(prompt: str, params: dict) -> str:
+        sent.append(prompt)
+        return "llm_chosen_name"
+
+    with use_provider(MockProvider(reply=reply)):
+        local = anyio.run(lambda: generate_filename("Quarterly sales report for Europe", extension="md"))
+        empty = anyio.run(lambda: generate_filename("the and of", prefix="draft"))
+        llm = anyio.run(lambda: generate_filename("Quarterly sales report", use_llm=True))
+
+    assert local == "quarterly_sales_report_europe.md"
+    assert empty.startswith("draft_file_") and empty.endswith(".txt")
+    assert llm == "llm_chosen_name.txt"
+    assert len(sent) == 1
@@ -0,0 +1,53 @@
+"""Test resuming prompt_* jobs from a PromptJournal."""
+
+import anyio
+
+from utils.journal_tools import PromptJournal
+from utils.prompt_tools import prompt_map
+from utils.providers import MockProvider, use_provider
+
+
+def test_journal_round_trip(tmp_path) -> None:
+    """Test that a reopened journal skips answered keys and retries failed ones."""
+    path = tmp_path / "journal.jsonl"
+    with PromptJournal(str(path), fsync_every=2) as journal:
+        journal.record((0, "a"), "first")
+        journal.record_failure((1, "b"), TimeoutError("slow"))
+        journal.record((2, "c"), "third")
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": [3, "d"], "resp')
+
+    reopened = PromptJournal(str(path))
+    assert (0, "a") in reopened and [2, "c"] in reopened
+    assert (1, "b") not in reopened
+    assert reopened.failures == {'[1, "b"]': "TimeoutError: slow"}
+    assert len(reopened) == 2
+
+
+def test_prompt_map_resumes_from_journal(tmp_path) -> None:
+    """Test that a rerun prompt_map only sends the items missing from its journal."""
+    path = str(tmp_path / "journal.jsonl")
+    sent = []
+    failing = {"boom"}
+
+    def reply(prompt: str, params: dict) -> str:
+        sent.append(prompt.strip())
+        if any(word in prompt for word in failing):
+            raise RuntimeError("boom")
+        return prompt.strip().upper()
+
+    items = ["one", "boom", "three"]
+    with use_provider(MockProvider(reply=reply)):
+        first = anyio.run(
+            lambda: prompt_map(items, "Say", prompts_per_request=1, journal=path)
+        )
+        sent.clear()
+        failing.clear()
+        second = anyio.run(
+            lambda: prompt_map(items, "Say", prompts_per_request=1, journal=path)
+        )
+
+    assert first == ["SAY  ONE", None, "SAY  THREE"]
+    assert second == ["SAY  ONE", "SAY  BOOM", "SAY  THREE"]
+    assert sent == ["Say  boom"]
@@ -0,0 +1,61 @@
+"""Test the LLM call scheduler."""
+
+import asyncio
+
+import anyio
+
+from utils.llm_scheduler import LLMScheduler, Priority
+
+
+async def admit_in_order(scheduler: LLMScheduler, requests: list, pause: float = 0.0) -> list:
+    """Queue ``(caller, priority)`` requests behind a held slot and record admissions."""
+    admitted = []
+
+    async def call(caller: str, priority: Priority) -> None:
+        async with scheduler.slot(priority, caller):
+            admitted.append(caller)
+
+    await scheduler.acquire()
+    tasks = []
+    for caller, priority in requests:
+        tasks.append(asyncio.ensure_future(call(caller, priority)))
+        await asyncio.sleep(pause)
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return admitted
+
+
+def test_round_robin_between_callers() -> None:
+    """Test that one caller's fan-out does not crowd out another caller."""
+    scheduler = LLMScheduler(max_concurrency=1, aging=0)
+    requests = [("a", Priority.BULK)] * 3 + [("b", Priority.BULK)] * 2
+    assert anyio.run(admit_in_order, scheduler, requests) == ["a", "b", "a", "b", "a"]
+
+
+def test_priority_and_aging() -> None:
+    """Test that interactive calls go first unless bulk calls have aged."""
+    requests = [("bulk", Priority.BULK), ("interactive", Priority.INTERACTIVE)]
+    fresh = LLMScheduler(max_concurrency=1, aging=60)
+    assert anyio.run(admit_in_order, fresh, requests) == ["interactive", "bulk"]
+
+    aged = LLMScheduler(max_concurrency=1, aging=0.01)
+    assert anyio.run(admit_in_order, aged, requests, 0.05) == ["bulk", "interactive"]
+
+
+def test_cancelled_waiter_frees_queue() -> None:
+    """Test that a waiter cancelled in the queue does not hold back later calls."""
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def run() -> dict:
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire(caller="gone"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.wait_for(scheduler.acquire(), timeout=1)
+        scheduler.release()
+        return scheduler.stats()
+
+    assert anyio.run(run)["running"] == 0
@@ -0,0 +1,64 @@
+"""Test model routing in utils.models."""
+
+from utils import models
+from utils.models import ModelRouter
+
+
+class StatusError(Exception):
+    """An API error carrying an HTTP status code."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class Clock:
+    """A settable stand-in for ``time.monotonic``."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fail(router: ModelRouter, model: str, status_code: int) -> None:
+    router.end(model, router.begin(model), StatusError(status_code))
+
+
+def test_pick_rotates_between_ties() -> None:
+    """Test that idle models are picked round-robin and busy ones are avoided."""
+    router = ModelRouter(pools={})
+
+    assert sorted(router.pick(["a", "b", "c"]) for _ in range(3)) == ["a", "b", "c"]
+
+    router.begin("a")
+    assert {router.pick(["a", "b"]) for _ in range(4)} == {"b"}
+
+    router.set_weight("a", 4)
+    router.begin("b")
+    assert router.pick(["a", "b"]) == "a"
+
+
+def test_circuit_breaker(monkeypatch) -> None:
+    """Test that repeated 429/5xx responses eject a model until the cooldown ends."""
+    clock = Clock()
+    monkeypatch.setattr(models.time, "monotonic", clock)
+    router = ModelRouter(pools={}, failure_threshold=2, cooldown=60)
+
+    fail(router, "a", 400)
+    fail(router, "a", 429)
+    assert "a" in {router.pick(["a", "b"]) for _ in range(4)}
+
+    fail(router, "a", 503)
+    assert {router.pick(["a", "b"]) for _ in range(4)} == {"b"}
+    assert router.stats()["a"]["healthy"] is False
+    # With every model ejected the pick still goes through
+    assert router.pick(["a"]) == "a"
+
+    clock.now += 61
+    assert "a" in {router.pick(["a", "b"]) for _ in range(4)}
+
+    # Half-open: one more failure ejects it again
+    fail(router, "a", 500)
+    assert {router.pick(["a", "b"]) for _ in range(4)} == {"b"}
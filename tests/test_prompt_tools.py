@@ -0,0 +1,175 @@
+"""Test the prompt_tools scheduling helpers."""
+
+import asyncio
+import re
+
+import anyio
+import pytest
+
+from utils.prompt_tools import (
+    Verifiers,
+    prompt_filter,
+    prompt_matrix,
+    prompt_matrix_as_completed,
+    prompt_reduce,
+    sliding_window,
+    tree_reduce,
+)
+from utils.providers import MockProvider, use_provider
+
+
+async def slow_source(count: int):
+    """Yield items with a pause so a pull is in flight when the window closes."""
+    for item in range(count):
+        await asyncio.sleep(0.01)
+        yield item
+
+
+def test_sliding_window_failing_item() -> None:
+    """Test that an item's error reaches the caller while the source is suspended."""
+
+    async def fail_on_one(item: int) -> int:
+        if item == 1:
+            raise KeyError(item)
+        await asyncio.sleep(0.1)
+        return item
+
+    async def run() -> None:
+        async for _ in sliding_window(fail_on_one, slow_source(10), max_in_flight=4):
+            pass
+
+    with pytest.raises(KeyError):
+        anyio.run(run)
+
+
+def test_sliding_window_early_break() -> None:
+    """Test that breaking out of the window closes a suspended source cleanly."""
+
+    async def double(item: int) -> int:
+        return item * 2
+
+    async def run() -> list:
+        results = []
+        window = sliding_window(double, slow_source(10), max_in_flight=4)
+        async for _, result in window:
+            results.append(result)
+            if len(results) == 2:
+                break
+        await window.aclose()
+        return results
+
+    assert anyio.run(run) == [0, 2]
+
+
+def test_prompt_filter_reasks_malformed_answers() -> None:
+    """Test that a malformed packed answer is re-asked with a different prompt."""
+    prompts = []
+
+    def reply(prompt: str, params: dict) -> str:
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            return "Sure, here you go!"
+        items = re.findall(r"^(\d+)\. (.*)$", prompt, re.MULTILINE)
+        return " ".join(f"{number}:{'T' if 'good' in item else 'F'}" for number, item in items)
+
+    items = ["good a", "bad b", "good c", "bad d"]
+    with use_provider(MockProvider(reply=reply)):
+        kept = anyio.run(lambda: prompt_filter("Is it good?", items, items_per_request=4))
+
+    assert kept == ["good a", "good c"]
+    assert len(set(prompts)) == len(prompts) == 3
+    assert not any("perfect_bool" in prompt for prompt in prompts)
+
+
+def test_prompt_matrix_repeated_prompts() -> None:
+    """Test that repeated matrix prompts are asked once and fill every cell they appear in."""
+    prompts = []
+
+    def reply(prompt: str, params: dict) -> str:
+        prompts.append(prompt)
+        return f"re: {prompt}"
+
+    async def cells() -> list:
+        return [
+            cell
+            async for cell in prompt_matrix_as_completed(
+                ["x1", "x2", "x1"], ["y1", "y2"], "Base", prompts_per_request=1
+            )
+        ]
+
+    with use_provider(MockProvider(reply=reply)):
+        grid = anyio.run(
+            lambda: prompt_matrix(
+                ["x1", "x2", "x1"], ["y1", "y2"], "Base", prompts_per_request=1
+            )
+        )
+        assert sorted(prompts) == ["Base x1 y1", "Base x1 y2", "Base x2 y1", "Base x2 y2"]
+        streamed = anyio.run(cells)
+
+    assert grid == [
+        "re: Base x1 y1",
+        "re: Base x1 y2",
+        "re: Base x2 y1",
+        "re: Base x2 y2",
+        "re: Base x1 y1",
+        "re: Base x1 y2",
+    ]
+    assert sorted(streamed) == sorted(
+        {(x, y, f"re: Base {x} {y}") for x in ("x1", "x2") for y in ("y1", "y2")}
+    )
+
+
+def test_tree_reduce() -> None:
+    """Test that tree_reduce folds every item exactly once, and None for no items."""
+    groups = []
+
+    async def combine(group: list) -> int:
+        groups.append(len(group))
+        return sum(group)
+
+    assert anyio.run(lambda: tree_reduce(range(10), combine, fan_in=3)) == 45
+    assert max(groups) <= 3
+    assert anyio.run(lambda: tree_reduce([], combine)) is None
+    with pytest.raises(ValueError):
+        anyio.run(lambda: tree_reduce([1, 2], combine, fan_in=1))
+
+
+def test_prompt_reduce() -> None:
+    """Test prompt_reduce with no reducer, with a reducer and with an LLM combine step."""
+
+    def reply(prompt: str, params: dict) -> str:
+        if prompt.startswith("Merge"):
+            return "merged " + " ".join(sorted(re.findall(r"re:\w", prompt)))
+        return "re:" + prompt.split()[-1]
+
+    with use_provider(MockProvider(reply=reply)):
+        plain = anyio.run(lambda: prompt_reduce("Say", ["a", "b", "c"]))
+        reduced = anyio.run(lambda: prompt_reduce("Say", ["a", "b", "c"], reducer=sorted))
+        combined = anyio.run(
+            lambda: prompt_reduce("Say", ["a", "b", "c"], combine_prompt="Merge", fan_in=3)
+        )
+
+    assert plain == ["re:a", "re:b", "re:c"]
+    assert reduced == sorted(plain)
+    assert combined == ["merged re:a re:b re:c"]
+
+
+def test_verifiers_solve_stops_early() -> None:
+    """Test that solve stops once enough candidates pass and gives up after max_candidates."""
+
+    def reply(prompt: str, params: dict) -> str:
+        if Verifiers.verify_prompt in prompt:
+            return "1:T" if "good" in prompt else "1:F"
+        if "identify the best solution" in prompt:
+            return "best"
+        return "good idea" if "easy" in prompt else "bad idea"
+
+    verifier = Verifiers()
+    with use_provider(MockProvider(reply=reply)):
+        best = anyio.run(verifier.solve, "easy problem")
+        assert best == "best"
+        assert verifier.last_run["candidates"] == 4
+        assert verifier.last_run["passed"] >= 2
+
+        assert anyio.run(lambda: verifier.solve("hard problem", max_candidates=3)) is None
+        assert verifier.last_run == {"candidates": 3, "checked": 3, "passed": 0}
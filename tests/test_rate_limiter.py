@@ -0,0 +1,54 @@
+"""Test the per-model token buckets in utils.rate_limiter."""
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import ModelRateLimiter, estimate_request_tokens
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable ``time.monotonic`` for the limiter."""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_reserve_waits_for_refill(clock) -> None:
+    """Test that spending past the token budget waits for the refill."""
+    limiter = ModelRateLimiter({"m": (60, 6000)})
+
+    assert limiter.reserve("m", 6000) == 0
+    assert limiter.reserve("m", 100) == pytest.approx(1.0)
+    clock[0] += 2
+    assert limiter.reserve("m", 100) == 0
+
+
+def test_headers_sync_buckets(clock) -> None:
+    """Test that x-ratelimit-* headers correct the limit and remaining quota."""
+    limiter = ModelRateLimiter({"m": (60, 6000)})
+    limiter.reserve("m", 10)
+
+    limiter.update_from_headers(
+        "m",
+        {
+            "x-ratelimit-limit-tokens": "12000",
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-remaining-requests": "not a number",
+        },
+    )
+    requests, tokens = limiter._buckets["m"]
+    assert tokens.capacity == 12000
+    assert requests.capacity == 60
+    # 200 tokens a second at the new limit
+    assert limiter.reserve("m", 100) == pytest.approx(0.5)
+
+    limiter.on_rate_limited("m")
+    assert limiter.reserve("m", 1) > 0
+
+
+def test_estimate_request_tokens() -> None:
+    """Test that every packed prompt reserves its own completion budget."""
+    single = estimate_request_tokens({"model": "m", "prompt": "", "max_tokens": 50})
+    packed = estimate_request_tokens({"model": "m", "prompt": ["", ""], "max_tokens": 50})
+    assert (single, packed) == (50, 100)
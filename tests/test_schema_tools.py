@@ -0,0 +1,50 @@
+"""Test the compiled prompt schema registry in utils.schema_tools."""
+
+from dataclasses import dataclass
+
+from utils.schema_tools import PromptSchemaRegistry, function_spec
+
+
+@dataclass
+class Invoice:
+    """An invoice sent to a customer.
+
+    The rest of this docstring is detail that prompts do not need.
+    """
+
+    number: str
+    total: float
+
+    def overdue(self, days: int) -> bool:
+        """Whether the invoice is more than ``days`` late."""
+        return days > 30
+
+
+def test_registry_compiles_once() -> None:
+    """Test that a target is compiled once and bound methods share their function's entry."""
+    registry = PromptSchemaRegistry()
+
+    compiled = registry.get(Invoice)
+    assert registry.get(Invoice) is compiled
+    assert compiled.signature == "class Invoice(number: str, total: float)"
+    assert compiled.summary == "An invoice sent to a customer."
+    assert compiled.render() == f"{compiled.signature}\n    {compiled.summary}"
+    assert set(compiled.schema["properties"]) == {"number", "total"}
+    assert compiled.tokens < compiled.source_tokens
+
+    invoice = Invoice("A-1", 10.0)
+    assert registry.get(invoice.overdue) is registry.get(Invoice("A-2", 5.0).overdue)
+    assert registry.stats()["entries"] == 2
+    assert (registry.stats()["hits"], registry.stats()["misses"]) == (2, 2)
+
+    registry.clear()
+    assert registry.stats()["entries"] == 0
+
+
+def test_function_spec_uses_compiled_schema() -> None:
+    """Test that the function spec is named after the target and takes its fields."""
+    spec = function_spec(Invoice)
+
+    assert spec["name"] == "Invoice"
+    assert spec["description"] == "An invoice sent to a customer."
+    assert spec["parameters"]["required"] == ["number", "total"]
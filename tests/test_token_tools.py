@@ -0,0 +1,32 @@
+"""Test token counting and context window fitting in utils.token_tools."""
+
+import pytest
+
+from utils.token_tools import count_message_tokens, fit_messages
+
+MODEL = "gpt-3.5-turbo-0613"
+
+
+def test_fit_messages_keeps_system_and_last() -> None:
+    """Test that the oldest middle messages are dropped to fit the window."""
+    messages = [{"role": "system", "content": "Be brief."}]
+    messages += [{"role": "user", "content": "word " * 800} for _ in range(5)]
+    messages.append({"role": "user", "content": "Last question?"})
+
+    fitted = fit_messages(messages, MODEL, reserve=500)
+
+    assert fitted[0] == messages[0]
+    assert fitted[-1] == messages[-1]
+    assert len(fitted) < len(messages)
+    assert count_message_tokens(fitted, MODEL) <= 4_096 - 500
+
+
+def test_fit_messages_reserve_too_large() -> None:
+    """Test that a reserve that fills the window raises instead of sending empty messages."""
+    messages = [
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": "word " * 100},
+    ]
+
+    with pytest.raises(ValueError, match="max_tokens"):
+        fit_messages(messages, MODEL, reserve=5_000)
@@ -0,0 +1,19 @@
+"""Test TypedPrompt output."""
+
+from pathlib import Path
+
+from typetemp.template.typed_prompt import TypedPrompt
+from utils.providers import MockProvider, use_provider
+
+
+def test_stream_writes_same_output(tmp_path: Path) -> None:
+    """Test that streaming and non-streaming calls write the completion to ``to``."""
+    written = {}
+    with use_provider(MockProvider(reply=lambda prompt, params: f"Hi {prompt}!")):
+        for stream in (False, True):
+            to = tmp_path / f"{stream}.txt"
+            prompt = TypedPrompt(source="{{ name }}", to=str(to))
+            assert prompt(name="Ada", stream=stream) == "Hi Ada!"
+            written[stream] = to.read_text()
+
+    assert written[False] == written[True] == "Hi Ada!"
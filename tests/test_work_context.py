@@ -0,0 +1,38 @@
+"""Test lchop workflow dry runs."""
+
+from pathlib import Path
+
+import anyio
+
+from lchop.context.task_context import register_task
+from lchop.context.work_context import load_workflow
+from utils.complete import acreate
+
+
+def test_dry_run_writes_no_files(tmp_path: Path) -> None:
+    """Test that a dry run estimates side-effect-free tasks and skips the rest."""
+    target = tmp_path / "out.txt"
+
+    @register_task(side_effect_free=True)
+    async def dry_run_summarize(work_ctx, topic="", **kwargs):
+        return {"success": True, "results": await acreate(prompt=f"Summarize {topic}", max_tokens=50)}
+
+    @register_task
+    async def dry_run_write(work_ctx, path="", **kwargs):
+        Path(path).write_text(await acreate(prompt="Write a poem", max_tokens=50))
+        return {"success": True, "results": path}
+
+    workflow = f"""
+tasks:
+  - name: dry_run_summarize
+    kwargs:
+      topic: dry runs
+  - name: dry_run_write
+    kwargs:
+      path: {target}
+"""
+    report = anyio.run(lambda: load_workflow(yaml_string=workflow, dry_run=True))
+
+    assert not target.exists()
+    assert report.skipped == ["dry_run_write"]
+    assert report.total.requests == 1